@@ -0,0 +1,82 @@
+"""CRDT 文档整批合并的性能测试
+
+文档合并和写入房间的耗时都应随提交的操作数增长，而与房间中已有的记录数无关
+（写入房间时按开销ID索引定位，不扫描当天的开销列表）。
+
+用法（在仓库根目录）：python -m benchmarks.bench_crdt
+"""
+import random
+import time
+
+from travel_core.crdt import DocumentReplica
+from travel_core.store import RoomState
+
+
+def make_room(num_expenses, num_days=10, seed=0):
+    """生成有 num_expenses 笔开销的房间，并预先构建好文档"""
+    rng = random.Random(seed)
+    room = RoomState('BENCH')
+    for index in range(4):
+        room.add_traveler(f"旅行者{index + 1}", f"t{index}", editor="bench")
+    travelers = [f"t{index}" for index in range(4)]
+    for index in range(num_expenses):
+        day = str(index % num_days + 1)
+        room.add_expense(day, {
+            'id': f"e{index:07d}",
+            'payer': rng.choice(travelers),
+            'item': "餐饮",
+            'category': "餐饮",
+            'amount': float(rng.randint(1, 500)),
+            'sharers': travelers,
+            'edit_time': 1.0,
+            'editor': 't0',
+        }, editor="bench")
+    room.document
+    return room
+
+
+def make_batch(room, num_ops, seed=1):
+    """客户端离线产生的一批操作：新增开销和修改已有开销各占一半"""
+    rng = random.Random(seed)
+    replica = DocumentReplica('client', room.document.copy())
+    existing = [f"e{index:07d}" for index in range(len(room.document))]
+    while replica.pending_count < num_ops:
+        if rng.random() < 0.5 and existing:
+            replica.update('expenses', rng.choice(existing), {'amount': float(rng.randint(1, 500))})
+        else:
+            record_id = f"n{replica.pending_count:07d}"
+            replica.add('expenses', '1', {
+                'id': record_id, 'payer': 't0', 'item': "打车", 'category': "交通",
+                'amount': 20.0, 'sharers': ['t0', 't1'],
+            })
+    return replica.take_outbox()
+
+
+def bench(num_expenses, num_ops, repeat=3):
+    best_document = best_room = float('inf')
+    for attempt in range(repeat):
+        room = make_room(num_expenses)
+        batch = make_batch(room, num_ops, seed=attempt)
+
+        document = room.document.copy()
+        start = time.perf_counter()
+        document.merge(batch)
+        best_document = min(best_document, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        room.merge_document_ops(batch, editor="bench")
+        best_room = min(best_room, time.perf_counter() - start)
+    return best_document, best_room
+
+
+def main():
+    print(f"{'房间开销数':>10} {'操作数':>8} {'文档合并(ms)':>12} {'写入房间(ms)':>12} {'每条操作(µs)':>12}")
+    for num_expenses in (1_000, 10_000, 50_000):
+        for num_ops in (100, 1_000, 10_000):
+            document_time, room_time = bench(num_expenses, num_ops)
+            print(f"{num_expenses:>10} {num_ops:>8} {document_time * 1000:>12.2f} "
+                  f"{room_time * 1000:>12.2f} {room_time / num_ops * 1e6:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""转账方案算法的性能测试
+
+用法（在仓库根目录）：python -m benchmarks.bench_settlement
+"""
+import random
+import time
+
+from travel_core.settlement import EXACT_LIMIT, plan_transfers
+
+
+def random_balances(num_travelers, seed=0):
+    """生成总和为零的随机余额（单位：分）"""
+    rng = random.Random(seed)
+    balances = {f"旅行者{i + 1}": rng.randint(-50000, 50000) for i in range(num_travelers - 1)}
+    balances[f"旅行者{num_travelers}"] = -sum(balances.values())
+    return {traveler: amount for traveler, amount in balances.items() if amount}
+
+
+def bench(num_travelers, exact_limit=EXACT_LIMIT, repeat=5):
+    balances = random_balances(num_travelers)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        transfers = plan_transfers(balances, exact_limit=exact_limit)
+        best = min(best, time.perf_counter() - start)
+
+    # 校验：转账后每人余额归零
+    settled = dict(balances)
+    for debtor, creditor, amount in transfers:
+        settled[debtor] += amount
+        settled[creditor] -= amount
+    assert not any(settled.values())
+    return best, len(transfers)
+
+
+def main():
+    print(f"{'人数':>6} {'算法':>6} {'耗时(ms)':>10} {'转账笔数':>8}")
+    for num_travelers in (4, 8, EXACT_LIMIT, 12, 14):
+        elapsed, count = bench(num_travelers, exact_limit=num_travelers)
+        print(f"{num_travelers:>6} {'精确':>6} {elapsed * 1000:>10.2f} {count:>8}")
+    for num_travelers in (20, 50, 100, 200, 500):
+        elapsed, count = bench(num_travelers)
+        print(f"{num_travelers:>6} {'贪心':>6} {elapsed * 1000:>10.2f} {count:>8}")
+
+
+if __name__ == '__main__':
+    main()
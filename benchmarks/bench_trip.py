@@ -0,0 +1,158 @@
+"""页面重新运行路径上各部分的性能测试
+
+分别测量结算计算、人员改名、导入导出，以及用 streamlit.testing.v1.AppTest
+无界面运行一次完整页面脚本，数据规模为 10、1000、100000 笔开销。
+
+用法（在仓库根目录）：python -m benchmarks.bench_trip [开销数 ...]
+"""
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from travel_core import SettlementEngine, encode_export, import_trip
+from travel_core.storage import SQLiteStorage
+from travel_core.store import RoomRegistry
+
+from .synthetic import make_room
+
+SIZES = (10, 1_000, 100_000)
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "travel.py")
+
+
+def best_of(run, repeat=3):
+    """多次运行取最短耗时（秒），返回 (耗时, 最后一次的返回值)"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def trip_options(num_expenses):
+    return {'num_travelers': 8, 'num_days': 14, 'items_per_day': 6, 'num_expenses': num_expenses}
+
+
+def settlement_rebuild(room):
+    """工作负载：整体重建账本并计算汇总与转账，返回转账方案"""
+    def rebuild():
+        engine = SettlementEngine()
+        engine.rebuild(room.expenses, room.data_version['number'])
+        engine.payment_summary()
+        engine.traveler_balances()
+        return engine.transfers()
+    return rebuild
+
+
+def settlement_incremental(room):
+    """工作负载：新增一笔开销后增量更新账本并重新计算转账（每次都会加一笔）
+
+    返回 (工作负载, 结算引擎)。
+    """
+    engine = SettlementEngine()
+    engine.rebuild(room.expenses, room.data_version['number'])
+    engine.transfers()
+
+    def incremental():
+        version = room.data_version['number']
+        room.add_expense('1', {'payer': 't0000', 'item': "打车", 'category': "交通", 'amount': 30.0,
+                               'sharers': ['t0000', 't0001'], 'id': f"bench{version}",
+                               'editor': 't0000', 'edit_time': time.time()}, editor="bench")
+        engine.apply(room.oplog.since(version))
+        return engine.transfers()
+    return incremental, engine
+
+
+def rename(room):
+    """工作负载：修改一次名字并生成按名字引用人员的导出字典（名字传播到所有记录），返回 (新名字, 字典)"""
+    counter = iter(range(1_000_000))
+
+    def run():
+        name = f"改名{next(counter)}"
+        room.rename_traveler('t0000', name, editor="bench")
+        return name, room.to_dict()
+    return run
+
+
+def import_payload(payload):
+    """从导出的字节流式导入（大规模数据的导出可能超过页面的上传大小上限，这里不做限制）"""
+    return import_trip(io.BytesIO(payload), max_bytes=sys.maxsize)
+
+
+def seed_app_db(path, sizes):
+    """把各规模的房间（房间ID为 BENCH<开销数>）写入 SQLite 文件，供页面脚本加载"""
+    registry = RoomRegistry(SQLiteStorage(path))
+    for num_expenses in sizes:
+        room = registry.get(f"BENCH{num_expenses}")
+        make_room(room=room, **trip_options(num_expenses))
+        registry.flush(room)
+    registry.storage.close()
+
+
+def bench_settlement(room):
+    """结算：整体重建；之后新增一笔开销的增量更新"""
+    rebuild_time, _ = best_of(settlement_rebuild(room))
+    incremental_time, _ = best_of(settlement_incremental(room)[0])
+    return rebuild_time, incremental_time
+
+
+def bench_rename(room):
+    return best_of(rename(room))[0]
+
+
+def bench_import_export(room, fmt):
+    """导出为指定格式，再从导出的字节流式导入"""
+    export_time, payload = best_of(lambda: encode_export(room.to_dict(), fmt))
+    import_time, result = best_of(lambda: import_payload(payload))
+    assert result.expense_count == sum(len(expenses) for expenses in room.expenses.values())
+    return export_time, import_time, len(payload)
+
+
+def bench_app(sizes):
+    """无界面运行页面脚本：首次运行（从 SQLite 加载房间、重建账本）与之后的重新运行"""
+    from streamlit.testing.v1 import AppTest
+
+    # 页面运行时的弃用提示等日志会淹没结果
+    logging.disable(logging.WARNING)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed_app_db(path, sizes)
+
+        os.environ["TRAVEL_DB_PATH"] = path
+        for num_expenses in sizes:
+            app = AppTest.from_file(APP_PATH, default_timeout=600)
+            app.session_state['room_id'] = f"BENCH{num_expenses}"
+            start = time.perf_counter()
+            app.run()
+            cold = time.perf_counter() - start
+            assert not app.exception, [error.value for error in app.exception]
+            warm, _ = best_of(app.run)
+            results[num_expenses] = (cold, warm)
+    return results
+
+
+def main(sizes=SIZES):
+    print(f"{'开销数':>8} {'结算重建(ms)':>12} {'结算增量(ms)':>12} {'改名(ms)':>10} "
+          f"{'JSON导出(ms)':>12} {'JSON导入(ms)':>12} {'压缩导出(ms)':>12} {'压缩导入(ms)':>12}")
+    for num_expenses in sizes:
+        room = make_room(**trip_options(num_expenses))
+        rebuild_time, incremental_time = bench_settlement(room)
+        rename_time = bench_rename(room)
+        json_export, json_import, _ = bench_import_export(room, 'json')
+        ttz_export, ttz_import, _ = bench_import_export(room, 'ttz')
+        print(f"{num_expenses:>8} {rebuild_time * 1000:>12.2f} {incremental_time * 1000:>12.2f} "
+              f"{rename_time * 1000:>10.2f} {json_export * 1000:>12.2f} {json_import * 1000:>12.2f} "
+              f"{ttz_export * 1000:>12.2f} {ttz_import * 1000:>12.2f}")
+
+    print()
+    print(f"{'开销数':>8} {'首次运行(ms)':>12} {'重新运行(ms)':>12}")
+    for num_expenses, (cold, warm) in bench_app(sizes).items():
+        print(f"{num_expenses:>8} {cold * 1000:>12.1f} {warm * 1000:>12.1f}")
+
+
+if __name__ == '__main__':
+    main(tuple(int(arg) for arg in sys.argv[1:]) or SIZES)
@@ -0,0 +1,200 @@
+"""多房间、多用户的负载测试（完全离线，单机运行）
+
+在一个进程中用 streamlit.testing.v1.AppTest 模拟 N 个房间、每个房间 M 个用户的会话，
+它们共用同一个房间注册表和 SQLite 文件，与同一台服务器上的多个浏览器会话相同。
+每个模拟用户随机执行添加开销、删除开销、切换日期和空闲刷新等操作，
+统计每次重新运行的延迟（p50 / p99）以及每个会话、每个房间占用的内存。
+
+AppTest 每次运行都会创建和销毁全局的 Runtime，不能在多个线程中同时运行，
+所以各会话按轮询的方式交替执行操作；后台工作线程（落盘、快照等）照常并发运行。
+
+用法（在仓库根目录）：
+    python -m benchmarks.load_test --rooms 10 --users 4 --steps 20 --expenses 200
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import tempfile
+import time
+
+from travel_core.storage import SQLiteStorage
+from travel_core.store import RoomRegistry
+
+from .bench_trip import APP_PATH
+from .synthetic import make_room
+
+# 操作 -> 权重
+ACTIONS = {
+    'add_expense': 35,
+    'delete_expense': 15,
+    'switch_day': 20,
+    'next_day': 10,
+    'idle': 20,
+}
+
+
+def rss_bytes():
+    """当前进程的常驻内存（字节，读取 /proc/self/statm）"""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def percentile(values, fraction):
+    """最近秩法的分位数"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class SimulatedUser:
+    """一个浏览器会话"""
+
+    def __init__(self, room_id, index, num_days, seed):
+        from streamlit.testing.v1 import AppTest
+
+        self.room_id = room_id
+        self.index = index
+        self.num_days = num_days
+        self.rng = random.Random(seed)
+        self.app = AppTest.from_file(APP_PATH, default_timeout=600)
+        self.app.session_state['room_id'] = room_id
+        self.errors = 0
+
+    def rerun(self, widget=None):
+        """执行一次重新运行，返回耗时（秒）"""
+        start = time.perf_counter()
+        if widget is None:
+            self.app.run()
+        else:
+            widget.run()
+        elapsed = time.perf_counter() - start
+        if self.app.exception:
+            self.errors += 1
+        return elapsed
+
+    def _expense_day(self):
+        return self.app.selectbox(key="expense_day_select_main").value
+
+    def step(self):
+        """随机执行一个操作，返回 (操作名, 耗时)"""
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        app = self.app
+        if action == 'delete_expense':
+            buttons = [button for button in app.button if (button.key or '').startswith("del_expense_")]
+            if not buttons:
+                action = 'add_expense'
+            else:
+                return action, self.rerun(self.rng.choice(buttons).click())
+        if action == 'add_expense':
+            suffix = f"day{self._expense_day()}"
+            app.text_input(key=f"expense_item_input_{suffix}").input(f"用户{self.index}的开销")
+            app.number_input(key=f"amount_input_{suffix}").set_value(float(self.rng.randint(1, 500)))
+            return action, self.rerun(app.button(key=f"confirm_expense_{suffix}").click())
+        if action == 'switch_day':
+            day = self.rng.randint(1, self.num_days)
+            return action, self.rerun(app.selectbox(key="expense_day_select_main").select(day))
+        if action == 'next_day':
+            key = "next_day_btn" if self.rng.random() < 0.7 else "prev_day_btn"
+            return action, self.rerun(app.button(key=key).click())
+        return action, self.rerun()
+
+
+def seed_rooms(path, num_rooms, num_expenses, num_days):
+    """预先把房间数据写入 SQLite，返回房间ID列表"""
+    registry = RoomRegistry(SQLiteStorage(path))
+    room_ids = []
+    for index in range(num_rooms):
+        room_id = f"LOAD{index:04d}"
+        room = registry.get(room_id)
+        make_room(room=room, num_days=num_days, num_expenses=num_expenses, seed=index)
+        registry.flush(room)
+        room_ids.append(room_id)
+    registry.storage.close()
+    return room_ids
+
+
+def run(num_rooms, num_users, steps, num_expenses, num_days=7, seed=0):
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "load.db")
+        os.environ["TRAVEL_DB_PATH"] = path
+        room_ids = seed_rooms(path, num_rooms, num_expenses, num_days)
+        # 预热：首次运行会导入模块、编译页面脚本、创建注册表，不计入房间内存
+        SimulatedUser("WARMUP", 0, num_days, seed=seed).rerun()
+        gc.collect()
+
+        # 每个房间的第一个用户：加载房间 + 一个会话
+        baseline = rss_bytes()
+        users = []
+        for room_index, room_id in enumerate(room_ids):
+            user = SimulatedUser(room_id, 0, num_days, seed=seed * 1_000_003 + room_index)
+            user.rerun()
+            users.append(user)
+        gc.collect()
+        with_rooms = rss_bytes()
+
+        # 其余用户：只增加会话
+        for user_index in range(1, num_users):
+            for room_index, room_id in enumerate(room_ids):
+                user = SimulatedUser(room_id, user_index, num_days,
+                                     seed=seed * 1_000_003 + user_index * num_rooms + room_index)
+                user.rerun()
+                users.append(user)
+        gc.collect()
+        with_sessions = rss_bytes()
+
+        extra_sessions = num_rooms * (num_users - 1)
+        per_session = (with_sessions - with_rooms) / extra_sessions if extra_sessions else None
+        per_room = (with_rooms - baseline) / num_rooms - (per_session or 0)
+
+        latencies = {action: [] for action in ACTIONS}
+        start = time.perf_counter()
+        for _ in range(steps):
+            for user in users:
+                action, elapsed = user.step()
+                latencies[action].append(elapsed)
+        wall = time.perf_counter() - start
+
+        return {
+            'latencies': latencies,
+            'wall': wall,
+            'sessions': len(users),
+            'errors': sum(user.errors for user in users),
+            'per_session': per_session,
+            'per_room': per_room,
+            'rss': with_sessions,
+        }
+
+
+def report(result):
+    everything = [value for values in result['latencies'].values() for value in values]
+    print(f"会话数 {result['sessions']}，操作数 {len(everything)}，耗时 {result['wall']:.1f}s，"
+          f"出错 {result['errors']} 次")
+    print(f"{'操作':<16} {'次数':>6} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for action, values in list(result['latencies'].items()) + [('全部', everything)]:
+        if values:
+            print(f"{action:<16} {len(values):>6} {percentile(values, 0.5) * 1000:>10.1f} "
+                  f"{percentile(values, 0.99) * 1000:>10.1f}")
+    mib = 1024 * 1024
+    if result['per_session'] is not None:
+        print(f"每个会话内存 {result['per_session'] / mib:.2f} MiB")
+    print(f"每个房间内存 {result['per_room'] / mib:.2f} MiB（不含第一个会话）")
+    print(f"进程常驻内存 {result['rss'] / mib:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rooms', type=int, default=10, help="房间数 N")
+    parser.add_argument('--users', type=int, default=4, help="每个房间的用户数 M")
+    parser.add_argument('--steps', type=int, default=20, help="每个用户执行的操作数")
+    parser.add_argument('--expenses', type=int, default=200, help="每个房间预置的开销数")
+    parser.add_argument('--days', type=int, default=7, help="旅行天数")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    report(run(args.rooms, args.users, args.steps, args.expenses, args.days, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""合成旅行数据生成器
+
+生成的行程和开销与页面中 new_item / new_expense 的字段结构相同，
+人员按 ID 引用；同样的参数和随机种子总是得到同样的数据。
+"""
+import random
+
+from travel_core import oplog
+from travel_core.oplog import make_op
+from travel_core.store import RoomState
+
+CATEGORIES = ["餐饮", "交通", "住宿", "门票", "购物", "其他", "个人"]
+PROJECTS = ["参观故宫", "逛夜市", "爬长城", "博物馆", "海边散步", "温泉", "自由活动"]
+TRANSPORTS = ["地铁", "步行", "打车", "公交", "高铁"]
+
+
+def make_trip(num_travelers=4, num_days=7, items_per_day=4, num_expenses=100, seed=0):
+    """生成房间数据（empty_state() 的结构）"""
+    rng = random.Random(seed)
+    travelers = [
+        {'id': f"t{index:04d}", 'name': f"旅行者{index + 1}", 'removed': False}
+        for index in range(num_travelers)
+    ]
+    traveler_ids = [record['id'] for record in travelers]
+    edit_time = 1_700_000_000.0
+
+    itinerary = {}
+    for day in range(1, num_days + 1):
+        items = itinerary.setdefault(str(day), [])
+        for index in range(items_per_day):
+            start = 8 + index * 14 // max(items_per_day, 1)
+            items.append({
+                'time': f"{start:02d}:00-{start + 1:02d}:00",
+                'project': rng.choice(PROJECTS),
+                'transport': rng.choice(TRANSPORTS),
+                'location': f"地点{rng.randint(1, 500)}",
+                'participants': rng.sample(traveler_ids, rng.randint(1, num_travelers)),
+                'id': f"i{day:03d}{index:05d}",
+                'editor': rng.choice(traveler_ids),
+                'edit_time': edit_time,
+            })
+
+    expenses = {}
+    for index in range(num_expenses):
+        day = rng.randint(1, num_days)
+        category = rng.choice(CATEGORIES)
+        payer = rng.choice(traveler_ids)
+        expense = {
+            'payer': payer,
+            'item': f"{category}{index}",
+            'category': category,
+            'amount': rng.randint(100, 100_000) / 100,
+            'day': day,
+            'id': f"e{index:08d}",
+            'editor': payer,
+            'edit_time': edit_time + index,
+        }
+        if category != "个人":
+            expense['sharers'] = rng.sample(traveler_ids, rng.randint(1, num_travelers))
+        expenses.setdefault(str(day), []).append(expense)
+
+    return {
+        'travelers': travelers,
+        'itinerary': itinerary,
+        'expenses': expenses,
+        'total_days': num_days,
+    }
+
+
+def make_room(room_id="BENCH", room=None, **options):
+    """生成房间；传入 room 时把数据整体写入该房间（一条 REPLACE 操作）"""
+    room = room if room is not None else RoomState(room_id)
+    room.apply(make_op(oplog.REPLACE, state=make_trip(**options)), "bench")
+    return room
@@ -0,0 +1,110 @@
+"""pytest-benchmark 用例：页面重新运行路径上的各部分，数据规模为 10、1000、100000 笔开销
+
+工作负载与 bench_trip.py 共用（结算、人员改名、导入导出、AppTest 整页运行），
+结果可以保存下来，之后与基线比较，变慢超过阈值时失败：
+
+    python -m pytest benchmarks --benchmark-autosave
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:20%
+
+依赖见 requirements-dev.txt；只跑某个规模时加 -k n1000。
+"""
+import logging
+import os
+
+import pytest
+
+from travel_core import SettlementEngine, encode_export
+
+from benchmarks.bench_trip import (APP_PATH, SIZES, import_payload, rename, seed_app_db, settlement_incremental,
+                                   settlement_rebuild, trip_options)
+from benchmarks.synthetic import make_room
+
+pytest.importorskip('pytest_benchmark')
+
+
+def size_id(num_expenses):
+    # 用例 ID 只用 ASCII（pytest 会转义其他字符），例如 test_rename[n1000]
+    return f"n{num_expenses}"
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=size_id)
+def num_expenses(request):
+    return request.param
+
+
+@pytest.fixture(scope='module')
+def room(num_expenses):
+    """各用例共用的房间（用例不改变开销）"""
+    return make_room(**trip_options(num_expenses))
+
+
+def expense_count(room):
+    return sum(len(expenses) for expenses in room.expenses.values())
+
+
+def test_settlement_rebuild(benchmark, room):
+    transfers = benchmark(settlement_rebuild(room))
+    # 按转账方案付款后所有人结清
+    engine = SettlementEngine()
+    engine.rebuild(room.expenses, room.data_version['number'])
+    balances = {traveler: net for traveler, (_, net) in engine.traveler_balances().items()}
+    for payer, receiver, amount in transfers:
+        balances[payer] += amount
+        balances[receiver] -= amount
+    assert not any(balances.values())
+
+
+def test_settlement_incremental(benchmark, num_expenses):
+    """每轮都加一笔开销，使用单独的房间"""
+    room = make_room(**trip_options(num_expenses))
+    incremental, engine = settlement_incremental(room)
+    benchmark(incremental)
+    assert engine.expense_count == expense_count(room)
+
+
+def test_rename(benchmark, room):
+    name, exported = benchmark(rename(room))
+    assert name in exported['travelers']
+
+
+@pytest.mark.parametrize('fmt', ['json', 'ttz'])
+def test_export(benchmark, room, fmt):
+    payload = benchmark(encode_export, room.to_dict(), fmt)
+    assert payload
+
+
+@pytest.mark.parametrize('fmt', ['json', 'ttz'])
+def test_import(benchmark, room, fmt):
+    payload = encode_export(room.to_dict(), fmt)
+    result = benchmark(import_payload, payload)
+    assert result.errors == []
+    assert result.expense_count == expense_count(room)
+
+
+@pytest.fixture(scope='module')
+def app_db(tmp_path_factory):
+    """各规模的房间预先写入同一个 SQLite 文件（页面的房间注册表在进程内只创建一次）"""
+    path = str(tmp_path_factory.mktemp("bench") / "bench.db")
+    seed_app_db(path, SIZES)
+    previous = os.environ.get("TRAVEL_DB_PATH")
+    os.environ["TRAVEL_DB_PATH"] = path
+    # 页面运行时的弃用提示等日志会淹没结果
+    logging.disable(logging.WARNING)
+    yield path
+    logging.disable(logging.NOTSET)
+    if previous is None:
+        os.environ.pop("TRAVEL_DB_PATH", None)
+    else:
+        os.environ["TRAVEL_DB_PATH"] = previous
+
+
+def test_app_rerun(benchmark, app_db, num_expenses):
+    """首次运行（加载房间、重建账本）之后，整页重新运行一次的耗时"""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=600)
+    app.session_state['room_id'] = f"BENCH{num_expenses}"
+    app.run()
+    assert not app.exception, [error.value for error in app.exception]
+    benchmark.pedantic(app.run, rounds=3, iterations=1)
+    assert not app.exception, [error.value for error in app.exception]
@@ -0,0 +1,180 @@
+"""CRDT 文档（crdt.py）与 RoomState.merge_document_ops"""
+import itertools
+import random
+
+import pytest
+
+from travel_core.crdt import DocumentReplica, RoomDocument
+from travel_core.storage import SQLiteStorage
+from travel_core.store import RoomRegistry, RoomState
+
+
+def expense(record_id, amount=10.0, payer='t0'):
+    return {'id': record_id, 'payer': payer, 'item': "午餐", 'category': "餐饮",
+            'amount': amount, 'day': 1, 'sharers': ['t0', 't1']}
+
+
+def contents(document):
+    return {kind: document.records(kind) for kind in ('itinerary', 'expenses')}
+
+
+def make_room():
+    room = RoomState('R')
+    room.add_traveler("甲", 't0', editor="甲")
+    room.add_traveler("乙", 't1', editor="甲")
+    room.add_expense('1', dict(expense('e0'), editor='t0', edit_time=1.0), editor="甲")
+    return room
+
+
+def concurrent_batches(document):
+    """两个副本基于同一文档离线编辑：并发修改同一字段、各自新增、一方删除"""
+    alice = DocumentReplica('alice', document.copy())
+    bob = DocumentReplica('bob', document.copy())
+    alice.update('expenses', 'e0', {'amount': 20.0}, edit_time=5.0)
+    bob.update('expenses', 'e0', {'amount': 30.0, 'item': "晚餐"}, edit_time=6.0)
+    alice.add('expenses', '2', expense('a1'), edit_time=7.0)
+    bob.add('expenses', '1', expense('b1'), edit_time=7.0)
+    bob.remove('expenses', 'b1')
+    alice.remove('expenses', 'e0')
+    return alice.take_outbox(), bob.take_outbox()
+
+
+def test_merge_is_commutative():
+    base = make_room().document
+    alice_ops, bob_ops = concurrent_batches(base)
+    results = []
+    for order in itertools.permutations([alice_ops, bob_ops]):
+        document = base.copy()
+        for batch in order:
+            document.merge(batch)
+        results.append(contents(document))
+    # 操作按任意顺序交错到达
+    shuffled = alice_ops + bob_ops
+    random.Random(0).shuffle(shuffled)
+    document = base.copy()
+    document.merge(shuffled)
+    results.append(contents(document))
+    assert all(result == results[0] for result in results)
+
+
+def test_merge_is_idempotent():
+    base = make_room().document
+    alice_ops, bob_ops = concurrent_batches(base)
+    once = base.copy()
+    once.merge(alice_ops + bob_ops)
+    twice = base.copy()
+    twice.merge(alice_ops + bob_ops)
+    twice.merge(bob_ops)
+    twice.merge(alice_ops)
+    assert contents(once) == contents(twice)
+
+
+def test_concurrent_add_survives_remove_and_removed_record_stays_removed():
+    document = make_room().document
+    alice_ops, bob_ops = concurrent_batches(document)
+    document.merge(alice_ops + bob_ops)
+    ids = {record['id'] for record in document.records('expenses').get('2', [])}
+    assert ids == {'a1'}
+    assert ('expenses', 'e0') not in document
+    # 删除之后才到达的同一次添加不会让记录复活
+    document.merge([op for op in bob_ops if op['type'] != 'remove'])
+    assert ('expenses', 'b1') not in document
+
+
+def test_lww_tie_is_deterministic():
+    document = RoomDocument()
+    ops = [{'type': 'add', 'kind': 'expenses', 'id': 'x', 'day': '1'}]
+    for replica in ('a', 'b'):
+        ops.append({'type': 'set', 'kind': 'expenses', 'id': 'x', 'field': 'amount',
+                    'value': replica, 'stamp': [1.0, replica, 1]})
+    document.merge(ops)
+    reversed_document = RoomDocument()
+    reversed_document.merge(list(reversed(ops)))
+    assert document.record('expenses', 'x')['amount'] == 'b'
+    assert reversed_document.record('expenses', 'x') == document.record('expenses', 'x')
+
+
+def test_room_merge_writes_records_and_is_idempotent():
+    room = make_room()
+    alice_ops, bob_ops = concurrent_batches(room.document)
+    assert room.merge_document_ops(alice_ops, editor="甲") is not None
+    # 乙的修改落在已删除的记录上，新增的记录又被自己删除，房间没有变化
+    assert room.merge_document_ops(bob_ops, editor="乙") is None
+    version = room.data_version['number']
+    assert [e['id'] for e in room.expenses['2']] == ['a1']
+    assert room.expenses['1'] == []
+    assert room.expense_index.find('e0') is None
+    assert room.merge_document_ops(alice_ops + bob_ops, editor="甲") is None
+    assert room.data_version['number'] == version
+
+
+def test_room_merge_cost_does_not_depend_on_position():
+    room = make_room()
+    for index in range(1, 50):
+        room.add_expense('1', dict(expense(f"e{index}"), editor='t0', edit_time=1.0), editor="甲")
+    replica = DocumentReplica('client', room.document.copy())
+    replica.update('expenses', 'e25', {'amount': 99.0}, edit_time=9.0)
+    room.merge_document_ops(replica.take_outbox(), editor="甲")
+    day, record, index = room.expense_index.find('e25')
+    assert (day, index, record['amount']) == ('1', 25, 99.0)
+    assert [e['id'] for e in room.expenses['1']] == [f"e{index}" for index in range(50)]
+
+
+@pytest.mark.parametrize('op', [
+    {'type': 'add', 'kind': 'foo', 'id': 'x', 'day': '1'},
+    {'type': 'add', 'kind': 'expenses', 'id': 'x', 'day': 'day-one'},
+    {'type': 'add', 'kind': 'expenses', 'id': 'x', 'day': '²'},
+    {'type': 'add', 'kind': 'expenses', 'id': 'x', 'day': '0'},
+    {'type': 'set', 'kind': 'expenses', 'id': 'x', 'field': 'rev', 'value': 9, 'stamp': [1, 'a', 1]},
+    {'type': 'set', 'kind': 'expenses', 'id': 'x', 'field': 'amount', 'value': 1, 'stamp': 'late'},
+    {'type': 'move', 'kind': 'expenses', 'id': 'x'},
+])
+def test_room_merge_rejects_invalid_ops(op):
+    room = make_room()
+    version = room.data_version['number']
+    valid = {'type': 'add', 'kind': 'expenses', 'id': 'ok', 'day': '1'}
+    with pytest.raises(ValueError):
+        room.merge_document_ops([valid, op], editor="甲")
+    # 整批拒绝，文档和房间都不变
+    assert ('expenses', 'ok') not in room.document
+    assert room.data_version['number'] == version
+
+
+def test_room_merge_does_not_write_unbounded_amounts():
+    room = make_room()
+    replica = DocumentReplica('client', room.document.copy())
+    replica.update('expenses', 'e0', {'amount': float('inf')}, edit_time=9.0)
+    replica.add('expenses', '1', expense('big', amount=1e20), edit_time=9.0)
+    room.merge_document_ops(replica.take_outbox(), editor="甲")
+    assert room.expense_index.find('e0')[1]['amount'] == 10.0
+    assert 'big' not in room.expense_index
+
+
+def test_tombstones_survive_restart(tmp_path):
+    path = str(tmp_path / "room.db")
+    registry = RoomRegistry(SQLiteStorage(path))
+    room = registry.get('R')
+    room.add_traveler("甲", 't0', editor="甲")
+    client = DocumentReplica('client', room.document.copy())
+    client.add('expenses', '1', expense('x1'), edit_time=2.0)
+    batch = client.take_outbox()
+    room.merge_document_ops(batch, editor="甲")
+    room.delete_expense('1', 'x1', editor="乙")
+    registry.flush(room)
+    registry.storage.close()
+
+    # 重启后文档从房间数据重建；客户端重新提交同一批操作（例如提交失败后重试）
+    registry = RoomRegistry(SQLiteStorage(path))
+    room = registry.get('R')
+    assert room.merge_document_ops(batch, editor="甲") is None
+    assert room.expense_index.find('x1') is None
+
+
+def test_tombstones_survive_replace():
+    room = make_room()
+    client = DocumentReplica('client', room.document.copy())
+    client.update('expenses', 'e0', {'amount': 1.0}, edit_time=9.0)
+    client.add('expenses', '1', expense('e0'), edit_time=9.0)
+    room.reset(editor="甲")
+    assert room.merge_document_ops(client.take_outbox(), editor="甲") is None
+    assert room.expenses == {}
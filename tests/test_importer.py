@@ -0,0 +1,117 @@
+"""导出与流式导入（exporter.py、importer.py）"""
+import gzip
+import io
+import json
+
+import pytest
+
+from travel_core.exporter import encode_export
+from travel_core.importer import TripImportError, import_dict, import_trip
+from travel_core.store import RoomState
+
+
+def legacy_trip():
+    """旧版导出格式：人员按名字引用"""
+    return {
+        'travelers': ["小明", "小红"],
+        'itinerary': {'1': [{'id': 'i1', 'time': "09:00-10:00", 'project': "故宫",
+                             'participants': ["小明"], 'editor': "小明", 'edit_time': 1.0}]},
+        'expenses': {'1': [{'id': 'e1', 'payer': "小明", 'item': "午餐", 'category': "餐饮",
+                            'amount': 90.0, 'day': 1, 'sharers': ["小明", "小红"],
+                            'editor': "小红", 'edit_time': 2.0}]},
+        'total_days': 5,
+        'user_room_names': {'u1_ROOM': "小明"},
+    }
+
+
+def test_names_are_converted_to_ids():
+    result = import_dict(legacy_trip())
+    assert result.errors == [] and result.skipped == 0
+    ids = {record['name']: record['id'] for record in result.state['travelers']}
+    expense = result.state['expenses']['1'][0]
+    assert expense['payer'] == ids["小明"]
+    assert expense['sharers'] == [ids["小明"], ids["小红"]]
+    assert expense['editor'] == ids["小红"]
+    assert result.state['itinerary']['1'][0]['participants'] == [ids["小明"]]
+    assert result.state['total_days'] == 5
+    assert result.user_names == {'u1': "小明"}
+
+
+@pytest.mark.parametrize('fmt', ['json', 'ttz'])
+def test_export_import_round_trip(fmt):
+    room = RoomState('R')
+    room.load_import(import_dict(legacy_trip()), editor="小明")
+    payload = encode_export(room.to_dict(), fmt)
+    result = import_trip(io.BytesIO(payload))
+    assert result.errors == []
+    copy = RoomState('R2')
+    copy.load_import(result)
+    exported, reimported = room.to_dict(), copy.to_dict()
+    for key in ('travelers', 'traveler_ids', 'itinerary', 'expenses', 'total_days'):
+        assert reimported[key] == exported[key]
+
+
+def test_plain_gzip_and_text_files_are_accepted():
+    text = json.dumps(legacy_trip(), ensure_ascii=False)
+    assert import_trip(io.BytesIO(gzip.compress(text.encode()))).expense_count == 1
+    assert import_trip(io.StringIO(text)).expense_count == 1
+
+
+def test_invalid_records_are_skipped_with_reasons():
+    data = legacy_trip()
+    data['expenses']['1'].append({'id': 'e2', 'payer': "小明", 'item': "x"})
+    data['expenses']['1'].append({'id': 'e1', 'payer': "小明", 'item': "x", 'amount': 1.0})
+    data['expenses']['²'] = [{'id': 'e3', 'payer': "小明", 'item': "x", 'amount': 1.0}]
+    data['expenses']['31'] = [{'id': 'e4', 'payer': "小明", 'item': "x", 'amount': 1.0}]
+    data['itinerary']['2'] = "不是列表"
+    result = import_dict(data)
+    assert result.expense_count == 1
+    assert result.skipped == 5
+    assert any("缺少字段 amount" in error for error in result.errors)
+    assert any("ID e1 重复" in error for error in result.errors)
+    assert sum("应为 1 到 30 之间的整数" in error for error in result.errors) == 2
+
+
+def test_member_names_must_be_text():
+    data = legacy_trip()
+    data['user_room_names'].update({'u2_ROOM': 5, 'u3_ROOM': "  "})
+    result = import_dict(data)
+    assert result.user_names == {'u1': "小明"}
+    assert result.skipped == 2
+    assert all("昵称应为非空字符串" in error for error in result.errors)
+
+
+@pytest.mark.parametrize('amount', ['Infinity', 'NaN', '1e20', '-1'])
+def test_amounts_that_do_not_fit_the_ledger_are_skipped(amount):
+    text = json.dumps(legacy_trip()).replace('"amount": 90.0', f'"amount": {amount}')
+    result = import_trip(io.StringIO(text))
+    assert result.expense_count == 0 and result.skipped == 1
+    assert "amount" in result.errors[0]
+
+
+@pytest.mark.parametrize('payload, message', [
+    (b'[1, 2]', "应为 '{'"),
+    (b'{"travelers": "a"}', "travelers"),
+    (b'{"total_days": 99}', "total_days"),
+    (b'{"expenses": {"1": [', "JSON"),
+])
+def test_broken_files_raise(payload, message):
+    with pytest.raises(TripImportError, match=message):
+        import_trip(io.BytesIO(payload))
+
+
+def test_size_limit_applies_to_decompressed_bytes():
+    data = legacy_trip()
+    data['padding'] = "x" * 100_000
+    payload = encode_export(data, 'ttz')
+    assert len(payload) < 10_000
+    with pytest.raises(TripImportError, match="大小限制"):
+        import_trip(io.BytesIO(payload), max_bytes=50_000)
+
+
+def test_missing_sections_fall_back_to_room_data():
+    room = RoomState('R')
+    room.load_import(import_dict(legacy_trip()))
+    result = import_dict({'total_days': 7}, fallback=room.to_dict())
+    assert result.expense_count == 1 and result.item_count == 1
+    assert result.state['total_days'] == 7
@@ -0,0 +1,40 @@
+"""行程索引（itinerary.py）"""
+import pytest
+
+from travel_core.itinerary import ItineraryIndex, parse_time_range
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("08:00-10:00", (480, 600)),
+    ("8：30", (510, 510)),
+    ("22:00-01:00", (1320, 1500)),
+    ("全天", None),
+])
+def test_parse_time_range(text, expected):
+    assert parse_time_range(text) == expected
+
+
+def test_items_are_kept_in_time_order_and_found_by_id():
+    index = ItineraryIndex.from_dict({'1': [
+        {'id': 'b', 'time': "10:00-11:00"},
+        {'id': 'c', 'time': "随时"},
+        {'id': 'a', 'time': "08:00-09:00"},
+    ]})
+    assert [item['id'] for item in index.day_items('1')] == ['a', 'b', 'c']
+    index.add('1', {'id': 'b', 'time': "07:00"})
+    assert [item['id'] for item in index.day_items('1')] == ['b', 'a', 'c']
+    assert index.get('a') == ('1', {'id': 'a', 'time': "08:00-09:00"})
+    assert index.remove('a')[0] == '1' and 'a' not in index
+    assert len(index) == 2
+
+
+def test_conflicts_only_for_shared_participants():
+    index = ItineraryIndex.from_dict({'1': [
+        {'id': 'a', 'time': "08:00-10:00", 'participants': ['t0', 't1']},
+        {'id': 'b', 'time': "09:00-11:00", 'participants': ['t1']},
+        {'id': 'c', 'time': "09:30-09:45", 'participants': ['t2']},
+        {'id': 'd', 'time': "10:00-12:00", 'participants': []},
+    ]})
+    conflicts = [(first['id'], second['id'], people)
+                 for first, second, people in index.conflicts('1', everyone=['t0', 't1', 't2'])]
+    assert conflicts == [('a', 'b', ['t1']), ('b', 'd', ['t1'])]
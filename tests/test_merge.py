@@ -0,0 +1,69 @@
+"""合并导入（merge.py、RoomState.merge_import）"""
+import pytest
+
+from travel_core.importer import import_dict
+from travel_core.room import Room
+from travel_core.store import RoomRegistry, RoomState
+
+
+def trip(expenses, travelers=("小明", "小红"), timestamp=0):
+    return {'travelers': list(travelers), 'expenses': {'1': expenses}, 'total_days': 3,
+            'data_version': {'number': 1, 'timestamp': timestamp}}
+
+
+def expense(expense_id, amount, edit_time, payer="小明"):
+    return {'id': expense_id, 'payer': payer, 'item': "午餐", 'category': "餐饮", 'amount': amount,
+            'day': 1, 'sharers': ["小明", "小红"], 'editor': payer, 'edit_time': edit_time}
+
+
+def test_merge_adds_updates_and_keeps_by_edit_time():
+    room = RoomState('R')
+    room.load_import(import_dict(trip([expense('e1', 10.0, 5.0), expense('e2', 20.0, 5.0)])))
+    incoming = trip([expense('e1', 11.0, 9.0), expense('e2', 21.0, 1.0), expense('e3', 30.0, 1.0)],
+                    travelers=("小明", "小红", "小刚"))
+    plan = room.merge_import(import_dict(incoming), editor="甲")
+    assert (plan.added, plan.updated, plan.kept) == (1, 1, 1)
+
+    names = {record['id']: record['name'] for record in room.travelers.to_records()}
+    assert sorted(names.values()) == ["小刚", "小明", "小红"]
+    amounts = {expense['id']: expense['amount'] for expense in room.expenses['1']}
+    assert amounts == {'e1': 11.0, 'e2': 20.0, 'e3': 30.0}
+    assert room.expense_index.find('e1')[1]['rev'] == 1
+    # 同名人员对应到房间中已有的人员 ID，不会重复加入
+    assert len(room.travelers.to_records()) == 3
+
+
+def test_merging_the_same_file_twice_changes_nothing():
+    room = RoomState('R')
+    data = trip([expense('e1', 10.0, 5.0)])
+    room.load_import(import_dict(data))
+    version = room.data_version['number']
+    plan = room.merge_import(import_dict(room.to_dict()), editor="甲")
+    assert not plan and plan.kept == 1
+    assert room.data_version['number'] == version
+
+
+def test_room_import_trip_reports_counts():
+    registry = RoomRegistry()
+    member = Room(registry, 'R', 'user-1')
+    data = trip([expense('e1', 10.0, 5.0)])
+    report = member.import_trip(import_dict(data), merge=False, editor="甲")
+    assert report == {'items': 0, 'expenses': 1, 'skipped': 0, 'errors': []}
+
+    data['expenses']['1'].append(expense('e2', 20.0, 5.0))
+    report = member.import_trip(import_dict(data), merge=True, editor="甲")
+    assert report['merge'] == (1, 0, 1)
+    member.reset(editor="甲")
+    assert member.ledger.day_expenses('1') == []
+
+
+def test_room_ledger_rejects_unbounded_amounts():
+    member = Room(RoomRegistry(), 'R', 'user-1')
+    member.join()
+    expense_record = member.ledger.add('1', member.traveler_id, "午餐", "餐饮", 10.0, [], 'user-1', "甲")
+    version = member.state.data_version['number']
+    with pytest.raises(ValueError):
+        member.ledger.add('1', member.traveler_id, "午餐", "餐饮", 1e17, [], 'user-1', "甲")
+    with pytest.raises(ValueError):
+        member.ledger.update('1', expense_record['id'], {'amount': float('inf')}, 0, 'user-1', "甲")
+    assert member.state.data_version['number'] == version
@@ -0,0 +1,23 @@
+"""运行指标（metrics.py）"""
+from travel_core.metrics import Metrics, room_totals, to_prometheus
+from travel_core.store import RoomRegistry
+
+
+def test_prometheus_text_does_not_list_room_ids():
+    registry = RoomRegistry()
+    for room_id, count in (('SECRET1', 1), ('SECRET2', 3)):
+        room = registry.get(room_id)
+        for index in range(count):
+            room.add_traveler(f"旅行者{index}", f"t{index}", editor="甲")
+    metrics = Metrics()
+    with metrics.timer('data_region'):
+        pass
+    metrics.count('rerun', 'add_expense_btn')
+
+    text = to_prometheus(metrics, registry)
+    assert 'SECRET' not in text
+    assert 'travel_rooms 2' in text
+    assert 'travel_room_travelers{stat="sum"} 4' in text
+    assert 'travel_room_travelers{stat="max"} 3' in text
+    assert 'travel_reruns_total{trigger="add_expense_btn"} 1' in text
+    assert room_totals(registry)['travelers'] == (4, 3)
@@ -0,0 +1,39 @@
+"""金额换算与分摊（money.py）"""
+import pytest
+
+from travel_core.money import MAX_AMOUNT, allocate, format_yuan, to_cents, to_yuan
+
+
+@pytest.mark.parametrize('amount, cents', [
+    (0, 0), (12, 1200), (0.1, 10), (0.005, 1), (1.005, 101), (2.675, 268), (19.99, 1999),
+    (123456789.12, 12345678912),
+])
+def test_to_cents_rounds_half_up(amount, cents):
+    assert to_cents(amount) == cents
+
+
+@pytest.mark.parametrize('amount', [float('inf'), float('nan'), 1e17, MAX_AMOUNT + 1, -1, "12", True])
+def test_to_cents_rejects_amounts_outside_the_ledger_range(amount):
+    with pytest.raises(ValueError):
+        to_cents(amount)
+
+
+def test_to_yuan_and_format():
+    assert to_yuan(1999) == 19.99
+    assert format_yuan(1999) == "¥19.99"
+    assert format_yuan(-5) == "-¥0.05"
+    assert format_yuan(100000, decimals=0) == "¥1000"
+
+
+@pytest.mark.parametrize('total, count', [(100, 3), (1, 4), (0, 2), (99999, 7), (-10, 3)])
+def test_allocate_sums_exactly(total, count):
+    shares = allocate(total, count)
+    assert len(shares) == count
+    assert sum(shares) == total
+    assert max(shares) - min(shares) <= 1
+    # 余下的几分钱给前面的几份
+    assert shares == sorted(shares, reverse=True)
+
+
+def test_allocate_without_people():
+    assert allocate(100, 0) == []
@@ -0,0 +1,41 @@
+"""只读的行程、开销记录（records.py）"""
+import copy
+import json
+import pickle
+
+import pytest
+
+from travel_core.records import Expense, ItineraryItem
+
+
+def test_record_reads_like_the_dict_it_came_from():
+    data = {'id': 'e1', 'payer': 't0', 'item': "午餐", 'amount': 9.5, 'sharers': ['t0', 't1'], 'note': ['x']}
+    record = Expense(data)
+    assert record == data
+    assert dict(record) == dict(data, sharers=('t0', 't1'))
+    assert record['sharers'] == ('t0', 't1')
+    assert 'category' not in record and record.get('category', "其他") == "其他"
+    assert list(record) == ['id', 'payer', 'item', 'amount', 'sharers', 'note']
+    assert json.loads(json.dumps(record.to_dict())) == data
+    with pytest.raises(KeyError):
+        record['category']
+
+
+def test_records_are_read_only_and_shared():
+    record = ItineraryItem({'id': 'i1', 'time': "09:00", 'project': "故宫", 'participants': ['t0']})
+    with pytest.raises(TypeError):
+        record['project'] = "长城"
+    with pytest.raises(AttributeError):
+        record.project = "长城"
+    assert copy.deepcopy(record) is record
+    assert ItineraryItem.of(record) is record
+    assert pickle.loads(pickle.dumps(record)) == record
+    changed = record.replace(project="长城")
+    assert changed['project'] == "长城" and record['project'] == "故宫"
+
+
+def test_references_are_interned():
+    first = Expense({'id': 'a', 'payer': ''.join(['t', '0']), 'sharers': [''.join(['t', '1'])]})
+    second = Expense({'id': 'b', 'payer': ''.join(['t', '0']), 'sharers': [''.join(['t', '1'])]})
+    assert first['payer'] is second['payer']
+    assert first['sharers'][0] is second['sharers'][0]
@@ -0,0 +1,128 @@
+"""转账方案与结算引擎（settlement.py、ledger.py）"""
+import random
+
+import numpy as np
+import pytest
+
+from travel_core import oplog
+from travel_core.ledger import Ledger, _sum_by
+from travel_core.oplog import make_op
+from travel_core.settlement import SettlementEngine, net_balances, plan_transfers
+from travel_core.store import RoomRegistry
+
+
+def settle(balances, transfers):
+    remaining = dict(balances)
+    for payer, receiver, amount in transfers:
+        assert amount > 0
+        remaining[payer] += amount
+        remaining[receiver] -= amount
+    return remaining
+
+
+def test_transfers_settle_every_balance():
+    balances = {'a': 300, 'b': -100, 'c': -200}
+    transfers = plan_transfers(balances)
+    assert all(value == 0 for value in settle(balances, transfers).values())
+    assert len(transfers) == 2
+
+
+def test_opposite_amounts_are_paired_directly():
+    assert plan_transfers({'a': 500, 'b': -500}) == [('b', 'a', 500)]
+
+
+def test_exact_solver_uses_zero_sum_groups():
+    # 两个互不相关的小组：{a, b, c} 和 {d, e, f}，最少 4 笔（贪心会得到 5 笔）
+    balances = {'a': 700, 'b': -300, 'c': -400, 'd': 600, 'e': -350, 'f': -250}
+    transfers = plan_transfers(balances)
+    assert all(value == 0 for value in settle(balances, transfers).values())
+    assert len(transfers) == 4
+
+
+@pytest.mark.parametrize('people', [5, 12, 40])
+def test_random_balances_settle_with_at_most_n_minus_one_transfers(people):
+    rng = random.Random(people)
+    balances = {f"p{index}": rng.randint(-10_000, 10_000) for index in range(people - 1)}
+    balances[f"p{people - 1}"] = -sum(balances.values())
+    balances = {traveler: amount for traveler, amount in balances.items() if amount}
+    transfers = plan_transfers(balances)
+    assert all(value == 0 for value in settle(balances, transfers).values())
+    assert len(transfers) <= len(balances) - 1
+
+
+def test_new_traveler_past_64_keeps_the_row():
+    # 第 65 个人员使分摊位图增加一列，扩容不能丢掉正在写入的这一行
+    ledger = Ledger()
+    sharers = [f"t{index}" for index in range(64)]
+    ledger.append({'id': 'e1', 'payer': 't0', 'amount': 10.0, 'category': '餐饮', 'sharers': sharers}, '1')
+    ledger.append({'id': 'e2', 'payer': 't64', 'amount': 25.0, 'category': '餐饮',
+                   'sharers': ['t1', 't65']}, '2')
+    assert ledger.total_amount() == 3500
+    assert ledger.day_totals() == {'1': (1000, 1000), '2': (2500, 2500)}
+    assert ('t1', 't64', 't65') in ledger.aa_summary()
+    assert ledger.payment_summary()['t64']['total_paid'] == 2500
+
+
+def test_aa_differences_sum_to_zero():
+    ledger = Ledger()
+    ledger.append({'id': 'e1', 'payer': 'a', 'amount': 100.0, 'category': '餐饮', 'sharers': ['a', 'b', 'c']}, '1')
+    ledger.append({'id': 'e2', 'payer': 'b', 'amount': 0.01, 'category': '交通', 'sharers': ['b', 'c']}, '2')
+    ledger.append({'id': 'e3', 'payer': 'c', 'amount': 50.0, 'category': '个人'}, '2')
+    summary = ledger.aa_summary()
+    assert summary[('a', 'b', 'c')]['shares'] == {'a': 3334, 'b': 3333, 'c': 3333}
+    for result in summary.values():
+        assert sum(result['differences'].values()) == 0
+        assert sum(result['shares'].values()) == result['total_amount']
+    assert ledger.day_totals() == {'1': (10000, 10000), '2': (5001, 1)}
+    assert ledger.category_totals() == {'餐饮': 10000, '交通': 1, '个人': 5000}
+    assert net_balances(summary) == {'a': 6666, 'b': -3333, 'c': -3333}
+
+
+def expense(expense_id, payer, amount, sharers=('t0', 't1', 't2')):
+    return {'id': expense_id, 'payer': payer, 'item': "午餐", 'category': "餐饮",
+            'amount': amount, 'day': 1, 'sharers': list(sharers), 'editor': payer, 'edit_time': 1.0}
+
+
+def test_incremental_engine_matches_rebuild():
+    registry = RoomRegistry()
+    room = registry.get('R')
+    for index in range(3):
+        room.add_traveler(f"旅行者{index}", f"t{index}", editor="甲")
+    engine = SettlementEngine()
+    engine.sync(registry, room)
+
+    room.add_expense('1', expense('e1', 't0', 90.0), editor="甲")
+    room.add_expense('2', expense('e2', 't1', 45.5, ('t1', 't2')), editor="甲")
+    room.update_expense('1', 'e1', {'amount': 120.0}, 0, 't0', "甲")
+    room.delete_expense('2', 'e2', editor="甲")
+    room.apply({'op': oplog.MERGE, 'travelers': [], 'itinerary': [], 'total_days': None,
+                'expenses': [('3', expense('e3', 't2', 30.0))]}, "甲")
+    engine.sync(registry, room)
+    assert engine.version == room.data_version['number']
+
+    rebuilt = SettlementEngine()
+    rebuilt.rebuild(room.expenses, room.data_version['number'])
+    assert engine.aa_summary() == rebuilt.aa_summary()
+    assert engine.transfers() == rebuilt.transfers()
+    assert engine.total_amount == 15000
+
+
+def test_engine_rebuilds_after_replace():
+    registry = RoomRegistry()
+    room = registry.get('R')
+    room.add_expense('1', expense('e1', 't0', 90.0), editor="甲")
+    engine = SettlementEngine()
+    engine.sync(registry, room)
+    room.apply(make_op(oplog.REPLACE, state=oplog.empty_state()), "甲")
+    engine.sync(registry, room)
+    assert engine.expense_count == 0
+
+
+def test_sums_are_exact_beyond_float_precision():
+    # float64 累加时 2^53 + 1 会被舍入
+    keys = np.array([0, 0, 2])
+    amounts = np.array([2 ** 53, 1, 5], dtype=np.int64)
+    totals = _sum_by(keys, amounts, 4)
+    assert totals.dtype == np.int64
+    assert totals.tolist() == [2 ** 53 + 1, 0, 5, 0]
+    assert _sum_by(np.array([], dtype=np.int64), np.array([], dtype=np.int64), 2).tolist() == [0, 0]
@@ -0,0 +1,97 @@
+"""SQLite 持久化、快照、副本同步与房间注册表"""
+import threading
+
+from travel_core.oplog import RoomReplica
+from travel_core.storage import RoomStorage, SQLiteStorage
+from travel_core.store import RoomRegistry
+
+
+def add_expense(room, expense_id, amount=10.0, day='1'):
+    room.add_expense(day, {'id': expense_id, 'payer': 't0', 'item': "午餐", 'category': "餐饮",
+                           'amount': amount, 'day': int(day), 'sharers': ['t0', 't1'],
+                           'editor': 't0', 'edit_time': 1.0}, editor="甲")
+
+
+def test_snapshot_is_loaded_only_when_a_replica_needs_it(tmp_path):
+    path = str(tmp_path / "room.db")
+    registry = RoomRegistry(SQLiteStorage(path))
+    room = registry.get('R')
+    room.add_traveler("甲", 't0', editor="甲")
+    room.add_traveler("乙", 't1', editor="甲")
+    for index in range(5):
+        add_expense(room, f"e{index}")
+    version = registry.take_snapshot(room)
+    add_expense(room, 'after')
+    registry.flush(room)
+    registry.storage.close()
+
+    registry = RoomRegistry(SQLiteStorage(path))
+    room = registry.get('R')
+    # 加载房间时只读取快照的版本号
+    assert room.snapshot_version == version
+    assert not hasattr(room, 'latest_snapshot')
+    assert room.replay_length == 1
+
+    replica = RoomReplica()
+    assert replica.sync(registry, room) is None
+    assert replica.last_replay == 1
+    assert replica.version == room.data_version['number']
+    assert [e['id'] for e in replica.expenses['1']] == [f"e{index}" for index in range(5)] + ['after']
+    registry.storage.close()
+
+
+def test_loading_a_room_does_not_block_other_rooms():
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    class SlowStorage(RoomStorage):
+        def load_room(self, room):
+            loads.append(room.room_id)
+            if room.room_id == 'BIG':
+                started.set()
+                release.wait(5)
+            return False
+
+    registry = RoomRegistry(SlowStorage())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get('BIG'))) for _ in range(3)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # BIG 仍在加载，其他房间不需要等待
+    assert registry.get('SMALL').room_id == 'SMALL'
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 3 and all(room is results[0] for room in results)
+    assert loads.count('BIG') == 1
+
+
+def test_room_round_trip(tmp_path):
+    path = str(tmp_path / "room.db")
+    registry = RoomRegistry(SQLiteStorage(path))
+    room = registry.get('R')
+    room.add_traveler("甲", 't0', editor="甲")
+    room.add_traveler("乙", 't1', editor="甲")
+    for index in range(4):
+        add_expense(room, f"e{index}", day=str(index % 2 + 1))
+    room.delete_expense('1', 'e2', editor="甲")
+    room.update_expense('2', 'e1', {'amount': 55.5}, 0, 't1', "乙")
+    room.add_itinerary_item('1', {'id': 'i1', 'time': "09:00", 'project': "故宫", 'participants': ['t0']},
+                            editor="甲")
+    room.set_total_days(6, editor="甲")
+    room.set_user_name('user-1', "甲")
+    registry.flush(room)
+    expected = room.to_dict()
+    registry.storage.close()
+
+    registry = RoomRegistry(SQLiteStorage(path))
+    loaded = registry.get('R')
+    assert loaded.to_dict() == expected
+    assert loaded.data_version['number'] == room.data_version['number']
+    assert [e['id'] for e in loaded.expenses['1']] == ['e0']
+    assert loaded.expense_index.find('e1')[1]['amount'] == 55.5
+    # 重启前的操作仍可增量获取
+    assert len(registry.ops_since(loaded, 0)) == loaded.data_version['number']
+    registry.storage.close()
@@ -0,0 +1,68 @@
+"""记录版本号与并发修改的合并（versioning.py、RoomState.update_*）"""
+from travel_core.store import RoomState
+from travel_core.versioning import resolve_update
+
+
+def make_room():
+    room = RoomState('R')
+    for index in range(3):
+        room.add_traveler(f"旅行者{index}", f"t{index}", editor="甲")
+    room.add_expense('1', {'id': 'e1', 'payer': 't0', 'item': "午餐", 'category': "餐饮",
+                           'amount': 90.0, 'day': 1, 'sharers': ['t0', 't1'],
+                           'editor': 't0', 'edit_time': 1.0}, editor="甲")
+    room.add_itinerary_item('1', {'id': 'i1', 'time': "09:00-10:00", 'project': "故宫",
+                                  'participants': ['t0'], 'editor': 't0', 'edit_time': 1.0}, editor="甲")
+    return room
+
+
+def test_update_with_current_rev_applies_changes():
+    room = make_room()
+    record, merged = room.update_expense('1', 'e1', {'amount': 100.0, 'sharers': ['t2']}, 0, 't1', "乙")
+    assert not merged
+    assert record['rev'] == 1 and record['amount'] == 100.0 and record['sharers'] == ['t2']
+    assert record['editor'] == 't1'
+    assert room.expense_index.find('e1')[1]['amount'] == 100.0
+
+
+def test_stale_update_merges_instead_of_overwriting():
+    room = make_room()
+    room.update_expense('1', 'e1', {'amount': 100.0, 'sharers': ['t0', 't1', 't2']}, 0, 't1', "乙")
+    # 丙基于 rev 0 提交：名单取并集，金额按 edit_time 较新的一方（丙）为准
+    record, merged = room.update_expense('1', 'e1', {'amount': 80.0, 'sharers': ['t0']}, 0, 't2', "丙")
+    assert merged
+    assert record['rev'] == 2
+    assert record['sharers'] == ['t0', 't1', 't2']
+    assert record['amount'] == 80.0
+
+
+def test_stale_update_with_older_edit_time_loses_scalar_fields():
+    current = {'id': 'e1', 'amount': 100.0, 'sharers': ['t0'], 'rev': 3, 'edit_time': 10.0, 'editor': 't1'}
+    record, merged = resolve_update(current, {'amount': 1.0, 'sharers': ['t2'], 'rev': 99, 'id': 'x'},
+                                    base_rev=2, edit_time=5.0, editor='t0')
+    assert merged
+    assert record == {'id': 'e1', 'amount': 100.0, 'sharers': ['t0', 't2'], 'rev': 4,
+                      'edit_time': 10.0, 'editor': 't1'}
+    # 原记录不被修改
+    assert current['sharers'] == ['t0'] and current['rev'] == 3
+
+
+def test_update_itinerary_item_moves_by_time():
+    room = make_room()
+    room.add_itinerary_item('1', {'id': 'i2', 'time': "08:00-08:30", 'project': "早餐"}, editor="甲")
+    assert [item['id'] for item in room.itinerary.day_items('1')] == ['i2', 'i1']
+    record, merged = room.update_itinerary_item('i1', {'time': "07:00-07:30"}, 0, 't0', "甲")
+    assert not merged and record['rev'] == 1
+    assert [item['id'] for item in room.itinerary.day_items('1')] == ['i1', 'i2']
+
+
+def test_update_of_deleted_record_is_not_logged():
+    room = make_room()
+    room.delete_expense('1', 'e1', editor="甲")
+    room.delete_itinerary_item('1', 'i1', editor="甲")
+    version = room.data_version['number']
+    sections = dict(room.section_versions)
+    assert room.update_expense('1', 'e1', {'amount': 1.0}, 0, 't1', "乙") == (None, False)
+    assert room.update_itinerary_item('i1', {'project': "天坛"}, 0, 't1', "乙") == (None, False)
+    assert room.data_version['number'] == version
+    assert room.section_versions == sections
+    assert len(room.oplog) == version
@@ -1,14 +1,19 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-import json
+from streamlit.errors import StreamlitAPIException
+from datetime import datetime
 import uuid
-from itertools import combinations
-from collections import defaultdict
 import time
 import hashlib
-import random
-import threading
+import hmac
+import html
+import functools
+import os
+
+from travel_core import (EXPENSE_CATEGORIES, EXPORT_FORMATS, MAX_AMOUNT, MAX_IMPORT_BYTES, PERSONAL_CATEGORY,
+                         SNAPSHOT_EVERY, BackgroundWorker, ExportCache, Metrics, Room, RoomRegistry, SQLiteStorage,
+                         SettlementEngine, TripImportError, format_yuan, import_trip, member_color, room_totals,
+                         to_prometheus)
 
 # 页面配置
 st.set_page_config(
@@ -18,248 +23,63 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# 自定义CSS样式
-st.markdown("""
-<style>
-    /* 手机优化 */
-    @media (max-width: 768px) {
-        .block-container {
-            padding: 1rem 0.5rem;
-        }
-        .stButton > button {
-            width: 100%;
-            margin: 2px 0;
-        }
-        .stTextInput > div > input {
-            font-size: 16px;
-        }
-    }
-    
-    /* 通用样式 */
-    .main-header {
-        text-align: center;
-        color: #1E88E5;
-        padding: 1rem 0;
-    }
-    
-    /* 多人协作提示 */
-    .collaboration-notice {
-        background: linear-gradient(45deg, #2196F3, #21CBF3);
-        color: white;
-        padding: 12px 20px;
-        border-radius: 10px;
-        margin: 10px 0;
-        text-align: center;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        animation: slideIn 0.5s ease-out;
-    }
-    .collaboration-notice .icon {
-        font-size: 24px;
-        margin-right: 10px;
-    }
-    @keyframes slideIn {
-        from { transform: translateY(-20px); opacity: 0; }
-        to { transform: translateY(0); opacity: 1; }
-    }
-    
-    /* 用户指示器 - 清晰可见 */
-    .user-indicator {
-        display: inline-flex;
-        align-items: center;
-        padding: 6px 12px;
-        border-radius: 20px;
-        font-size: 0.9em;
-        margin: 5px;
-        background-color: #ffffff;
-        border: 2px solid #1E88E5;
-        color: #1565c0;
-        font-weight: 500;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    .user-you {
-        background: linear-gradient(45deg, #4CAF50, #8BC34A) !important;
-        border-color: #2E7D32 !important;
-        color: white !important;
-        font-weight: bold;
-    }
-    
-    /* 在线状态指示器 */
-    .online-status {
-        display: inline-block;
-        width: 10px;
-        height: 10px;
-        border-radius: 50%;
-        margin-right: 8px;
-        animation: pulse 2s infinite;
-    }
-    @keyframes pulse {
-        0% { transform: scale(1); }
-        50% { transform: scale(1.2); }
-        100% { transform: scale(1); }
-    }
-    .online {
-        background-color: #4CAF50;
-        box-shadow: 0 0 8px #4CAF50;
-    }
-    
-    /* 同步状态指示 */
-    .sync-indicator {
-        font-size: 0.8em;
-        color: #666;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        margin: 5px 0;
-    }
-    .sync-indicator .dot {
-        display: inline-block;
-        width: 8px;
-        height: 8px;
-        border-radius: 50%;
-        margin-right: 5px;
-    }
-    .syncing {
-        color: #FF9800;
-    }
-    .syncing .dot {
-        background-color: #FF9800;
-        animation: pulse 1s infinite;
-    }
-    .synced {
-        color: #4CAF50;
-    }
-    .synced .dot {
-        background-color: #4CAF50;
-    }
-    
-    /* 自动更新通知 */
-    .auto-update-notice {
-        background-color: #e3f2fd;
-        border-left: 4px solid #2196F3;
-        padding: 10px 15px;
-        margin: 10px 0;
-        border-radius: 0 5px 5px 0;
-        animation: fadeIn 0.5s ease-out;
-    }
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateX(-10px); }
-        to { opacity: 1; transform: translateX(0); }
-    }
-    
-    /* 行程卡片样式 */
-    .day-card {
-        border-left: 4px solid #1E88E5;
-        padding: 0.8rem 1rem;
-        margin: 0.5rem 0;
-        background-color: #e3f2fd;
-        border-radius: 0 5px 5px 0;
-        color: #333333 !important;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        transition: all 0.3s ease;
-    }
-    .day-card:hover {
-        transform: translateX(3px);
-        box-shadow: 0 4px 8px rgba(0,0,0,0.15);
-    }
-    .day-card b {
-        color: #1565c0 !important;
-    }
-    .day-card .time {
-        color: #0d47a1 !important;
-        font-weight: bold;
-    }
-    
-    /* 编辑指示器 */
-    .edit-indicator {
-        font-size: 0.8em;
-        color: #666;
-        font-style: italic;
-        margin-top: 5px;
-        display: flex;
-        align-items: center;
-    }
-    .edit-indicator::before {
-        content: "✏️";
-        margin-right: 5px;
-    }
-    
-    /* 开销项目样式 */
-    .expense-item {
-        border-left: 4px solid #4CAF50;
-        padding: 0.8rem;
-        margin: 0.3rem 0;
-        background-color: #e8f5e8;
-        color: #333333 !important;
-        border-radius: 0 5px 5px 0;
-        box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-        transition: all 0.3s ease;
-    }
-    .expense-item:hover {
-        transform: translateX(3px);
-        box-shadow: 0 3px 6px rgba(0,0,0,0.15);
-    }
-    .expense-item b {
-        color: #2e7d32 !important;
-    }
-    .personal-expense {
-        border-left-color: #FF9800;
-        background-color: #fff3e0;
-        color: #333333 !important;
-    }
-    .personal-expense b {
-        color: #ef6c00 !important;
-    }
-    
-    /* 最近更新标记 */
-    .recent-update {
-        animation: highlight 2s ease-out;
-    }
-    @keyframes highlight {
-        0% { background-color: rgba(255, 255, 200, 0.8); }
-        100% { background-color: inherit; }
-    }
-    
-    /* 表格样式优化 */
-    .stDataFrame {
-        border-radius: 8px;
-        overflow: hidden;
-    }
-    
-    /* 状态标签 */
-    .status-tag {
-        display: inline-block;
-        padding: 4px 10px;
-        border-radius: 12px;
-        font-size: 0.85em;
-        font-weight: bold;
-        margin: 2px;
-    }
-    .status-paid {
-        background-color: #e8f5e8;
-        color: #2e7d32;
-        border: 1px solid #4CAF50;
-    }
-    .status-owed {
-        background-color: #fff3e0;
-        color: #ef6c00;
-        border: 1px solid #FF9800;
-    }
-    .status-balanced {
-        background-color: #e3f2fd;
-        color: #1565c0;
-        border: 1px solid #2196F3;
-    }
-</style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def get_metrics():
+    """进程级运行指标：页面各部分耗时与重新运行次数"""
+    return Metrics()
+
+@st.cache_resource
+def load_css():
+    """自定义CSS样式（travel.css），进程内只读取一次"""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "travel.css"), encoding="utf-8") as css_file:
+        return css_file.read()
+
+metrics = get_metrics()
+css_started = time.perf_counter()
+
+st.markdown(f"<style>\n{load_css()}</style>", unsafe_allow_html=True)
+metrics.observe("css", time.perf_counter() - css_started)
 
 # ========== 智能多人协作模块 ==========
+@st.cache_resource
+def get_room_registry():
+    """进程级房间注册表，所有会话共享（数据持久化到SQLite）"""
+    db_path = os.environ.get("TRAVEL_DB_PATH", "travel_together.db")
+    return RoomRegistry(storage=SQLiteStorage(db_path))
+
+
+@st.cache_resource
+def get_background_worker():
+    """进程级后台线程：落盘、清理在线状态、压缩操作日志、生成快照"""
+    snapshot_every = int(os.environ.get("TRAVEL_SNAPSHOT_EVERY", SNAPSHOT_EVERY))
+    return BackgroundWorker(get_room_registry(), snapshot_every=snapshot_every, metrics=get_metrics()).start()
+
+
+@st.cache_resource
+def get_settlement_engine(room_id):
+    """每个房间一个结算引擎，所有会话共享"""
+    return SettlementEngine()
+
+
+@st.cache_resource
+def get_export_cache(room_id):
+    """每个房间的导出缓存（按数据版本），所有会话共享"""
+    return ExportCache()
+
+
 class SmartCollaborativeManager:
     """智能多人协作管理器，自动后台同步"""
     
     def __init__(self):
+        self.registry = get_room_registry()
         self.init_collaboration_state()
         self.setup_auto_sync()
     
+    @property
+    def room(self):
+        """当前会话所在房间的共享数据"""
+        return self.registry.get(st.session_state.room_id)
+    
     def init_collaboration_state(self):
         """初始化协作相关的session state"""
         # 房间/旅行团ID
@@ -271,220 +91,114 @@ class SmartCollaborativeManager:
             # 使用UUID作为持久化的用户ID
             st.session_state.user_id = str(uuid.uuid4())
         
-        # 存储用户在各个房间中的名字映射
-        if 'user_room_names' not in st.session_state:
-            st.session_state.user_room_names = {}
-        
-        # 在线用户列表
-        if 'online_users' not in st.session_state:
-            st.session_state.online_users = {}
-        
         # 智能同步状态
         if 'sync_status' not in st.session_state:
             st.session_state.sync_status = {
                 'last_sync': time.time(),
                 'last_update_check': time.time(),
                 'auto_sync_count': 0,
-                'needs_attention': False
+                'needs_attention': False,
+                'seen_version': self.room.data_version['number']
             }
         
-        # 数据版本控制
-        if 'data_version' not in st.session_state:
-            st.session_state.data_version = {
-                'number': 0,
-                'timestamp': time.time(),
-                'last_editor': st.session_state.user_name if 'user_name' in st.session_state else "未知"
-            }
-        
-        # 最近更新记录
-        if 'recent_updates' not in st.session_state:
-            st.session_state.recent_updates = []
-        
         # 基础数据初始化
         self.init_base_data()
     
     def init_base_data(self):
-        """初始化基础数据"""
-        if 'travelers' not in st.session_state:
-            st.session_state.travelers = []
-        
-        if 'itinerary' not in st.session_state:
-            st.session_state.itinerary = {}
-        
-        if 'expenses' not in st.session_state:
-            st.session_state.expenses = {}
-        
+        """初始化会话内的界面状态（房间数据保存在共享存储中）"""
         if 'current_day' not in st.session_state:
             st.session_state.current_day = 1
         
-        if 'total_days' not in st.session_state:
-            st.session_state.total_days = 3
-        
-        if 'traveler_ids' not in st.session_state:
-            st.session_state.traveler_ids = []
-        
         if 'show_add_itinerary' not in st.session_state:
             st.session_state.show_add_itinerary = False
     
     def setup_auto_sync(self):
         """设置自动同步（后台运行）"""
-        # 每30秒自动检查更新
-        AUTO_SYNC_INTERVAL = 30
-        
-        current_time = time.time()
-        last_check = st.session_state.sync_status['last_update_check']
-        
-        # 检查是否到了自动同步的时间
-        if current_time - last_check > AUTO_SYNC_INTERVAL:
-            st.session_state.sync_status['last_update_check'] = current_time
-            self.perform_auto_sync()
-    
-    def get_or_create_user_name(self, room_id):
-        """获取或创建用户在指定房间的名字"""
-        # 生成用户在房间的唯一键
-        user_room_key = f"{st.session_state.user_id}_{room_id}"
-        
-        # 如果用户已经有在这个房间的名字，直接返回
-        if user_room_key in st.session_state.user_room_names:
-            return st.session_state.user_room_names[user_room_key]
-        
-        # 否则，创建一个新的名字（旅行者X）
-        # 获取当前房间所有用户已使用的编号
-        used_numbers = set()
-        for key, name in st.session_state.user_room_names.items():
-            # 只检查同一房间的其他用户
-            if key.endswith(f"_{room_id}") and name.startswith("旅行者"):
-                try:
-                    num = int(name[3:])  # 提取"旅行者"后面的数字
-                    used_numbers.add(num)
-                except:
-                    pass
-        
-        # 找出最小未使用的编号
-        next_num = 1
-        while next_num in used_numbers:
-            next_num += 1
-        
-        new_name = f"旅行者{next_num}"
-        st.session_state.user_room_names[user_room_key] = new_name
-        return new_name
+        # 房间数据是共享的，每次运行只需读取已看到版本之后的操作，开销很小
+        st.session_state.sync_status['last_update_check'] = time.time()
+        self.perform_auto_sync()
+    
+    def mark_rendered(self, region, sections):
+        """记录区域本次渲染时所依赖数据部分的版本号"""
+        versions = st.session_state.setdefault('region_versions', {})
+        versions[region] = (sections, self.room.sections_version(sections))
+    
+    def stale_regions(self, exclude=None):
+        """依赖的数据在渲染之后被修改过的区域"""
+        room = self.room
+        return [
+            region for region, (sections, version) in st.session_state.get('region_versions', {}).items()
+            if region != exclude and room.sections_version(sections) > version
+        ]
+    
+    @property
+    def member(self):
+        """当前用户在当前房间中的领域操作（travel_core.room.Room）"""
+        return Room(self.registry, st.session_state.room_id, st.session_state.user_id)
     
     def update_user_activity(self):
         """更新用户活动时间"""
-        current_time = time.time()
-        
-        # 获取用户在当前房间的名字
-        user_name = self.get_or_create_user_name(st.session_state.room_id)
-        
-        # 更新session中的用户名
-        st.session_state.user_name = user_name
+        member = self.member
+        # 确保当前用户在人员名单中，名字以人员记录为准
+        st.session_state.user_name, st.session_state.traveler_id = member.join()
         
         # 为用户分配一个颜色（基于用户ID，确保一致性）
         if 'user_color' not in st.session_state:
-            # 使用用户ID的哈希值来生成一致的颜色
-            color_hash = hashlib.md5(st.session_state.user_id.encode()).hexdigest()
-            colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD', '#98D8C8', '#F7DC6F']
-            color_index = int(color_hash, 16) % len(colors)
-            st.session_state.user_color = colors[color_index]
-        
-        user_key = f"{st.session_state.user_id}_{st.session_state.room_id}"
+            st.session_state.user_color = member_color(st.session_state.user_id)
         
-        st.session_state.online_users[user_key] = {
-            'user_id': st.session_state.user_id,
+        # 心跳记录在所有会话共享的在线状态中，超时（5分钟）的用户由其按时间顺序清理
+        member.presence.heartbeat({
             'user_name': st.session_state.user_name,
-            'room_id': st.session_state.room_id,
-            'last_active': current_time,
             'color': st.session_state.user_color
-        }
-        
-        # 清理长时间不活跃的用户（5分钟）
-        for key in list(st.session_state.online_users.keys()):
-            if current_time - st.session_state.online_users[key]['last_active'] > 300:
-                del st.session_state.online_users[key]
-        
-        # 确保当前用户在旅行者名单中
-        if st.session_state.user_name not in st.session_state.travelers:
-            st.session_state.travelers.append(st.session_state.user_name)
-            st.session_state.traveler_ids.append(st.session_state.user_id[:8])  # 使用用户ID前8位
-    
-    def get_online_users(self, max_inactive=30):
-        """获取在线用户列表"""
-        current_time = time.time()
-        online_users = []
-        
-        for user_key, user_info in st.session_state.online_users.items():
-            if user_info['room_id'] == st.session_state.room_id:
-                if current_time - user_info['last_active'] < max_inactive:
-                    online_users.append(user_info)
-        
-        # 按最后活动时间排序
-        online_users.sort(key=lambda x: x['last_active'], reverse=True)
+        })
+    
+    def get_online_users(self, max_inactive=30, heartbeat=True):
+        """获取在线用户列表（heartbeat=False 时只读取，不更新当前用户的活动时间）"""
+        # 只读取当前房间的分组，已按最后活动时间排序
+        online_users = self.member.presence.online(max_inactive)
         
         # 更新当前用户的活动时间
-        self.update_user_activity()
+        if heartbeat:
+            self.update_user_activity()
         
         return online_users
     
-    def increment_data_version(self, action, details):
-        """增加数据版本"""
-        st.session_state.data_version['number'] += 1
-        st.session_state.data_version['timestamp'] = time.time()
-        st.session_state.data_version['last_editor'] = st.session_state.user_name
-        
-        # 记录更新历史（最多保留10条）
-        update_record = {
-            'user': st.session_state.user_name,
-            'action': action,
-            'details': details,
-            'timestamp': time.time(),
-            'version': st.session_state.data_version['number']
-        }
-        
-        st.session_state.recent_updates.insert(0, update_record)
-        if len(st.session_state.recent_updates) > 10:
-            st.session_state.recent_updates = st.session_state.recent_updates[:10]
+    def record_update(self, action, details):
+        """记录一次用户操作（数据修改本身已通过房间操作增加了版本号）"""
+        version = self.room.record_activity(st.session_state.user_name, action, details)
+        # 本次操作的所有修改作为一个事务写入
+        self.flush()
         
         # 标记需要其他用户注意
         self.flag_needs_attention()
         
-        return st.session_state.data_version['number']
+        return version
+    
+    def flush(self):
+        """把当前房间的待写入修改交给后台线程持久化（队列已满时同步写入）"""
+        get_background_worker().request_flush(self.room)
     
     def flag_needs_attention(self):
         """标记需要其他用户注意更新"""
-        for user_key, user_info in st.session_state.online_users.items():
-            if user_info['room_id'] == st.session_state.room_id and user_info['user_id'] != st.session_state.user_id:
-                # 在实际应用中，这里应该发送通知给其他用户
-                # 这里我们只是标记状态
-                st.session_state.sync_status['needs_attention'] = True
+        # 房间数据是共享的，其他成员通过比较数据版本号感知更新
+        if self.member.presence.has_others():
+            st.session_state.sync_status['needs_attention'] = True
     
     def check_for_updates(self):
-        """检查是否有更新（模拟）"""
-        # 模拟检查：如果5秒内有其他用户更新，则提示
-        current_time = time.time()
-        last_editor_time = st.session_state.data_version.get('timestamp', 0)
-        last_editor = st.session_state.data_version.get('last_editor', '未知')
-        
-        # 如果不是当前用户编辑的，并且是最近5秒内的更新
-        if last_editor != st.session_state.user_name and (current_time - last_editor_time) < 5:
-            return {
-                'has_updates': True,
-                'last_editor': last_editor,
-                'time_since_update': current_time - last_editor_time
-            }
-        
-        return {'has_updates': False}
+        """检查房间中是否有其他成员的更新（只读取已看到版本之后的操作）"""
+        return self.member.updates_since(st.session_state.sync_status['seen_version'],
+                                         st.session_state.get('user_name'))
     
     def perform_auto_sync(self):
         """执行自动同步（后台）"""
         update_check = self.check_for_updates()
         
+        # 数据已在共享存储中，这里只需记录已同步到的版本
+        st.session_state.sync_status['seen_version'] = update_check['latest_version']
+        
         if update_check['has_updates']:
-            # 标记同步状态
             st.session_state.sync_status['last_sync'] = time.time()
             st.session_state.sync_status['auto_sync_count'] += 1
-            
-            # 在实际应用中，这里应该从服务器获取并合并数据
-            # 这里我们只是更新状态
             return True
         
         return False
@@ -500,14 +214,190 @@ class SmartCollaborativeManager:
         else:
             return f"⏳ {last_sync_ago}秒前同步"
 
+def sync_input_value(key, value):
+    """共享数据被其他成员修改后，刷新对应输入框显示的值"""
+    seen_key = f"{key}__seen"
+    if st.session_state.get(seen_key) != value:
+        st.session_state[key] = value
+        st.session_state[seen_key] = value
+
+# 记录较多时只渲染当前页；超过阈值的日期默认使用表格模式（一个 st.dataframe 代替逐条卡片）
+PAGE_SIZE = 20
+COMPACT_THRESHOLD = 50
+
+def paginate(records, key, page_size=PAGE_SIZE):
+    """返回 (起始序号, 当前页的记录)，记录超过一页时显示翻页按钮"""
+    total = len(records)
+    pages = max(1, -(-total // page_size))
+    page_key = f"{key}_page"
+    page = min(st.session_state.get(page_key, 1), pages)
+    if pages > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("◀ 上一页", key=f"{key}_prev", disabled=page <= 1, use_container_width=True):
+                page -= 1
+        with col3:
+            if st.button("下一页 ▶", key=f"{key}_next", disabled=page >= pages, use_container_width=True):
+                page += 1
+        with col2:
+            st.caption(f"第 {page}/{pages} 页，共 {total} 条")
+    st.session_state[page_key] = page
+    start = (page - 1) * page_size
+    return start, records[start:start + page_size]
+
+def compact_mode_toggle(records, key):
+    """是否以表格显示（记录很多时默认开启）"""
+    return st.toggle("📋 表格模式", value=len(records) > COMPACT_THRESHOLD, key=f"{key}_compact",
+                     help="以表格显示当天全部记录，勾选行后可批量删除")
+
+def selectable_table(rows, ids, key):
+    """显示可多选行的表格（ids 为各行记录的 ID），返回选中记录的 ID
+
+    表格的选择按行号保存，数据变化后也会保留：行号按上一次画出的表格换算成 ID，
+    其他成员在此期间增删记录不会让这里删错；已被删除的记录不再返回。
+    """
+    ids_key = f"{key}_table_ids"
+    shown = st.session_state.get(ids_key, [])
+    event = st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True,
+                         on_select="rerun", selection_mode="multi-row", key=f"{key}_table")
+    st.session_state[ids_key] = list(ids)
+    current = set(ids)
+    return [shown[row] for row in event.selection.rows if row < len(shown) and shown[row] in current]
+
+def report_merged(merged):
+    """修改与其他成员的修改发生冲突并已自动合并时提示"""
+    if merged:
+        st.toast("其他成员刚刚也修改了这条记录，已自动合并（名单取并集，其余以较新的修改为准）")
+
+def edit_itinerary_popover(member, item):
+    """修改一条行程；提交时带上读取时的记录版本号，期间被他人修改过则按规则合并"""
+    with st.popover("✏️"):
+        with st.form(key=f"edit_itinerary_{item['id']}"):
+            time_range = st.text_input("时间段", value=item.get('time', ''))
+            project = st.text_input("具体项目", value=item.get('project', ''))
+            transport = st.text_input("交通工具", value=item.get('transport', ''))
+            location = st.text_input("具体地点", value=item.get('location', ''))
+            traveler_ids = member.state.traveler_ids()
+            participants = st.multiselect("相关人员", traveler_ids,
+                                          default=[ref for ref in item.get('participants', []) if ref in traveler_ids],
+                                          format_func=member.state.travelers.name_of)
+            if st.form_submit_button("保存", type="primary") and time_range and project:
+                changes = {'time': time_range, 'project': project, 'transport': transport,
+                           'location': location, 'participants': participants}
+                record, merged = member.itinerary.update(item['id'], changes, item.get('rev', 0),
+                                                         st.session_state.traveler_id,
+                                                         editor=st.session_state.user_name)
+                if record is None:
+                    st.warning("这条行程已被其他成员删除")
+                else:
+                    report_merged(merged)
+                    collab.record_update("修改行程", project)
+                    rerun_after_change("itinerary", "edit_itinerary_save")
+
+def edit_expense_popover(member, day_str, expense):
+    """修改一条开销，规则同 edit_itinerary_popover"""
+    with st.popover("✏️"):
+        with st.form(key=f"edit_expense_{expense['id']}"):
+            item = st.text_input("具体项目", value=expense.get('item', ''))
+            amount = st.number_input("金额（元）", min_value=0.0, max_value=float(MAX_AMOUNT), step=1.0,
+                                     format="%.2f", value=float(expense.get('amount', 0)))
+            changes = {}
+            if expense.get('category') != PERSONAL_CATEGORY:
+                traveler_ids = member.state.traveler_ids()
+                changes['sharers'] = st.multiselect(
+                    "分摊人员", traveler_ids,
+                    default=[ref for ref in expense.get('sharers', []) if ref in traveler_ids],
+                    format_func=member.state.travelers.name_of)
+            if st.form_submit_button("保存", type="primary") and item and amount > 0:
+                changes.update(item=item, amount=amount)
+                if 'sharers' in changes and expense.get('payer') not in changes['sharers']:
+                    changes['sharers'].append(expense.get('payer'))
+                record, merged = member.ledger.update(day_str, expense['id'], changes, expense.get('rev', 0),
+                                                     st.session_state.traveler_id,
+                                                     editor=st.session_state.user_name)
+                if record is None:
+                    st.warning("这笔开销已被其他成员删除")
+                else:
+                    report_merged(merged)
+                    collab.record_update("修改开销", f"{item}: ¥{amount}")
+                    rerun_after_change("ledger", "edit_expense_save")
+
 # 初始化协作管理器
 collab = SmartCollaborativeManager()
+room = collab.room
+
+# 实时更新：只重新运行下面的片段检查房间版本号，有区域依赖的数据被修改时才刷新整个页面
+LIVE_UPDATE_INTERVAL = 0.5
+# 在线成员列表的刷新间隔（秒）
+PRESENCE_INTERVAL = 5
+
+@st.fragment(run_every=LIVE_UPDATE_INTERVAL)
+def render_sync_indicator():
+    """同步状态指示器，同时负责感知其他成员的修改"""
+    if collab.stale_regions():
+        collab.perform_auto_sync()
+        rerun_page("auto_sync")
+    
+    sync_text = collab.get_sync_status_text()
+    st.markdown(f"""
+    <div class='sync-indicator synced'>
+        <span class='dot'></span>
+        {sync_text}
+    </div>
+    """, unsafe_allow_html=True)
+
+def data_region(name, *sections):
+    """把页面区域的渲染函数包装为片段，并声明它依赖的数据部分
+
+    区域内的按钮、输入框只重新运行该区域；每次渲染时记录所依赖数据部分的版本号，
+    之后这些部分被修改，区域即视为过期。
+    """
+    def decorator(render):
+        @st.fragment
+        @functools.wraps(render)
+        def region():
+            collab.mark_rendered(name, sections)
+            with metrics.timer(name):
+                render()
+        return region
+    return decorator
+
+def timed(name):
+    """统计渲染函数的耗时（用于不依赖数据部分的片段）"""
+    def decorator(render):
+        @functools.wraps(render)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(name):
+                return render(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def rerun_page(trigger):
+    """重新运行整个页面；trigger 为触发来源（通常是按钮的 key），用于统计重新运行次数"""
+    metrics.count('rerun', trigger)
+    st.rerun()
+
+def rerun_region(trigger):
+    """只重新运行当前区域；本次是整页运行时（片段不能单独重跑）重新运行整个页面"""
+    metrics.count('rerun', trigger)
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def rerun_after_change(region, trigger):
+    """修改数据后重新运行：其他区域不依赖这次修改时只刷新当前区域"""
+    if collab.stale_regions(exclude=region):
+        rerun_page(trigger)
+    rerun_region(trigger)
 
 # 主标题
 st.markdown("<h1 class='main-header'>✈️ Travel-Together 旅行结伴</h1>", unsafe_allow_html=True)
 
 # ========== 智能协作状态栏 ==========
-with st.container():
+# 整页运行时各区域重新登记依赖（尚未渲染的区域不参与过期检查）
+st.session_state.region_versions = {}
+with metrics.timer("status_bar"), st.container():
     col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
     
     with col1:
@@ -538,96 +428,66 @@ with st.container():
                                key="room_id_input")
         # 如果房间ID发生变化，需要重新获取用户名
         if room_id != st.session_state.room_id:
+            collab.member.presence.leave()
             st.session_state.room_id = room_id
+            room = collab.room
+            st.session_state.sync_status['seen_version'] = room.data_version['number']
             # 房间变化时，确保更新用户名
             collab.update_user_activity()
     
     with col3:
         # 用户设置 - 显示当前用户名并允许修改
         current_user_name = st.session_state.user_name
+        sync_input_value("user_name_input", current_user_name)
         new_user_name = st.text_input("你的昵称", 
-                                     value=current_user_name,
                                      key="user_name_input")
         
         # 如果用户修改了名字，更新到房间映射中
         if new_user_name != current_user_name and new_user_name:
-            user_room_key = f"{st.session_state.user_id}_{st.session_state.room_id}"
-            st.session_state.user_room_names[user_room_key] = new_user_name
+            collab.member.rename(st.session_state.traveler_id, new_user_name)
             st.session_state.user_name = new_user_name
             
-            # 更新旅行者名单
-            if current_user_name in st.session_state.travelers:
-                index = st.session_state.travelers.index(current_user_name)
-                st.session_state.travelers[index] = new_user_name
-            
-            # 更新所有行程和开销中的参与者名字
-            for day, items in st.session_state.itinerary.items():
-                for item in items:
-                    if 'participants' in item and current_user_name in item['participants']:
-                        item['participants'] = [new_user_name if x == current_user_name else x for x in item['participants']]
-                    if 'editor' in item and item['editor'] == current_user_name:
-                        item['editor'] = new_user_name
-            
-            for day, expenses in st.session_state.expenses.items():
-                for expense in expenses:
-                    if 'payer' in expense and expense['payer'] == current_user_name:
-                        expense['payer'] = new_user_name
-                    if 'sharers' in expense and current_user_name in expense['sharers']:
-                        expense['sharers'] = [new_user_name if x == current_user_name else x for x in expense['sharers']]
-                    if 'editor' in expense and expense['editor'] == current_user_name:
-                        expense['editor'] = new_user_name
-            
-            collab.increment_data_version("修改昵称", f"{current_user_name} -> {new_user_name}")
-            st.rerun()
+            collab.record_update("修改昵称", f"{current_user_name} -> {new_user_name}")
+            rerun_page("user_name_input")
     
     with col4:
+        # 状态栏中的昵称来自人员名单
+        collab.mark_rendered("page", ("travelers",))
         # 同步状态指示器
-        sync_text = collab.get_sync_status_text()
-        st.markdown(f"""
-        <div class='sync-indicator synced'>
-            <span class='dot'></span>
-            {sync_text}
-        </div>
-        """, unsafe_allow_html=True)
-
-# 显示在线用户
-st.markdown("### 👥 在线成员")
-online_users = collab.get_online_users()
-if online_users:
-    # 创建列布局显示在线用户
-    cols = st.columns(min(4, len(online_users)))
-    
-    for idx, user in enumerate(online_users):
-        with cols[idx % len(cols)]:
-            is_you = (user['user_id'] == st.session_state.user_id)
-            user_class = "user-indicator user-you" if is_you else "user-indicator"
+        render_sync_indicator()
+
+# 在线成员只随心跳变化，单独定时刷新
+@st.fragment(run_every=PRESENCE_INTERVAL)
+@timed("presence")
+def render_presence():
+    """在线成员列表"""
+    st.markdown("### 👥 在线成员")
+    online_users = collab.get_online_users()
+    if online_users:
+        # 创建列布局显示在线用户
+        cols = st.columns(min(4, len(online_users)))
+    
+        for idx, user in enumerate(online_users):
+            with cols[idx % len(cols)]:
+                is_you = (user['user_id'] == st.session_state.user_id)
+                user_class = "user-indicator user-you" if is_you else "user-indicator"
             
-            st.markdown(f"""
-            <div class='{user_class}' style='border-color: {user.get('color', '#1E88E5')};'>
-                <span class='online-status online' style='background-color: {user.get('color', '#4CAF50')};'></span>
-                <strong>{user['user_name']}{" (你)" if is_you else ""}</strong>
-            </div>
-            """, unsafe_allow_html=True)
-else:
-    st.info("等待其他成员加入...")
-
-# ========== 自动后台同步提示 ==========
-# 检查是否有最近更新
-update_check = collab.check_for_updates()
-if update_check.get('has_updates'):
-    time_since = int(update_check['time_since_update'])
-    
-    # st.markdown(f"""
-    # <div class='auto-update-notice'>
-    #     <strong>🔄 数据已自动同步！</strong><br>
-    #     刚刚由 <b>{update_check['last_editor']}</b> 更新了数据
-    # </div>
-    # """, unsafe_allow_html=True)
+                st.markdown(f"""
+                <div class='{user_class}' style='border-color: {user.get('color', '#1E88E5')};'>
+                    <span class='online-status online' style='background-color: {user.get('color', '#4CAF50')};'></span>
+                    <strong>{html.escape(user['user_name'])}{" (你)" if is_you else ""}</strong>
+                </div>
+                """, unsafe_allow_html=True)
+    else:
+        st.info("等待其他成员加入...")
+
+render_presence()
 
+# ========== 最近活动 ==========
 # 显示最近更新历史（简洁版）
-if st.session_state.recent_updates and len(st.session_state.recent_updates) > 0:
+if room.recent_updates and len(room.recent_updates) > 0:
     with st.expander("📝 最近活动", expanded=False):
-        for update in st.session_state.recent_updates[:3]:  # 只显示最近3条
+        for update in room.recent_updates[:3]:  # 只显示最近3条
             time_ago = int(time.time() - update['timestamp'])
             if time_ago < 60:
                 time_text = f"{time_ago}秒前"
@@ -644,88 +504,81 @@ st.markdown("---")
 tab1, tab2, tab3 = st.tabs(["👥 同行人员", "🗓️ 行程计划", "💰 开销账单"])
 
 # ========== TAB 1: 同行人员 ==========
-with tab1:
+@data_region("people", "travelers")
+def render_people_tab():
+    """同行人员：只依赖人员名单"""
+    room = collab.room
     st.header("同行人员管理")
     
     # 显示当前在线成员自动加入
     st.markdown("**👥 已加入的成员:**")
-    for user in online_users:
+    for user in collab.get_online_users():
         st.write(f"• {user['user_name']}")
     
     st.markdown("---")
     
+    # 人员名单的快照，本区域内都使用它
+    travelers_snapshot = room.traveler_records()
+    
     col1, col2 = st.columns([3, 1])
     with col1:
-        st.info(f"当前同行人数: {len(st.session_state.travelers)} 人")
+        st.info(f"当前同行人数: {len(travelers_snapshot)} 人")
     
     with col2:
         if st.button("➕ 添加人员", use_container_width=True, key="add_person_btn"):
-            # 生成一个新的旅行者名字
-            used_numbers = set()
-            for traveler in st.session_state.travelers:
-                if traveler.startswith("旅行者"):
-                    try:
-                        num = int(traveler[3:])
-                        used_numbers.add(num)
-                    except:
-                        pass
-            
-            # 找出最小未使用的编号
-            next_num = 1
-            while next_num in used_numbers:
-                next_num += 1
-            
-            new_traveler = f"旅行者{next_num}"
-            st.session_state.travelers.append(new_traveler)
-            st.session_state.traveler_ids.append(str(uuid.uuid4())[:8])
-            collab.increment_data_version("添加人员", new_traveler)
-            st.rerun()
+            # 使用最小的未使用编号作为名字
+            new_traveler = collab.member.add_traveler(editor=st.session_state.user_name)
+            collab.record_update("添加人员", new_traveler)
+            rerun_after_change("people", "add_person_btn")
     
     # 显示并编辑人员列表
-    updated_travelers = []
-    updated_traveler_ids = []
-    
-    for i, traveler in enumerate(st.session_state.travelers):
+    for i, (traveler_id, traveler) in enumerate(travelers_snapshot):
         cols = st.columns([3, 1])
         with cols[0]:
-            traveler_id = st.session_state.traveler_ids[i] if i < len(st.session_state.traveler_ids) else str(uuid.uuid4())[:8]
+            sync_input_value(f"traveler_input_{traveler_id}", traveler)
             new_name = st.text_input(f"人员 {i+1} 姓名", 
-                                   value=traveler,
                                    key=f"traveler_input_{traveler_id}")
-            updated_travelers.append(new_name)
-            updated_traveler_ids.append(traveler_id)
+            # 只写回有变化的名字，避免覆盖其他成员的修改
+            if new_name and new_name != traveler:
+                collab.member.rename_traveler(traveler_id, new_name, editor=st.session_state.user_name)
+                collab.record_update("修改人员", f"{traveler} -> {new_name}")
+                rerun_after_change("people", "traveler_input")
         with cols[1]:
             # 不能删除当前用户自己
-            if len(st.session_state.travelers) > 1 and traveler != st.session_state.user_name:
+            if len(travelers_snapshot) > 1 and traveler_id != st.session_state.traveler_id:
                 if st.button("❌", key=f"del_person_{traveler_id}"):
-                    st.session_state.travelers.pop(i)
-                    if i < len(st.session_state.traveler_ids):
-                        st.session_state.traveler_ids.pop(i)
-                    collab.increment_data_version("删除人员", traveler)
-                    st.rerun()
+                    collab.member.remove_traveler(traveler_id, editor=st.session_state.user_name)
+                    collab.record_update("删除人员", traveler)
+                    rerun_after_change("people", "del_person")
             else:
                 st.write("")  # 占位
     
-    # 更新旅行者名单
-    st.session_state.travelers = updated_travelers
-    st.session_state.traveler_ids = updated_traveler_ids
-    
     st.markdown("---")
     st.subheader("当前同行人员")
-    for i, traveler in enumerate(st.session_state.travelers):
-        is_current_user = traveler == st.session_state.user_name
+    for i, (traveler_id, traveler) in enumerate(travelers_snapshot):
+        is_current_user = traveler_id == st.session_state.traveler_id
         st.write(f"👤 **{i+1}. {traveler}{' (你)' if is_current_user else ''}**")
 
+with tab1:
+    render_people_tab()
+
 # ========== TAB 2: 行程计划 ==========
-with tab2:
+@data_region("itinerary", "itinerary", "travelers", "days")
+def render_itinerary_day():
+    """当天行程：翻页、选时间段等操作只刷新本区域"""
+    member = collab.member
+    room = member.state
     st.header("行程计划")
     
     # 天数控制
     col1, col2, col3 = st.columns([2, 1, 1])
     with col1:
         days = st.slider("旅行天数", min_value=1, max_value=30, 
-                        value=st.session_state.total_days, key="days_slider")
-        st.session_state.total_days = days
+                        value=room.total_days, key="days_slider")
+        if days != room.total_days:
+            member.set_total_days(days, editor=st.session_state.user_name)
+            collab.record_update("修改天数", f"{days}天")
+            rerun_after_change("itinerary", "days_slider")
     
     with col2:
         if st.button("◀️ 前一天", use_container_width=True, key="prev_day_btn"):
@@ -734,7 +587,7 @@ with tab2:
     
     with col3:
         if st.button("后一天 ▶️", use_container_width=True, key="next_day_btn"):
-            if st.session_state.current_day < st.session_state.total_days:
+            if st.session_state.current_day < room.total_days:
                 st.session_state.current_day += 1
     
     # 显示当前天数
@@ -742,44 +595,64 @@ with tab2:
     
     # 初始化当天的行程
     current_day_str = str(st.session_state.current_day)
-    if current_day_str not in st.session_state.itinerary:
-        st.session_state.itinerary[current_day_str] = []
+    # 行程索引已按开始时间排好序，复制一份列表避免渲染时被其他会话修改
+    sorted_items, conflicts = member.itinerary.day_items(current_day_str)
     
     # ========== 显示当天的行程 ==========
     st.subheader("当日行程安排")
     
-    if st.session_state.itinerary[current_day_str]:
-        # 按时间排序
-        sorted_items = sorted(st.session_state.itinerary[current_day_str], 
-                            key=lambda x: x.get('time', '').split('-')[0])
-        
-        for idx, item in enumerate(sorted_items):
-            with st.container():
-                col1, col2 = st.columns([4, 1])
-                with col1:
-                    participants_text = ', '.join(item.get('participants', [])) if item.get('participants') else "所有人"
+    for earlier, later, names in conflicts:
+        st.warning(f"⚠️ 时间冲突：{', '.join(room.travelers.names_of(names))} 的 "
+                   f"{earlier.get('time', '')} {earlier.get('project', '')} 与 "
+                   f"{later.get('time', '')} {later.get('project', '')} 重叠")
+    
+    if sorted_items:
+        itinerary_key = f"itinerary_{current_day_str}"
+        if compact_mode_toggle(sorted_items, itinerary_key):
+            selected = selectable_table([{
+                '时间': item.get('time', ''),
+                '项目': item.get('project', ''),
+                '交通': item.get('transport', ''),
+                '地点': item.get('location', ''),
+                '参与人员': ', '.join(room.travelers.names_of(item['participants'])) if item.get('participants') else "所有人",
+                '添加人': room.travelers.name_of(item.get('editor', '未知')),
+            } for item in sorted_items], [item['id'] for item in sorted_items], itinerary_key)
+            if selected and st.button(f"🗑️ 删除选中的 {len(selected)} 项行程", key=f"{itinerary_key}_delete"):
+                itinerary = member.itinerary
+                for item_id in selected:
+                    itinerary.delete(current_day_str, item_id, editor=st.session_state.user_name)
+                collab.record_update("删除行程", f"{len(selected)} 项")
+                rerun_after_change("itinerary", "itinerary_table_delete")
+        else:
+            # 只为当前页的行程创建卡片和按钮
+            start, page_items = paginate(sorted_items, itinerary_key)
+            for idx, item in enumerate(page_items, start):
+                with st.container():
+                    col1, col2 = st.columns([4, 1])
+                    with col1:
+                        participants_text = ', '.join(room.travelers.names_of(item['participants'])) if item.get('participants') else "所有人"
                     
-                    # 检查是否为最近更新（30秒内）
-                    is_recent = time.time() - item.get('edit_time', 0) < 30
-                    recent_class = " recent-update" if is_recent else ""
+                        # 检查是否为最近更新（30秒内）
+                        is_recent = time.time() - item.get('edit_time', 0) < 30
+                        recent_class = " recent-update" if is_recent else ""
                     
-                    st.markdown(f"""
-                    <div class='day-card{recent_class}'>
-                        <span class='time'>🕐 {item.get('time', '未设置')}</span> - <b>{item.get('project', '未命名')}</b><br>
-                        🚗 <b>交通</b>：{item.get('transport', '未填写')}<br>
-                        📍 <b>地点</b>：{item.get('location', '未填写')}<br>
-                        👥 <b>参与人员</b>：{participants_text}
-                        <div class='edit-indicator'>由 {item.get('editor', '未知')} 添加</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                with col2:
-                    if st.button("删除", key=f"del_itinerary_{current_day_str}_{item.get('id', idx)}"):
-                        st.session_state.itinerary[current_day_str] = [
-                            i for i in st.session_state.itinerary[current_day_str] 
-                            if i.get('id') != item.get('id')
-                        ]
-                        collab.increment_data_version("删除行程", item.get('project', ''))
-                        st.rerun()
+                        # 其他成员输入的文字都要转义后再放进 HTML
+                        st.markdown(f"""
+                        <div class='day-card{recent_class}'>
+                            <span class='time'>🕐 {html.escape(item.get('time', '未设置'))}</span> - <b>{html.escape(item.get('project', '未命名'))}</b><br>
+                            🚗 <b>交通</b>：{html.escape(item.get('transport', '未填写'))}<br>
+                            📍 <b>地点</b>：{html.escape(item.get('location', '未填写'))}<br>
+                            👥 <b>参与人员</b>：{html.escape(participants_text)}
+                            <div class='edit-indicator'>由 {html.escape(room.travelers.name_of(item.get('editor', '未知')))} 添加</div>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    with col2:
+                        if item.get('id'):
+                            edit_itinerary_popover(member, item)
+                        if st.button("删除", key=f"del_itinerary_{current_day_str}_{item.get('id', idx)}"):
+                            member.itinerary.delete(current_day_str, item.get('id'), editor=st.session_state.user_name)
+                            collab.record_update("删除行程", item.get('project', ''))
+                            rerun_after_change("itinerary", "del_itinerary")
     else:
         st.info("暂无行程安排，请点击下方按钮添加行程项目。")
     
@@ -804,10 +677,10 @@ with tab2:
                         type="primary" if is_selected else "secondary"):
                 st.session_state[time_key] = time_slot
                 st.session_state.show_add_itinerary = True
-                st.rerun()
+                rerun_region("time_btn")
     
     # ========== 添加行程的表单 ==========
-    if st.session_state.show_add_itinerary or not st.session_state.itinerary[current_day_str]:
+    if st.session_state.show_add_itinerary or not sorted_items:
         with st.expander("✏️ 添加行程项目", expanded=True):
             col1, col2 = st.columns(2)
             with col1:
@@ -822,9 +695,11 @@ with tab2:
                 location = st.text_input("具体地点", placeholder="例如：北京市东城区", 
                                        key=f"location_input_{current_day_str}")
             
+            # 选项为人员ID，显示名字
             participants = st.multiselect("相关人员", 
-                                        st.session_state.travelers,
-                                        default=[st.session_state.user_name],
+                                        room.traveler_ids(),
+                                        default=[st.session_state.traveler_id],
+                                        format_func=room.travelers.name_of,
                                         key=f"participants_select_{current_day_str}")
             
             col1, col2 = st.columns(2)
@@ -832,135 +707,74 @@ with tab2:
                 if st.button("✅ 确认添加", type="primary", use_container_width=True, 
                            key=f"confirm_itinerary_{current_day_str}"):
                     if time_range and project:
-                        new_item = {
-                            'time': time_range,
-                            'project': project,
-                            'transport': transport,
-                            'location': location,
-                            'participants': participants,
-                            'id': str(uuid.uuid4())[:8],
-                            'editor': st.session_state.user_name,
-                            'edit_time': time.time()
-                        }
-                        st.session_state.itinerary[current_day_str].append(new_item)
+                        member.itinerary.add(current_day_str, time_range, project, transport, location, participants,
+                                             editor_id=st.session_state.traveler_id,
+                                             editor=st.session_state.user_name)
                         st.success("行程添加成功！")
-                        collab.increment_data_version("添加行程", project)
+                        collab.record_update("添加行程", project)
                         st.session_state.show_add_itinerary = False
-                        st.rerun()
+                        rerun_after_change("itinerary", "confirm_itinerary")
             
             with col2:
                 if st.button("❌ 取消", use_container_width=True, 
                            key=f"cancel_itinerary_{current_day_str}"):
                     st.session_state.show_add_itinerary = False
-                    st.rerun()
+                    rerun_region("cancel_itinerary")
     else:
         if st.button("➕ 添加新行程", type="primary", use_container_width=True,
                    key=f"add_new_itinerary_{current_day_str}"):
             st.session_state.show_add_itinerary = True
-            st.rerun()
+            rerun_region("add_new_itinerary")
+
+with tab2:
+    render_itinerary_day()
 
 # ========== TAB 3: 开销账单 ==========
-with tab3:
+@data_region("ledger", "expenses", "travelers", "days")
+def render_expense_ledger():
+    """开销账单：汇总、转账方案与当天开销"""
+    member = collab.member
+    room = member.state
     st.header("旅行开销账单")
     
     # ========== 选择要查看/编辑的天数 ==========
     expense_day = st.selectbox("选择日期", 
-                              range(1, st.session_state.total_days + 1),
+                              range(1, room.total_days + 1),
                               key="expense_day_select_main")
     
     expense_day_str = str(expense_day)
-    if expense_day_str not in st.session_state.expenses:
-        st.session_state.expenses[expense_day_str] = []
     
     # ========== 实时账单汇总表格 ==========
     st.subheader("💰 实时账单汇总")
     
-    def calculate_payment_summary():
-        summary = {}
-        for day_expenses in st.session_state.expenses.values():
-            for expense in day_expenses:
-                payer = expense.get('payer', '')
-                if payer not in summary:
-                    summary[payer] = {
-                        'total_paid': 0.0,
-                        'categories': defaultdict(float)
-                    }
-                
-                summary[payer]['total_paid'] += expense.get('amount', 0.0)
-                summary[payer]['categories'][expense.get('category', '其他')] += expense.get('amount', 0.0)
-        
-        return summary
-    
-    def calculate_simple_aa_summary():
-        aa_expenses_by_group = defaultdict(list)
-        
-        for day_expenses in st.session_state.expenses.values():
-            for expense in day_expenses:
-                if expense.get('category') != '个人' and 'sharers' in expense:
-                    sharers = list(expense.get('sharers', []))
-                    payer = expense.get('payer', '')
-                    
-                    if payer not in sharers:
-                        sharers.append(payer)
-                    
-                    sharers_key = tuple(sorted(sharers))
-                    aa_expenses_by_group[sharers_key].append({
-                        **expense,
-                        'sharers': sharers
-                    })
-        
-        aa_results = {}
-        
-        for sharers, expenses in aa_expenses_by_group.items():
-            total_amount = sum(e.get('amount', 0.0) for e in expenses)
-            num_sharers = len(sharers)
-            average_per_person = total_amount / num_sharers if num_sharers > 0 else 0
-            
-            payments = {traveler: 0.0 for traveler in sharers}
-            for expense in expenses:
-                payer = expense.get('payer', '')
-                payments[payer] += expense.get('amount', 0.0)
-            
-            differences = {}
-            for traveler in sharers:
-                differences[traveler] = payments[traveler] - average_per_person
-            
-            aa_results[sharers] = {
-                'total_amount': total_amount,
-                'average_per_person': average_per_person,
-                'payments': payments,
-                'differences': differences
-            }
-        
-        return aa_results
-    
-    # 创建汇总表格
-    payment_summary = calculate_payment_summary()
-    aa_results = calculate_simple_aa_summary()
-    
+    # 创建汇总表格（结算引擎按数据版本增量更新，不再每次扫描全部开销）
+    with metrics.timer("settlement"):
+        settlement = get_settlement_engine(room.room_id)
+        settlement.sync(collab.registry, room)
+        payment_summary = settlement.payment_summary()
+        traveler_balances = settlement.traveler_balances()
+        transfers = settlement.transfers()
+    
+    # 金额均为整数分：应摊按最大余数法分配，净额为 0 即精确平衡
+    traveler_records = room.traveler_records()
+    traveler_ids = [traveler_id for traveler_id, _ in traveler_records]
     summary_data = []
-    for traveler in st.session_state.travelers:
-        total_paid = payment_summary.get(traveler, {}).get('total_paid', 0.0)
-        
-        total_owed = 0.0
-        for result in aa_results.values():
-            if traveler in result['differences']:
-                total_owed += result['differences'][traveler]
-        
-        net_amount = total_paid - total_owed
+    for traveler_id, traveler in traveler_records:
+        total_paid = payment_summary.get(traveler_id, {}).get('total_paid', 0)
+        total_owed, net_amount = traveler_balances.get(traveler_id, (0, 0))
         
         category_stats = []
-        if traveler in payment_summary:
-            for category, amount in payment_summary[traveler]['categories'].items():
-                category_stats.append(f"{category}:¥{amount:.1f}")
+        if traveler_id in payment_summary:
+            for category, amount in payment_summary[traveler_id]['categories'].items():
+                category_stats.append(f"{category}:{format_yuan(amount, 1)}")
         
         summary_data.append({
             '姓名': traveler,
-            '总支付金额': f"¥{total_paid:.2f}",
+            '总支付金额': format_yuan(total_paid),
             '类别统计': ', '.join(category_stats) if category_stats else "无",
-            '人均应付': f"¥{total_owed:.2f}" if total_owed != 0 else "¥0.00",
-            '净额': f"应收¥{abs(net_amount):.2f}" if net_amount > 0.01 else 
-                   f"应付¥{abs(net_amount):.2f}" if net_amount < -0.01 else "已平衡"
+            '人均应付': format_yuan(total_owed),
+            '净额': f"应收{format_yuan(net_amount)}" if net_amount > 0 else 
+                   f"应付{format_yuan(-net_amount)}" if net_amount < 0 else "已平衡"
         })
     
     if summary_data:
@@ -968,61 +782,87 @@ with tab3:
         st.dataframe(df_summary, use_container_width=True, hide_index=True)
     else:
         st.info("暂无开销记录")
-    
+
+    # ========== 转账方案 ==========
+    st.subheader("💸 结算转账方案")
+    if transfers:
+        st.caption(f"最少只需 {len(transfers)} 笔转账即可结清")
+        for debtor, creditor, amount_cents in transfers:
+            st.markdown(f"**{room.travelers.name_of(debtor)}** 👉 **{room.travelers.name_of(creditor)}**: "
+                        f"{format_yuan(amount_cents)}")
+    else:
+        st.caption("所有人已结清，无需转账")
+
     st.markdown("---")
     
     # ========== 显示当天的开销 ==========
     st.subheader(f"第 {expense_day} 天开销记录")
-    total_day_expense = 0
-    aa_total = 0
+    # 当日合计来自结算引擎的列式账本
+    total_day_expense, aa_total = settlement.day_totals().get(expense_day_str, (0, 0))
     
-    if st.session_state.expenses[expense_day_str]:
-        for expense_idx, expense in enumerate(st.session_state.expenses[expense_day_str]):
-            is_personal = expense.get('category') == '个人'
-            css_class = "personal-expense" if is_personal else "expense-item"
+    day_expenses = member.ledger.day_expenses(expense_day_str)
+
+    if day_expenses:
+        expense_key = f"expenses_{expense_day_str}"
+        if compact_mode_toggle(day_expenses, expense_key):
+            selected = selectable_table([{
+                '项目': expense.get('item', '未命名'),
+                '金额': f"{expense.get('amount', 0):.2f}",
+                '类别': expense.get('category', '未分类'),
+                '付款人': room.travelers.name_of(expense.get('payer', '未知')),
+                '分摊': ', '.join(room.travelers.names_of(expense.get('sharers', []))),
+                '记录人': room.travelers.name_of(expense.get('editor', '未知')),
+            } for expense in day_expenses], [expense['id'] for expense in day_expenses], expense_key)
+            if selected and st.button(f"🗑️ 删除选中的 {len(selected)} 笔开销", key=f"{expense_key}_delete"):
+                ledger = member.ledger
+                for expense_id in selected:
+                    ledger.delete(expense_day_str, expense_id, editor=st.session_state.user_name)
+                collab.record_update("删除开销", f"{len(selected)} 笔")
+                rerun_after_change("ledger", "expense_table_delete")
+        else:
+            # 只为当前页的开销创建卡片和按钮
+            start, page_expenses = paginate(day_expenses, expense_key)
+            for expense_idx, expense in enumerate(page_expenses, start):
+                is_personal = expense.get('category') == PERSONAL_CATEGORY
+                css_class = "personal-expense" if is_personal else "expense-item"
             
-            # 检查是否为最近更新
-            is_recent = time.time() - expense.get('edit_time', 0) < 30
-            if is_recent:
-                css_class += " recent-update"
+                # 检查是否为最近更新
+                is_recent = time.time() - expense.get('edit_time', 0) < 30
+                if is_recent:
+                    css_class += " recent-update"
             
-            sharers_text = ""
-            if not is_personal and 'sharers' in expense:
-                sharers_count = len(expense['sharers'])
-                all_travelers_count = len(st.session_state.travelers)
-                if sharers_count == all_travelers_count:
-                    sharers_text = "👥 全体分摊"
-                else:
-                    sharers_text = f"👥 {sharers_count}人分摊: {', '.join(expense['sharers'])}"
+                sharers_text = ""
+                if not is_personal and 'sharers' in expense:
+                    sharers_count = len(expense['sharers'])
+                    all_travelers_count = len(traveler_ids)
+                    if sharers_count == all_travelers_count:
+                        sharers_text = "👥 全体分摊"
+                    else:
+                        sharers_text = f"👥 {sharers_count}人分摊: {', '.join(room.travelers.names_of(expense['sharers']))}"
             
-            with st.container():
-                col1, col2 = st.columns([5, 1])
-                with col1:
-                    st.markdown(f"""
-                    <div class='{css_class}'>
-                        <b>🧾 {expense.get('item', '未命名')}</b> - 💰 <b>{expense.get('amount', 0):.2f}元</b><br>
-                        🏷️ <b>类别</b>: {expense.get('category', '未分类')} | 
-                        👤 <b>付款人</b>: {expense.get('payer', '未知')}<br>
-                        {sharers_text}
-                        <div class='edit-indicator'>由 {expense.get('editor', '未知')} 记录</div>
-                    </div>
-                    """, unsafe_allow_html=True)
+                with st.container():
+                    col1, col2 = st.columns([5, 1])
+                    with col1:
+                        st.markdown(f"""
+                        <div class='{css_class}'>
+                            <b>🧾 {html.escape(expense.get('item', '未命名'))}</b> - 💰 <b>{expense.get('amount', 0):.2f}元</b><br>
+                            🏷️ <b>类别</b>: {html.escape(expense.get('category', '未分类'))} | 
+                            👤 <b>付款人</b>: {html.escape(room.travelers.name_of(expense.get('payer', '未知')))}<br>
+                            {html.escape(sharers_text)}
+                            <div class='edit-indicator'>由 {html.escape(room.travelers.name_of(expense.get('editor', '未知')))} 记录</div>
+                        </div>
+                        """, unsafe_allow_html=True)
                 
-                with col2:
-                    if st.button("删除", key=f"del_expense_{expense_day_str}_{expense.get('id', expense_idx)}"):
-                        st.session_state.expenses[expense_day_str] = [
-                            e for e in st.session_state.expenses[expense_day_str] 
-                            if e.get('id') != expense.get('id')
-                        ]
-                        collab.increment_data_version("删除开销", expense.get('item', ''))
-                        st.rerun()
-            
-            total_day_expense += expense.get('amount', 0.0)
-            if not is_personal:
-                aa_total += expense.get('amount', 0.0)
+                    with col2:
+                        if expense.get('id'):
+                            edit_expense_popover(member, expense_day_str, expense)
+                        if st.button("删除", key=f"del_expense_{expense_day_str}_{expense.get('id', expense_idx)}"):
+                            member.ledger.delete(expense_day_str, expense.get('id'), editor=st.session_state.user_name)
+                            collab.record_update("删除开销", expense.get('item', ''))
+                            rerun_after_change("ledger", "del_expense")
         
-        st.markdown(f"**当日总开销:** **¥{total_day_expense:.2f}**")
-        st.markdown(f"**当日参与AA总金额:** **¥{aa_total:.2f}**")
+        st.markdown(f"**当日总开销:** **{format_yuan(total_day_expense)}**")
+        st.markdown(f"**当日参与AA总金额:** **{format_yuan(aa_total)}**")
     else:
         st.info("暂无开销记录")
     
@@ -1034,183 +874,219 @@ with tab3:
     with st.expander("➕ 添加开销记录", expanded=True):
         col1, col2 = st.columns(2)
         with col1:
+            # 选项为人员ID，显示名字
             payer = st.selectbox("付款人", 
-                               st.session_state.travelers,
+                               traveler_ids,
+                               format_func=room.travelers.name_of,
                                key=f"payer_select_{form_key_suffix}")
             item = st.text_input("具体项目", 
                                placeholder="例如：午餐、门票",
                                key=f"expense_item_input_{form_key_suffix}")
         with col2:
             category = st.selectbox("种类", 
-                                  ["餐饮", "交通", "门票", "住宿", "购物", "个人"],
+                                  EXPENSE_CATEGORIES,
                                   key=f"category_select_{form_key_suffix}")
             amount = st.number_input("金额（元）", 
                                    min_value=0.0, 
+                                   max_value=float(MAX_AMOUNT),
                                    step=1.0,
                                    format="%.2f",
                                    key=f"amount_input_{form_key_suffix}")
         
         sharers = []
-        if category != "个人":
-            default_sharers = st.session_state.travelers.copy()
+        if category != PERSONAL_CATEGORY:
             sharers = st.multiselect("分摊人员（默认全选，付款人自动包含）",
-                                   st.session_state.travelers,
-                                   default=default_sharers,
+                                   traveler_ids,
+                                   default=traveler_ids,
+                                   format_func=room.travelers.name_of,
                                    key=f"sharers_select_{form_key_suffix}")
             
             if payer not in sharers:
                 sharers.append(payer)
-                st.info(f"已自动将付款人 {payer} 添加到分摊人员中")
+                st.info(f"已自动将付款人 {room.travelers.name_of(payer)} 添加到分摊人员中")
         
         col1, col2 = st.columns(2)
         with col1:
             if st.button("✅ 确认添加开销", type="primary", use_container_width=True,
                        key=f"confirm_expense_{form_key_suffix}"):
                 if item and amount > 0:
-                    new_expense = {
-                        'payer': payer,
-                        'item': item,
-                        'category': category,
-                        'amount': float(amount),
-                        'day': expense_day,
-                        'id': str(uuid.uuid4())[:8],
-                        'editor': st.session_state.user_name,
-                        'edit_time': time.time()
-                    }
-                    
-                    if category != "个人":
-                        if not sharers:
-                            sharers = st.session_state.travelers.copy()
-                            if payer not in sharers:
-                                sharers.append(payer)
-                        
-                        new_expense['sharers'] = sharers
-                    
-                    st.session_state.expenses[expense_day_str].append(new_expense)
+                    # 未选择分摊人员时默认全部人员
+                    member.ledger.add(expense_day_str, payer, item, category, amount, sharers,
+                                         editor_id=st.session_state.traveler_id, editor=st.session_state.user_name)
                     st.success("开销记录添加成功！")
-                    collab.increment_data_version("添加开销", f"{item}: ¥{amount}")
-                    st.rerun()
+                    collab.record_update("添加开销", f"{item}: ¥{amount}")
+                    rerun_after_change("ledger", "confirm_expense")
         
         with col2:
             if st.button("❌ 取消", use_container_width=True,
                        key=f"cancel_expense_{form_key_suffix}"):
-                st.rerun()
+                rerun_region("cancel_expense")
+
+with tab3:
+    render_expense_ledger()
 
 # ========== 数据导出/导入功能 ==========
-with st.sidebar:
-    st.header("📊 数据管理")
-    
-    # 协作说明
-    st.markdown("### 👥 多人协作说明")
-    st.markdown("""
-    1. **分享旅行团ID**给同伴
-    2. 同伴输入相同ID加入
-    3. **数据自动同步** (每30秒)
-    4. 所有人的修改会实时合并
-    """)
-    
-    # 显示当前协作状态
-    online_users = collab.get_online_users()
-    st.metric("在线人数", len(online_users))
-    st.caption(f"数据版本: {st.session_state.data_version['number']}")
-    
-    st.markdown("---")
-    
-    # 导出数据
+@st.fragment
+@timed("sidebar")
+def render_data_management():
+    """导出、导入与清空数据；导出只刷新本区域，导入和清空会重新运行整个页面"""
+    room = collab.room
+    export_format = st.radio("导出格式", list(EXPORT_FORMATS), horizontal=True,
+                             format_func=lambda fmt: EXPORT_FORMATS[fmt][0], key="export_format")
     if st.button("📥 导出数据", key="export_data_btn", use_container_width=True):
-        data = {
-            'room_id': st.session_state.room_id,
-            'travelers': st.session_state.travelers,
-            'itinerary': st.session_state.itinerary,
-            'expenses': st.session_state.expenses,
-            'total_days': st.session_state.total_days,
-            'traveler_ids': st.session_state.traveler_ids,
-            'data_version': st.session_state.data_version,
-            'user_room_names': st.session_state.user_room_names,
-            'user_id': st.session_state.user_id,
-            'export_time': time.time(),
-            'export_by': st.session_state.user_name
-        }
-        
-        json_str = json.dumps(data, ensure_ascii=False, indent=2)
+        # 同一数据版本只序列化一次，重复下载直接使用缓存
+        with metrics.timer("export"):
+            payload, _ = get_export_cache(room.room_id).get(room, export_format)
+        format_name, mime, extension = EXPORT_FORMATS[export_format]
         st.download_button(
-            label="下载JSON文件",
-            data=json_str,
-            file_name=f"travel_together_{st.session_state.room_id}_{datetime.now().strftime('%Y%m%d_%H%M')}.json",
-            mime="application/json",
+            label=f"下载{format_name}文件（{len(payload) / 1024:.1f} KB）",
+            data=payload,
+            file_name=f"travel_together_{st.session_state.room_id}_{datetime.now().strftime('%Y%m%d_%H%M')}.{extension}",
+            mime=mime,
             key="download_data_btn"
         )
     
     # 导入数据
     st.markdown("### 导入数据")
-    uploaded_file = st.file_uploader("选择JSON文件", type=['json'], 
-                                    help="导入之前导出的旅行数据", key="upload_data")
+    uploaded_file = st.file_uploader("选择导出的文件", type=['json', 'ttz', 'gz'], 
+                                    help="导入之前导出的旅行数据（JSON 或压缩格式，自动识别）", key="upload_data")
     
     if uploaded_file:
-        try:
-            data = json.load(uploaded_file)
-            
-            if st.checkbox("确认导入数据（这将覆盖当前数据）"):
+        if uploaded_file.size > MAX_IMPORT_BYTES:
+            st.error(f"文件过大（上限 {MAX_IMPORT_BYTES // (1024 * 1024)}MB）")
+        else:
+            import_mode = st.radio("导入方式", ["合并到当前数据", "覆盖当前数据"],
+                                   key="import_mode",
+                                   help="合并：按记录ID去重，两边都修改过的记录保留较新的版本；覆盖：用文件替换全部数据")
+            merge = import_mode == "合并到当前数据"
+            confirm_text = "确认合并导入" if merge else "确认导入数据（这将覆盖当前数据）"
+            if st.checkbox(confirm_text):
                 if st.button("开始导入", type="primary"):
-                    st.session_state.travelers = data.get('travelers', st.session_state.travelers)
-                    st.session_state.itinerary = data.get('itinerary', st.session_state.itinerary)
-                    st.session_state.expenses = data.get('expenses', st.session_state.expenses)
-                    st.session_state.total_days = data.get('total_days', st.session_state.total_days)
-                    st.session_state.traveler_ids = data.get('traveler_ids', st.session_state.traveler_ids)
-                    st.session_state.user_room_names = data.get('user_room_names', st.session_state.user_room_names)
-                    
-                    # 如果导入的数据包含用户ID，使用它
-                    if 'user_id' in data:
-                        st.session_state.user_id = data['user_id']
-                    
-                    imported_version = data.get('data_version', {})
-                    if imported_version:
-                        st.session_state.data_version = imported_version
-                    
-                    st.success("数据导入成功！")
-                    st.rerun()
-        except Exception as e:
-            st.error(f"导入失败: {str(e)}")
+                    # 只在点击时解析：按块读取并逐条校验，不会把整个文件一次性载入
+                    progress_bar = st.progress(0.0, text="正在导入...")
+                    file_size = max(uploaded_file.size, 1)
+                    uploaded_file.seek(0)
+                    try:
+                        # 合并时文件中缺少的字段不需要用当前数据补齐
+                        result = import_trip(
+                            uploaded_file, fallback=None if merge else room.to_dict(),
+                            # 压缩文件按已读取的上传字节计算进度
+                            progress=lambda read: progress_bar.progress(
+                                min(uploaded_file.tell() / file_size, 1.0), text="正在导入...")
+                        )
+                    except TripImportError as e:
+                        st.error(f"导入失败: {str(e)}")
+                    else:
+                        # 不再使用导入文件中的 user_id：那是导出者的身份，不是当前用户的
+                        st.session_state.import_report = collab.member.import_trip(
+                            result, merge, editor=st.session_state.user_name)
+                        collab.record_update("合并导入" if merge else "导入数据", uploaded_file.name)
+                        rerun_page("import_btn")
+        
+        # 上一次导入的结果
+        report = st.session_state.get('import_report')
+        if report:
+            st.success(f"数据导入成功！行程 {report['items']} 条，开销 {report['expenses']} 条")
+            if 'merge' in report:
+                added, updated, kept = report['merge']
+                st.caption(f"新增 {added} 条，更新 {updated} 条，保留现有 {kept} 条")
+            if report['skipped']:
+                with st.expander(f"⚠️ 跳过了 {report['skipped']} 条无效记录", expanded=False):
+                    for error in report['errors']:
+                        st.caption(error)
     
     # 清空数据
     if st.button("🗑️ 清空数据", type="secondary", 
                 use_container_width=True, key="clear_data_btn"):
         if st.checkbox("确认清空所有数据？"):
-            current_room = st.session_state.room_id
-            current_user_id = st.session_state.user_id
-            current_user_name = st.session_state.user_name
-            current_user_room_names = st.session_state.user_room_names
-            
-            # 重新初始化数据
-            collab.init_base_data()
-            
-            st.session_state.room_id = current_room
-            st.session_state.user_id = current_user_id
-            st.session_state.user_room_names = current_user_room_names
+            # 重新初始化房间数据（房间ID和成员昵称保留）
+            collab.member.reset(editor=st.session_state.user_name)
             
             # 重新获取用户名
             collab.update_user_activity()
-            
-            st.session_state.data_version = {
-                'number': 0,
-                'timestamp': time.time(),
-                'last_editor': st.session_state.user_name
-            }
+            collab.record_update("清空数据", "")
             
             st.success("数据已重置！")
-            st.rerun()
+            rerun_page("clear_data_btn")
+
+def is_admin():
+    """页面地址中的 admin 参数与服务器端的 TRAVEL_ADMIN_TOKEN 一致（未设置时不开放）"""
+    token = os.environ.get("TRAVEL_ADMIN_TOKEN", "")
+    given = st.query_params.get("admin", "")
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+@st.fragment
+def render_admin_metrics():
+    """运行指标：各部分耗时、重新运行次数、房间规模，以及 Prometheus 文本"""
+    with st.expander("🛠️ 运行指标", expanded=False):
+        timers = metrics.timers()
+        if timers:
+            st.dataframe(pd.DataFrame([
+                {'部分': name, '次数': count, '平均(ms)': round(total / count * 1000, 2),
+                 '最大(ms)': round(peak * 1000, 2), '总计(s)': round(total, 3)}
+                for name, (count, total, peak) in timers.items()
+            ]), use_container_width=True, hide_index=True)
+
+        reruns = metrics.counters('rerun')
+        if reruns:
+            st.markdown("**重新运行次数**")
+            st.dataframe(pd.DataFrame([{'触发来源': trigger, '次数': value} for trigger, value in reruns.items()]),
+                         use_container_width=True, hide_index=True)
+
+        # 只显示汇总：房间ID就是加入房间的凭据
+        totals = room_totals(collab.registry)
+        st.markdown(f"**房间规模**（内存中 {totals['rooms']} 个房间）")
+        st.dataframe(pd.DataFrame([
+            {'统计': label, '人员': totals['travelers'][column], '行程': totals['itinerary'][column],
+             '开销': totals['expenses'][column], '在线': totals['online'][column],
+             '待重放操作': totals['replay_length'][column]}
+            for label, column in (("合计", 0), ("单个房间最大", 1))
+        ]), use_container_width=True, hide_index=True)
+
+        text = to_prometheus(metrics, collab.registry)
+        st.download_button("下载 Prometheus 指标", text, file_name="metrics.txt", mime="text/plain",
+                           key="download_metrics_btn")
+        st.code(text, language="text")
+        if st.button("重置计数", key="reset_metrics_btn"):
+            metrics.reset()
+            rerun_region("reset_metrics_btn")
+
+with st.sidebar:
+    st.header("📊 数据管理")
+    
+    # 协作说明
+    st.markdown("### 👥 多人协作说明")
+    st.markdown("""
+    1. **分享旅行团ID**给同伴
+    2. 同伴输入相同ID加入
+    3. **数据实时同步**（其他成员修改后自动刷新）
+    4. 所有人的修改会实时合并
+    """)
+    
+    # 显示当前协作状态
+    online_users = collab.get_online_users()
+    st.metric("在线人数", len(online_users))
+    st.caption(f"数据版本: {room.data_version['number']}")
+    
+    st.markdown("---")
+    
+    render_data_management()
+
+    # 运行指标只在服务器设置了 TRAVEL_ADMIN_TOKEN、页面地址带 ?admin=<该值> 时显示
+    if is_admin():
+        render_admin_metrics()
     
     st.markdown("---")
     st.markdown("### 📖 使用说明")
     st.markdown("""
     **智能协作功能：**
-    - ✅ 自动同步 (每30秒)
+    - ✅ 实时同步（亚秒级）
     - ✅ 实时在线用户显示
     - ✅ 更新自动合并
     - ✅ 无需手动操作
     
     **💡 提示：**
-    - 数据自动保存在浏览器中
+    - 同一旅行团的成员共享同一份数据
     - 定期导出备份重要数据
     - 清空数据不会清除房间ID
     
@@ -1223,38 +1099,45 @@ with st.sidebar:
 # ========== 页面底部状态栏 ==========
 st.markdown("---")
 
-# 计算页面统计信息
-total_itinerary_items = sum(len(day_items) for day_items in st.session_state.itinerary.values())
-total_expenses = sum(len(day_expenses) for day_expenses in st.session_state.expenses.values())
-total_expense_amount = sum(
-    expense.get('amount', 0) 
-    for day_expenses in st.session_state.expenses.values() 
-    for expense in day_expenses
-)
+@data_region("footer", "itinerary", "expenses")
+def render_footer_stats():
+    """页面统计：行程或开销被修改后由同步状态指示器发现过期并刷新"""
+    room = collab.room
+    with room.lock:
+        total_itinerary_items = len(room.itinerary)
+    settlement = get_settlement_engine(room.room_id)
+    settlement.sync(collab.registry, room)
+    total_expenses = settlement.expense_count
+    total_expense_amount = settlement.total_amount
 
-col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3, col4 = st.columns(4)
 
-with col1:
-    st.metric("在线人数", len(online_users))
-with col2:
-    st.metric("行程项目", total_itinerary_items)
-with col3:
-    st.metric("开销记录", total_expenses)
-with col4:
-    st.metric("总开销", f"¥{total_expense_amount:.2f}")
-
-# 页脚信息
-st.markdown(f"""
-<div style='text-align: center; color: #666; padding: 20px 0;'>
-    <div>✈️ <b>Travel-Together 智能协作版</b></div>
-    <div style='font-size: 0.9em; margin-top: 5px;'>
-        旅行团ID: <code>{st.session_state.room_id}</code> | 
-        自动同步: {collab.get_sync_status_text()} | 
-        数据版本: {st.session_state.data_version['number']}
+    with col1:
+        st.metric("在线人数", len(collab.get_online_users(heartbeat=False)))
+    with col2:
+        st.metric("行程项目", total_itinerary_items)
+    with col3:
+        st.metric("开销记录", total_expenses)
+    with col4:
+        st.metric("总开销", format_yuan(total_expense_amount))
+
+    # 页脚信息
+    st.markdown(f"""
+    <div style='text-align: center; color: #666; padding: 20px 0;'>
+        <div>✈️ <b>Travel-Together 智能协作版</b></div>
+        <div style='font-size: 0.9em; margin-top: 5px;'>
+            旅行团ID: <code>{html.escape(st.session_state.room_id)}</code> | 
+            自动同步: {collab.get_sync_status_text()} | 
+            数据版本: {room.data_version['number']}
+        </div>
     </div>
-</div>
-""", unsafe_allow_html=True)
+    """, unsafe_allow_html=True)
+
+render_footer_stats()
 
 # ========== 后台自动同步 ==========
 # 在页面加载时自动运行同步检查
-collab.setup_auto_sync()
\ No newline at end of file
+collab.setup_auto_sync()
+
+# 本次运行中未随操作写入的修改（天数、人员名单等）一并持久化
+collab.flush()
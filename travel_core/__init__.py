@@ -0,0 +1,38 @@
+"""Travel-Together 核心模块（与界面无关的房间数据与协作逻辑）"""
+from .crdt import DocumentReplica, RoomDocument
+from .exporter import EXPORT_FORMATS, ExportCache, encode_export, open_import
+from .importer import MAX_IMPORT_BYTES, ImportResult, TripImportError, import_dict, import_trip
+from .itinerary import ItineraryIndex, parse_time_range
+from .ledger import EXPENSE_CATEGORIES, PERSONAL_CATEGORY, Ledger
+from .merge import MergePlan, plan_merge
+from .metrics import Metrics, log_line, room_sizes, room_totals, to_prometheus
+from .money import MAX_AMOUNT, allocate, format_yuan, is_valid_amount, to_cents, to_yuan
+from .oplog import OperationLog, RoomReplica, apply_operation, make_op
+from .presence import PRESENCE_TTL, PresenceTracker
+from .records import Expense, ItineraryItem
+from .room import Room, RoomItinerary, RoomLedger, RoomPresence, member_color, next_default_name
+from .settlement import SettlementEngine, net_balances, plan_transfers
+from .storage import RoomStorage, SQLiteStorage
+from .store import PendingChanges, RoomState, RoomRegistry
+from .travelers import TravelerDirectory, from_legacy, to_legacy
+from .worker import SNAPSHOT_EVERY, BackgroundWorker
+
+__all__ = [
+    'DocumentReplica', 'RoomDocument',
+    'EXPORT_FORMATS', 'ExportCache', 'encode_export', 'open_import',
+    'MAX_IMPORT_BYTES', 'ImportResult', 'TripImportError', 'import_dict', 'import_trip',
+    'ItineraryIndex', 'parse_time_range',
+    'EXPENSE_CATEGORIES', 'PERSONAL_CATEGORY', 'Ledger',
+    'MergePlan', 'plan_merge',
+    'Metrics', 'log_line', 'room_sizes', 'room_totals', 'to_prometheus',
+    'MAX_AMOUNT', 'allocate', 'format_yuan', 'is_valid_amount', 'to_cents', 'to_yuan',
+    'OperationLog', 'RoomReplica', 'apply_operation', 'make_op',
+    'PRESENCE_TTL', 'PresenceTracker',
+    'Expense', 'ItineraryItem',
+    'Room', 'RoomItinerary', 'RoomLedger', 'RoomPresence', 'member_color', 'next_default_name',
+    'SettlementEngine', 'net_balances', 'plan_transfers',
+    'RoomStorage', 'SQLiteStorage',
+    'PendingChanges', 'RoomState', 'RoomRegistry',
+    'TravelerDirectory', 'from_legacy', 'to_legacy',
+    'SNAPSHOT_EVERY', 'BackgroundWorker',
+]
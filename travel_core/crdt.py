@@ -0,0 +1,268 @@
+"""房间文档的 CRDT 表示（离线编辑）
+
+行程和开销各是一个 OR-Set，元素以记录的 id 为键。记录 id 在每次添加时新生成，
+本身就是这次添加的唯一标签：删除只移除删除方已经看到的 id（记为墓碑），
+不会误删其他人并发添加的记录；墓碑之后再到达的同一次添加也不会让记录复活。
+
+记录的每个字段是一个 LWW 寄存器，时间戳为 (edit_time, 副本 ID, 计数器)，
+较大的一方获胜，副本 ID 和计数器保证时间相同时的结果也是确定的。
+
+添加、删除、设置字段三种操作都满足交换律、结合律和幂等性：客户端可以离线时
+把操作排队，恢复连接后整批提交；按任意顺序、重复提交，结果都相同。
+合并一批操作只触及这批操作涉及的记录，开销与操作数成正比，与房间大小无关。
+
+操作格式（可直接 JSON 序列化）：
+    {'type': 'add', 'kind': 'itinerary' | 'expenses', 'id': ..., 'day': '1'}
+    {'type': 'remove', 'kind': ..., 'id': ...}
+    {'type': 'set', 'kind': ..., 'id': ..., 'field': ..., 'value': ..., 'stamp': [时间, 副本ID, 计数器]}
+"""
+import copy
+import itertools
+import time
+
+from . import oplog
+from .importer import MAX_DAYS, is_valid_day
+
+ADD = 'add'
+REMOVE = 'remove'
+SET = 'set'
+KINDS = ('itinerary', 'expenses')
+
+# 不作为字段寄存器保存的内容：id 是元素的键，rev 由房间在写入时维护
+_SKIP_FIELDS = ('id', 'rev')
+
+
+def _stamp(value):
+    return tuple(value)
+
+
+def check_op(op):
+    """检查客户端提交的一条操作，格式不对时抛出 ValueError
+
+    操作来自客户端，写入房间前必须确认记录类型和天数有效：
+    无效的天数一旦写入房间，账本和按天显示都会出错。
+    """
+    if not isinstance(op, dict) or op.get('type') not in (ADD, REMOVE, SET):
+        raise ValueError(f"未知的文档操作: {op!r}")
+    if op.get('kind') not in KINDS:
+        raise ValueError(f"未知的记录类型: {op.get('kind')!r}")
+    if not isinstance(op.get('id'), str) or not op['id']:
+        raise ValueError("文档操作缺少记录 id")
+    if op['type'] == ADD and not is_valid_day(op.get('day')):
+        raise ValueError(f"天数 {op.get('day')!r} 应为 1 到 {MAX_DAYS} 之间的整数")
+    if op['type'] == SET:
+        if not isinstance(op.get('field'), str) or op['field'] in _SKIP_FIELDS:
+            raise ValueError(f"不能设置字段 {op.get('field')!r}")
+        stamp = op.get('stamp')
+        if not (isinstance(stamp, (list, tuple)) and len(stamp) == 3
+                and isinstance(stamp[0], (int, float)) and not isinstance(stamp[0], bool)
+                and isinstance(stamp[1], str) and isinstance(stamp[2], int)):
+            raise ValueError(f"时间戳格式错误: {stamp!r}")
+
+
+def _record_stamp(record, default_time=0):
+    """房间中已有记录的字段时间戳（来自服务器端的修改，计数器为 0）"""
+    return (record.get('edit_time', default_time), str(record.get('editor', '')), 0)
+
+
+class RoomDocument:
+    """行程、开销两个 OR-Set 及其字段寄存器"""
+
+    def __init__(self):
+        self._days = {}          # (kind, id) -> day，已添加（未删除）的元素，保持添加顺序
+        self._removed = set()    # 墓碑 (kind, id)
+        self._fields = {}        # (kind, id) -> {field: (stamp, value)}
+        self._revs = {}          # (kind, id) -> 房间中记录的版本号 rev
+
+    @classmethod
+    def from_state(cls, state, removed=()):
+        """从房间数据（travelers/itinerary/expenses 等属性或 empty_state() 字典）构建文档"""
+        document = cls()
+        itinerary = state['itinerary'] if isinstance(state, dict) else state.itinerary
+        expenses = state['expenses'] if isinstance(state, dict) else state.expenses
+        document._removed.update(removed)
+        for kind, days in (('itinerary', itinerary), ('expenses', expenses)):
+            for day, records in days.items():
+                for record in records:
+                    document._put(kind, day, record, _record_stamp(record))
+        return document
+
+    def copy(self):
+        """给客户端使用的独立副本"""
+        return copy.deepcopy(self)
+
+    # ========== 合并 ==========
+    def apply(self, op):
+        """应用一条操作，返回受影响的 (kind, id)"""
+        key = (op['kind'], op['id'])
+        op_type = op['type']
+        if op_type == ADD:
+            if key not in self._removed and key not in self._days:
+                self._days[key] = op['day']
+        elif op_type == REMOVE:
+            self._removed.add(key)
+            self._days.pop(key, None)
+        elif op_type == SET:
+            if key in self._removed:
+                return key
+            stamp = _stamp(op['stamp'])
+            fields = self._fields.setdefault(key, {})
+            current = fields.get(op['field'])
+            if current is None or stamp > current[0]:
+                fields[op['field']] = (stamp, op['value'])
+        else:
+            raise ValueError(f"未知的文档操作: {op_type}")
+        return key
+
+    def merge(self, ops):
+        """整批合并操作，返回受影响的 (kind, id) 集合"""
+        apply = self.apply
+        return {apply(op) for op in ops}
+
+    # ========== 读取 ==========
+    def __contains__(self, key):
+        return key in self._days
+
+    def __len__(self):
+        return len(self._days)
+
+    def day_of(self, kind, record_id):
+        return self._days.get((kind, record_id))
+
+    def record(self, kind, record_id):
+        """记录的当前值；不存在或已删除时返回 None"""
+        key = (kind, record_id)
+        if key not in self._days:
+            return None
+        record = {'id': record_id}
+        for field, (_, value) in self._fields.get(key, {}).items():
+            record[field] = list(value) if isinstance(value, (list, tuple)) else value
+        return record
+
+    def records(self, kind):
+        """{day: [记录]}，按添加顺序"""
+        result = {}
+        for (record_kind, record_id), day in self._days.items():
+            if record_kind == kind:
+                result.setdefault(day, []).append(self.record(kind, record_id))
+        return result
+
+    def rev(self, kind, record_id):
+        return self._revs.get((kind, record_id), 0)
+
+    def set_rev(self, kind, record_id, rev):
+        self._revs[(kind, record_id)] = rev
+
+    def field_stamp(self, kind, record_id, field):
+        entry = self._fields.get((kind, record_id), {}).get(field)
+        return entry[0] if entry is not None else None
+
+    # ========== 与房间操作日志保持一致（服务器端） ==========
+    def _put(self, kind, day, record, stamp):
+        key = (kind, record['id'])
+        if key in self._removed:
+            return
+        self._days.setdefault(key, day)
+        self._revs[key] = record.get('rev', 0)
+        fields = self._fields.setdefault(key, {})
+        for field, value in record.items():
+            if field in _SKIP_FIELDS:
+                continue
+            current = fields.get(field)
+            if current is None or stamp >= current[0]:
+                fields[field] = (stamp, value)
+
+    def _drop(self, kind, record_id):
+        key = (kind, record_id)
+        self._removed.add(key)
+        self._days.pop(key, None)
+        self._fields.pop(key, None)
+        self._revs.pop(key, None)
+
+    def observe(self, op):
+        """把房间操作日志中的一条操作同步到文档
+
+        由文档合并产生的操作已在文档中，直接跳过。
+        房间数据被整体替换时返回 False，文档需要重新构建。
+        """
+        if op.get('source') == 'document':
+            return True
+        op_type = op['op']
+        if op_type in (oplog.ADD_ITEM, oplog.ADD_EXPENSE):
+            kind = 'itinerary' if op_type == oplog.ADD_ITEM else 'expenses'
+            self._put(kind, op['day'], op['record'], _record_stamp(op['record'], op['timestamp']))
+        elif op_type in (oplog.UPDATE_ITEM, oplog.UPDATE_EXPENSE):
+            kind = 'itinerary' if op_type == oplog.UPDATE_ITEM else 'expenses'
+            if op['record'] is not None:
+                self._put(kind, op['day'], op['record'], _record_stamp(op['record'], op['timestamp']))
+        elif op_type == oplog.DELETE_ITEM:
+            self._drop('itinerary', op['id'])
+        elif op_type == oplog.DELETE_EXPENSE:
+            self._drop('expenses', op['id'])
+        elif op_type == oplog.MERGE:
+            for day, item in op['itinerary']:
+                self._put('itinerary', day, item, _record_stamp(item, op['timestamp']))
+            for day, expense in op['expenses']:
+                self._put('expenses', day, expense, _record_stamp(expense, op['timestamp']))
+            for kind, record_id, _ in op.get('removed', []):
+                self._drop(kind, record_id)
+        elif op_type == oplog.REPLACE:
+            return False
+        return True
+
+
+class DocumentReplica:
+    """客户端副本：修改立即在本地文档生效，对应的操作进入待提交队列
+
+    提交失败（例如网络中断导致页面重新运行失败）时把操作放回队列，之后整批重试；
+    由于操作是幂等的，重复提交也不会产生重复记录。
+    """
+
+    def __init__(self, replica_id, document=None):
+        self.replica_id = replica_id
+        self.document = document if document is not None else RoomDocument()
+        self._counter = itertools.count(1)
+        self._outbox = []
+
+    def _emit(self, op):
+        self.document.apply(op)
+        self._outbox.append(op)
+
+    def _stamp(self, edit_time=None):
+        return [time.time() if edit_time is None else edit_time, self.replica_id, next(self._counter)]
+
+    def add(self, kind, day, record, edit_time=None):
+        """添加一条记录（record 必须带新生成的 id）"""
+        self._emit({'type': ADD, 'kind': kind, 'id': record['id'], 'day': day})
+        self.update(kind, record['id'], record, edit_time)
+
+    def update(self, kind, record_id, changes, edit_time=None):
+        """修改字段：每个字段各自是一个 LWW 寄存器"""
+        stamp = self._stamp(edit_time)
+        for field, value in changes.items():
+            if field in _SKIP_FIELDS:
+                continue
+            self._emit({'type': SET, 'kind': kind, 'id': record_id, 'field': field,
+                        'value': value, 'stamp': stamp})
+
+    def remove(self, kind, record_id):
+        """删除本地已看到的记录；没看到的记录（其他人并发添加的）不受影响"""
+        if (kind, record_id) in self.document:
+            self._emit({'type': REMOVE, 'kind': kind, 'id': record_id})
+
+    def receive(self, ops):
+        """合并其他副本（或服务器）的操作"""
+        return self.document.merge(ops)
+
+    def take_outbox(self):
+        """取出待提交的操作"""
+        ops, self._outbox = self._outbox, []
+        return ops
+
+    def requeue(self, ops):
+        """提交失败时放回队列（排在之后产生的操作前面）"""
+        self._outbox[:0] = ops
+
+    @property
+    def pending_count(self):
+        return len(self._outbox)
@@ -0,0 +1,108 @@
+"""导出格式
+
+- JSON：与旧版相同的可读格式（indent=2）；
+- 压缩格式（.ttz）：文件头 MAGIC + 格式版本号，之后是 gzip 压缩的紧凑 JSON。
+  字段结构与 JSON 导出完全相同，导入时解压后走同一个流式导入器。
+
+导出内容按房间的 data_version 缓存，数据没有变化时重复下载不会重新序列化。
+"""
+import gzip
+import io
+import json
+import threading
+import time
+
+MAGIC = b'TTZ'
+FORMAT_VERSION = 1
+GZIP_MAGIC = b'\x1f\x8b'
+
+# 格式 -> (显示名称, MIME 类型, 文件扩展名)
+EXPORT_FORMATS = {
+    'json': ("JSON", "application/json", "json"),
+    'ttz': ("压缩格式", "application/octet-stream", "ttz"),
+}
+
+
+def encode_export(data, fmt):
+    """把导出字典编码为指定格式的字节"""
+    if fmt == 'json':
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    if fmt == 'ttz':
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        # mtime=0：同样的数据得到同样的字节
+        return MAGIC + bytes([FORMAT_VERSION]) + gzip.compress(body, compresslevel=6, mtime=0)
+    raise ValueError(f"未知的导出格式: {fmt}")
+
+
+def open_import(fileobj):
+    """识别上传文件的格式，返回可按块读取 JSON 文本的文件对象
+
+    压缩格式在读取时逐块解压，不会把解压后的全部内容放进内存。
+    格式无法识别时抛出 ValueError。
+    """
+    head = fileobj.read(len(MAGIC) + 1)
+    if isinstance(head, str):
+        # 文本文件对象只可能是 JSON
+        return _Prefixed(head, fileobj)
+    if head[:len(MAGIC)] == MAGIC:
+        version = head[len(MAGIC)]
+        if version > FORMAT_VERSION:
+            raise ValueError(f"文件格式版本 {version} 过新，请升级应用后再导入")
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if head[:2] == GZIP_MAGIC:
+        # 直接用 gzip 压缩的 JSON 文件
+        return gzip.GzipFile(fileobj=_Prefixed(head, fileobj), mode='rb')
+    return _Prefixed(head, fileobj)
+
+
+class _Prefixed(io.RawIOBase):
+    """把已经读出的文件头放回文件对象的开头"""
+
+    def __init__(self, head, fileobj):
+        self._head = head
+        self._file = fileobj
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if self._head:
+            if size is None or size < 0:
+                head, self._head = self._head, self._head[:0]
+                return head + self._file.read()
+            head, self._head = self._head[:size], self._head[size:]
+            if len(head) == size:
+                return head
+            return head + self._file.read(size - len(head))
+        return self._file.read(size)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class ExportCache:
+    """单个房间的导出缓存 {格式: (data_version, 字节)}"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, room, fmt):
+        """返回 (导出字节, data_version)；版本未变化时直接使用缓存"""
+        version = room.data_version['number']
+        with self._lock:
+            cached = self._entries.get(fmt)
+            if cached is not None and cached[0] == version:
+                return cached[1], version
+
+        with room.lock:
+            version = room.data_version['number']
+            data = room.to_dict()
+        data['export_time'] = time.time()
+        payload = encode_export(data, fmt)
+
+        with self._lock:
+            self._entries[fmt] = (version, payload)
+        return payload, version
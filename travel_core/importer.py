@@ -0,0 +1,462 @@
+"""流式导入旅行数据 JSON
+
+支持 JSON 和压缩格式（见 exporter），按文件头自动识别。
+按块读取上传的文件，只在内存中保留当前这一块和正在解析的一条记录：
+行程和开销逐条解析、按规则校验，不合格的记录跳过并记下原因，
+合格的记录在同一遍扫描中把人员名字换成人员 ID，直接得到房间数据。
+"""
+import codecs
+import json
+import zlib
+
+from .exporter import open_import
+from .money import MAX_AMOUNT, is_valid_amount
+from .travelers import new_traveler_id
+
+MAX_IMPORT_BYTES = 50 * 1024 * 1024     # 上传文件大小上限
+CHUNK_SIZE = 64 * 1024
+MAX_DAYS = 30                           # 与"旅行天数"滑块的上限一致
+MAX_ERRORS = 200                        # 最多记录的错误条数
+
+
+class TripImportError(ValueError):
+    """文件整体无法导入（不是 JSON 对象、格式损坏、超过大小限制等）"""
+
+
+class _JsonStream:
+    """按块读取 JSON 文本，每次解析一个值"""
+
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE, max_bytes=MAX_IMPORT_BYTES, progress=None):
+        self._file = fileobj
+        self._chunk_size = chunk_size
+        self._max_bytes = max_bytes
+        self._progress = progress
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self.bytes_read = 0
+
+    def _fill(self):
+        try:
+            chunk = self._file.read(self._chunk_size)
+        except (OSError, EOFError, zlib.error) as error:
+            raise TripImportError(f"文件解压失败: {error}") from None
+        if not chunk:
+            self._buffer += self._decoder.decode(b'', final=True)
+            self._eof = True
+            return
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self._max_bytes:
+            raise TripImportError(f"文件超过 {self._max_bytes // (1024 * 1024)}MB 的大小限制")
+        if self._progress is not None:
+            self._progress(self.bytes_read)
+        # 丢弃已解析的部分，内存中只保留未解析的文本
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(chunk)
+        self._pos = 0
+
+    def peek(self):
+        """跳过空白，返回下一个字符（不消费）；文件结束时返回空串"""
+        while True:
+            buffer = self._buffer
+            while self._pos < len(buffer) and buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(buffer):
+                return buffer[self._pos]
+            if self._eof:
+                return ''
+            self._fill()
+
+    def next_char(self):
+        char = self.peek()
+        self._pos += 1
+        return char
+
+    def expect(self, expected):
+        char = self.next_char()
+        if char != expected:
+            raise TripImportError(f"JSON 格式错误：应为 '{expected}'，实际为 '{char or '文件结尾'}'")
+
+    def read_value(self):
+        """解析一个完整的 JSON 值；数据不完整时继续读入下一块"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as error:
+                if self._eof:
+                    raise TripImportError(f"JSON 格式错误：{error.msg}") from None
+                self._fill()
+                continue
+            # 数字恰好在块的末尾时可能还没读完（如 "12" 后面还有 "3"）
+            if end == len(self._buffer) and not self._eof:
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def read_key(self):
+        key = self.read_value()
+        if not isinstance(key, str):
+            raise TripImportError("JSON 格式错误：对象的键必须是字符串")
+        self.expect(':')
+        return key
+
+
+def iter_events(stream):
+    """把文件解析为事件流
+
+    顶层字段产生 ('field', key, value)；
+    itinerary / expenses 中的每条记录产生 (section, day, index, record)，不整体载入。
+    """
+    stream.expect('{')
+    if stream.peek() == '}':
+        stream.next_char()
+    else:
+        while True:
+            key = stream.read_key()
+            if key in ('itinerary', 'expenses') and stream.peek() == '{':
+                yield from _iter_days(stream, key)
+            else:
+                yield ('field', key, stream.read_value())
+            separator = stream.next_char()
+            if separator == '}':
+                break
+            if separator != ',':
+                raise TripImportError("JSON 格式错误：对象的字段之间缺少 ','")
+    if stream.peek():
+        raise TripImportError("JSON 格式错误：数据结束后还有多余内容")
+
+
+def _iter_days(stream, section):
+    stream.expect('{')
+    if stream.peek() == '}':
+        stream.next_char()
+        return
+    while True:
+        day = stream.read_key()
+        if stream.peek() == '[':
+            stream.next_char()
+            index = 0
+            if stream.peek() == ']':
+                stream.next_char()
+            else:
+                while True:
+                    yield (section, day, index, stream.read_value())
+                    index += 1
+                    separator = stream.next_char()
+                    if separator == ']':
+                        break
+                    if separator != ',':
+                        raise TripImportError("JSON 格式错误：列表元素之间缺少 ','")
+        else:
+            stream.read_value()
+            yield (section, day, None, None)
+        separator = stream.next_char()
+        if separator == '}':
+            break
+        if separator != ',':
+            raise TripImportError("JSON 格式错误：对象的字段之间缺少 ','")
+
+
+# ========== 记录校验 ==========
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_fields(record, required, optional):
+    """按 {字段: (类型, 说明)} 检查字段，返回错误信息列表"""
+    if not isinstance(record, dict):
+        return ["不是对象"]
+    errors = []
+    for field, (check, description) in required.items():
+        if field not in record:
+            errors.append(f"缺少字段 {field}")
+        elif not check(record[field]):
+            errors.append(f"字段 {field} 应为{description}")
+    for field, (check, description) in optional.items():
+        if field in record and not check(record[field]):
+            errors.append(f"字段 {field} 应为{description}")
+    return errors
+
+
+def _is_text(value):
+    return isinstance(value, str)
+
+
+def _is_nonempty_text(value):
+    return isinstance(value, str) and value.strip() != ''
+
+
+def _is_name_list(value):
+    return isinstance(value, list) and all(map(_is_text, value))
+
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+ITEM_REQUIRED = {
+    'id': (_is_nonempty_text, "非空字符串"),
+    'time': (_is_text, "字符串"),
+    'project': (_is_nonempty_text, "非空字符串"),
+}
+ITEM_OPTIONAL = {
+    'transport': (_is_text, "字符串"),
+    'location': (_is_text, "字符串"),
+    'participants': (_is_name_list, "名字列表"),
+    'editor': (_is_text, "字符串"),
+    'edit_time': (_is_number, "数字"),
+    'rev': (_is_count, "非负整数"),
+}
+EXPENSE_REQUIRED = {
+    'id': (_is_nonempty_text, "非空字符串"),
+    'payer': (_is_nonempty_text, "非空字符串"),
+    'item': (_is_text, "字符串"),
+    'amount': (is_valid_amount, f"0 到 {MAX_AMOUNT} 之间的数"),
+}
+EXPENSE_OPTIONAL = {
+    'category': (_is_text, "字符串"),
+    'day': (lambda value: isinstance(value, int) and not isinstance(value, bool), "整数"),
+    'sharers': (_is_name_list, "名字列表"),
+    'editor': (_is_text, "字符串"),
+    'edit_time': (_is_number, "数字"),
+    'rev': (_is_count, "非负整数"),
+}
+
+
+def validate_item(item):
+    # 时间段无法解析只影响排序和冲突检测，不算错误
+    return _check_fields(item, ITEM_REQUIRED, ITEM_OPTIONAL)
+
+
+def validate_expense(expense):
+    return _check_fields(expense, EXPENSE_REQUIRED, EXPENSE_OPTIONAL)
+
+
+def is_valid_day(day):
+    """按天分组的键：1 到 MAX_DAYS 之间的整数，写成不带前导零的 ASCII 数字
+
+    str.isdigit() 也接受 "²"、全角数字等，int() 无法转换或转换后与键不一致，
+    这样的键会让账本和按天显示出错。
+    """
+    return (
+        isinstance(day, str) and day.isascii() and day.isdigit()
+        and str(int(day)) == day and 1 <= int(day) <= MAX_DAYS
+    )
+
+
+# ========== 导入 ==========
+class ImportResult:
+    """导入结果：房间数据（empty_state() 结构）、成员昵称、逐条的错误信息"""
+
+    def __init__(self, state, user_names, fields, errors, skipped):
+        self.state = state
+        self.user_names = user_names
+        self.fields = fields            # 其他顶层字段（export_time 等）
+        self.errors = errors            # ["expenses 第1天 第3条: 缺少字段 amount", ...]
+        self.skipped = skipped          # 跳过的记录数（可能多于 errors 的条数）
+
+    @property
+    def item_count(self):
+        return sum(len(items) for items in self.state['itinerary'].values())
+
+    @property
+    def expense_count(self):
+        return sum(len(items) for items in self.state['expenses'].values())
+
+
+class TripImporter:
+    """逐个事件构建房间数据
+
+    人员名字在第一次出现时分配 ID（名单中有对应的 traveler_ids 时沿用），
+    行程和开销的引用在校验的同时完成转换，不需要第二遍扫描。
+    """
+
+    def __init__(self):
+        self._records = {}          # 人员 ID -> 人员记录
+        self._ids_by_name = {}
+        self._listed = set()        # 出现在 travelers 名单中的人员 ID
+        self.itinerary = {}
+        self.expenses = {}
+        self._seen_ids = {'itinerary': set(), 'expenses': set()}
+        self.fields = {}
+        self.present = set()        # 文件中出现过的顶层字段
+        self.errors = []
+        self.skipped = 0
+
+    def _ref(self, name, traveler_id=None):
+        existing = self._ids_by_name.get(name)
+        if existing is not None:
+            return existing
+        if not traveler_id or traveler_id in self._records:
+            traveler_id = new_traveler_id()
+            while traveler_id in self._records:
+                traveler_id = new_traveler_id()
+        self._records[traveler_id] = {'id': traveler_id, 'name': name, 'removed': False}
+        self._ids_by_name[name] = traveler_id
+        return traveler_id
+
+    def _editor_ref(self, name):
+        # 添加人可能是"未知"等不在名单中的名字，保持原样
+        return self._ids_by_name.get(name, name)
+
+    def _error(self, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    def feed(self, event):
+        kind = event[0]
+        if kind == 'field':
+            self._feed_field(event[1], event[2])
+        else:
+            self._feed_record(*event)
+
+    def _feed_field(self, key, value):
+        self.present.add(key)
+        if key == 'travelers':
+            if not _is_name_list(value):
+                raise TripImportError("travelers 应为名字列表")
+            traveler_ids = self.fields.get('traveler_ids') or []
+            for index, name in enumerate(value):
+                self._listed.add(self._ref(name, traveler_ids[index] if index < len(traveler_ids) else None))
+        elif key == 'traveler_ids':
+            if not _is_name_list(value):
+                raise TripImportError("traveler_ids 应为字符串列表")
+            self.fields[key] = value
+        elif key == 'total_days':
+            if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= MAX_DAYS:
+                raise TripImportError(f"total_days 应为 1 到 {MAX_DAYS} 之间的整数")
+            self.fields[key] = value
+        elif key == 'user_room_names':
+            if not isinstance(value, dict):
+                raise TripImportError("user_room_names 应为对象")
+            # 昵称会参与默认名字的分配，不是字符串的跳过
+            names = {}
+            for name_key, name in value.items():
+                if _is_nonempty_text(name):
+                    names[name_key] = name
+                else:
+                    self._error(f"user_room_names {name_key}: 昵称应为非空字符串")
+            self.fields[key] = names
+        elif key in ('itinerary', 'expenses'):
+            raise TripImportError(f"{key} 应为按天分组的对象")
+        else:
+            self.fields[key] = value
+
+    def _feed_record(self, section, day, index, record):
+        self.present.add(section)
+        label = "行程" if section == 'itinerary' else "开销"
+        if index is None:
+            self._error(f"{label} 第{day}天: 应为列表")
+            return
+        where = f"{label} 第{day}天 第{index + 1}条"
+        if not is_valid_day(day):
+            self._error(f"{where}: 天数 {day!r} 应为 1 到 {MAX_DAYS} 之间的整数")
+            return
+
+        if section == 'itinerary':
+            errors = validate_item(record)
+        else:
+            errors = validate_expense(record)
+        if not errors and record['id'] in self._seen_ids[section]:
+            errors = [f"ID {record['id']} 重复"]
+        if errors:
+            self._error(f"{where}: {'；'.join(errors)}")
+            return
+        self._seen_ids[section].add(record['id'])
+
+        record = dict(record)
+        ids_by_name = self._ids_by_name
+        if section == 'itinerary':
+            if 'participants' in record:
+                record['participants'] = [
+                    ids_by_name.get(name) or self._ref(name) for name in record['participants']
+                ]
+            if 'editor' in record:
+                record['editor'] = self._editor_ref(record['editor'])
+            self.itinerary.setdefault(day, []).append(record)
+        else:
+            record['payer'] = self._ref(record['payer'])
+            if 'sharers' in record:
+                record['sharers'] = [
+                    ids_by_name.get(name) or self._ref(name) for name in record['sharers']
+                ]
+            if 'editor' in record:
+                record['editor'] = self._editor_ref(record['editor'])
+            self.expenses.setdefault(day, []).append(record)
+
+    def result(self, fallback=None):
+        """生成导入结果；文件中缺少的字段从 fallback（旧格式的当前房间数据）补齐"""
+        if fallback is not None:
+            if 'travelers' not in self.present and 'traveler_ids' not in self.present:
+                self.fields['traveler_ids'] = fallback.get('traveler_ids', [])
+            for key in ('travelers', 'total_days'):
+                if key not in self.present and key in fallback:
+                    self._feed_field(key, fallback[key])
+            for section in ('itinerary', 'expenses'):
+                if section not in self.present:
+                    for day, records in fallback.get(section, {}).items():
+                        for index, record in enumerate(records):
+                            self._feed_record(section, day, index, record)
+
+        # 只出现在记录中、不在名单里的人员视为已删除
+        for traveler_id, record in self._records.items():
+            record['removed'] = traveler_id not in self._listed
+
+        user_names = {}
+        for key, name in self.fields.get('user_room_names', {}).items():
+            # 旧版导出的键为 "<user_id>_<room_id>"
+            user_id = key.rsplit('_', 1)[0] if '_' in key else key
+            user_names[user_id] = name
+
+        state = {
+            'travelers': list(self._records.values()),
+            'itinerary': self.itinerary,
+            'expenses': self.expenses,
+            'total_days': self.fields.get('total_days', 3),
+        }
+        return ImportResult(state, user_names, self.fields, self.errors, self.skipped)
+
+
+def import_dict(data, fallback=None):
+    """校验并转换已经载入内存的旧格式字典（与 import_trip 的规则相同）"""
+    if not isinstance(data, dict):
+        raise TripImportError("导入的数据应为 JSON 对象")
+    importer = TripImporter()
+    # traveler_ids 需要先于 travelers 处理，才能沿用其中的人员 ID
+    for key in sorted(data, key=lambda key: key != 'traveler_ids'):
+        value = data[key]
+        if key in ('itinerary', 'expenses') and isinstance(value, dict):
+            importer.present.add(key)
+            for day, records in value.items():
+                if not isinstance(records, list):
+                    importer.feed((key, day, None, None))
+                    continue
+                for index, record in enumerate(records):
+                    importer.feed((key, day, index, record))
+        else:
+            importer.feed(('field', key, value))
+    return importer.result(fallback)
+
+
+def import_trip(fileobj, fallback=None, max_bytes=MAX_IMPORT_BYTES, progress=None):
+    """流式读取并校验导出的文件（JSON 或压缩格式），返回 ImportResult
+
+    fileobj 为二进制或文本文件对象；progress(已读字节数) 在每读入一块后调用，
+    压缩格式下是解压后的字节数，max_bytes 同样按解压后的大小限制。
+    文件整体无法解析时抛出 TripImportError，单条记录的问题记录在 result.errors 中。
+    """
+    try:
+        fileobj = open_import(fileobj)
+    except ValueError as error:
+        raise TripImportError(str(error)) from None
+    stream = _JsonStream(fileobj, max_bytes=max_bytes, progress=progress)
+    importer = TripImporter()
+    for event in iter_events(stream):
+        importer.feed(event)
+    return importer.result(fallback)
@@ -0,0 +1,137 @@
+"""按天、按时间排序的行程索引
+
+每天的行程按开始时间（解析为分钟数）有序保存，插入时用二分查找定位，
+渲染时直接按顺序读取，不再每次排序；另有 item_id -> 行程 的映射，
+按ID查找、删除不需要遍历整天的列表。
+有序的行程也让时间冲突检测只需一次扫描。
+"""
+import bisect
+import heapq
+import itertools
+import re
+
+# 无法解析时间的行程排在当天最后
+UNKNOWN_START = 24 * 60
+
+_TIME_PATTERN = re.compile(r'(\d{1,2})\s*[:：]\s*(\d{2})')
+
+
+def parse_time_range(text):
+    """把 "08:00-10:00" 解析为 (开始分钟, 结束分钟)，无法解析时返回 None
+
+    只有开始时间时结束时间等于开始时间（不与其他行程重叠）。
+    """
+    matches = _TIME_PATTERN.findall(text or '')
+    if not matches:
+        return None
+    minutes = [int(hour) * 60 + int(minute) for hour, minute in matches[:2]]
+    start = minutes[0]
+    end = minutes[1] if len(minutes) > 1 else start
+    if end < start:
+        # 跨越午夜，例如 "22:00-01:00"
+        end += 24 * 60
+    return start, end
+
+
+class ItineraryIndex:
+    """房间全部行程：{day: 按时间排序的行程列表}，外加 item_id 索引"""
+
+    def __init__(self):
+        self._keys = {}        # day -> [(开始分钟, 序号)]，与 _items 一一对应
+        self._items = {}       # day -> [item]
+        self._by_id = {}       # item_id -> (day, key)
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_dict(cls, itinerary):
+        """从 {day: [item]} 构建索引"""
+        index = cls()
+        for day, items in itinerary.items():
+            index._keys.setdefault(day, [])
+            index._items.setdefault(day, [])
+            for item in items:
+                index.add(day, item)
+        return index
+
+    def to_dict(self):
+        """导出为 {day: [item]}（按时间排序，列表是新建的）"""
+        return {day: list(items) for day, items in self._items.items()}
+
+    def _key(self, item):
+        parsed = parse_time_range(item.get('time', ''))
+        return (parsed[0] if parsed else UNKNOWN_START, next(self._seq))
+
+    def add(self, day, item):
+        """按开始时间插入一条行程；ID 已存在时先移除旧的"""
+        item_id = item.get('id')
+        if item_id is not None and item_id in self._by_id:
+            self.remove(item_id)
+        key = self._key(item)
+        keys = self._keys.setdefault(day, [])
+        position = bisect.bisect_right(keys, key)
+        keys.insert(position, key)
+        self._items.setdefault(day, []).insert(position, item)
+        if item_id is not None:
+            self._by_id[item_id] = (day, key)
+
+    def remove(self, item_id):
+        """按ID删除行程，返回 (day, item)；不存在时返回 None"""
+        entry = self._by_id.pop(item_id, None)
+        if entry is None:
+            return None
+        day, key = entry
+        keys = self._keys[day]
+        position = bisect.bisect_left(keys, key)
+        keys.pop(position)
+        return day, self._items[day].pop(position)
+
+    def get(self, item_id):
+        """按ID查找行程，返回 (day, item) 或 None"""
+        entry = self._by_id.get(item_id)
+        if entry is None:
+            return None
+        day, key = entry
+        return day, self._items[day][bisect.bisect_left(self._keys[day], key)]
+
+    def day_items(self, day):
+        """某一天按时间排序的行程（只读，不要修改返回的列表）"""
+        return self._items.get(day, [])
+
+    def days(self):
+        return list(self._items)
+
+    def items(self):
+        """(day, 当天行程列表)，与 dict.items() 用法相同"""
+        return self._items.items()
+
+    def __contains__(self, item_id):
+        return item_id in self._by_id
+
+    def __len__(self):
+        return sum(len(items) for items in self._items.values())
+
+    def conflicts(self, day, everyone=()):
+        """检测同一天内同一人的时间重叠
+
+        返回 [(先开始的行程, 后开始的行程, 冲突人员)]。
+        参与人员为空表示所有人（everyone）。行程已按开始时间排序，
+        扫描时只需与尚未结束的行程比较。
+        """
+        everyone = set(everyone)
+        result = []
+        active = []            # (结束分钟, 序号, 行程, 参与人员)
+        for (_, seq), item in zip(self._keys.get(day, []), self._items.get(day, [])):
+            parsed = parse_time_range(item.get('time', ''))
+            if parsed is None:
+                continue
+            start, end = parsed
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+            people = set(item.get('participants') or everyone)
+            for _, _, other, other_people in active:
+                shared = people & other_people
+                if shared:
+                    result.append((other, item, sorted(shared)))
+            if end > start:
+                heapq.heappush(active, (end, seq, item, people))
+        return result
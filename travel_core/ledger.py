@@ -0,0 +1,241 @@
+"""开销的列式账本
+
+每条开销是一行：日期、金额（整数分）、付款人编码、类别编码、是否AA、分摊人位图。
+付款人和分摊人是人员 ID，改名不影响账本。
+付款人和类别用编码（类似 pandas 的 Categorical）存储，分摊人用 uint64 位图，
+各种汇总（每日合计、类别统计、AA分摊）都是 NumPy 的向量化运算。
+删除只打标记，删除的行过多时再压缩。
+"""
+import numpy as np
+
+from .money import allocate, to_cents
+
+# 个人开销不参与分摊
+PERSONAL_CATEGORY = '个人'
+EXPENSE_CATEGORIES = ('餐饮', '交通', '门票', '住宿', '购物', PERSONAL_CATEGORY)
+
+
+class Ledger:
+    """开销的列式存储"""
+
+    def __init__(self, capacity=64):
+        self.names = []             # 人员编码 -> 人员 ID
+        self._name_codes = {}
+        self.categories = []        # 类别编码 -> 类别
+        self._category_codes = {}
+        self._ids = {}              # expense_id -> 行号
+        self._size = 0
+        self._deleted = 0
+        self._allocate(capacity, words=1)
+
+    def _allocate(self, capacity, words):
+        self.day = np.zeros(capacity, dtype=np.int32)
+        self.amount = np.zeros(capacity, dtype=np.int64)     # 单位：分
+        self.payer = np.zeros(capacity, dtype=np.int32)
+        self.category = np.zeros(capacity, dtype=np.int32)
+        self.is_aa = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.sharers = np.zeros((capacity, words), dtype=np.uint64)
+
+    def _grow(self, capacity=None, words=None):
+        """扩容（行数翻倍，或位图增加一列 64 位）"""
+        old = (self.day, self.amount, self.payer, self.category, self.is_aa, self.alive, self.sharers)
+        size = self._size
+        capacity = capacity or len(self.day)
+        words = words or self.sharers.shape[1]
+        self._allocate(capacity, words)
+        for new_column, old_column in zip(
+                (self.day, self.amount, self.payer, self.category, self.is_aa, self.alive), old[:6]):
+            new_column[:size] = old_column[:size]
+        self.sharers[:size, :old[6].shape[1]] = old[6][:size]
+
+    def _name_code(self, name):
+        code = self._name_codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self.names.append(name)
+            self._name_codes[name] = code
+            if code >= self.sharers.shape[1] * 64:
+                self._grow(words=self.sharers.shape[1] + 1)
+        return code
+
+    def _category_code(self, category):
+        code = self._category_codes.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self._category_codes[category] = code
+        return code
+
+    def __len__(self):
+        return self._size - self._deleted
+
+    def __contains__(self, expense_id):
+        return expense_id in self._ids
+
+    def append(self, expense, day):
+        """追加一条开销（与 new_expense 相同的字典结构）"""
+        expense_id = expense.get('id')
+        if expense_id in self._ids:
+            return
+
+        # 先分配所有编码：新人员可能使位图扩容（扩容只复制已写入的行），之后再写入这一行
+        payer = expense.get('payer', '')
+        payer_code = self._name_code(payer)
+        category_code = self._category_code(expense.get('category', '其他'))
+        is_aa = expense.get('category') != PERSONAL_CATEGORY and 'sharers' in expense
+        sharer_codes = []
+        if is_aa:
+            # 付款人自动包含在分摊人中
+            sharer_codes = [self._name_code(name) for name in expense.get('sharers', [])] + [payer_code]
+        if self._size == len(self.day):
+            self._grow(capacity=len(self.day) * 2)
+
+        row = self._size
+        self.day[row] = int(day)
+        self.amount[row] = to_cents(expense.get('amount', 0.0))
+        self.payer[row] = payer_code
+        self.category[row] = category_code
+        self.alive[row] = True
+        self.is_aa[row] = is_aa
+        self.sharers[row] = 0
+        for code in sharer_codes:
+            self.sharers[row, code // 64] |= np.uint64(1 << (code % 64))
+
+        self._ids[expense_id] = row
+        self._size += 1
+
+    def delete(self, expense_id):
+        row = self._ids.pop(expense_id, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self._deleted += 1
+        if self._deleted > 64 and self._deleted * 2 > self._size:
+            self.compact()
+
+    def compact(self):
+        """移除已删除的行"""
+        keep = np.flatnonzero(self.alive[:self._size])
+        remap = {row: new_row for new_row, row in enumerate(keep.tolist())}
+        for column in (self.day, self.amount, self.payer, self.category, self.is_aa, self.alive):
+            column[:len(keep)] = column[keep]
+        self.sharers[:len(keep)] = self.sharers[keep]
+        self.alive[len(keep):self._size] = False
+        self._ids = {expense_id: remap[row] for expense_id, row in self._ids.items()}
+        self._size = len(keep)
+        self._deleted = 0
+
+    def _live(self):
+        return np.flatnonzero(self.alive[:self._size])
+
+
+    # ========== 汇总（金额单位均为分） ==========
+    def total_amount(self):
+        return int(self.amount[self._live()].sum())
+
+    def day_totals(self):
+        """每天的总开销和AA总金额 {day: (total, aa_total)}"""
+        rows = self._live()
+        if len(rows) == 0:
+            return {}
+        days = self.day[rows]
+        amounts = self.amount[rows]
+        totals = _sum_by(days, amounts, 0)
+        aa_totals = _sum_by(days, amounts * self.is_aa[rows], len(totals))
+        return {
+            str(day): (int(totals[day]), int(aa_totals[day]))
+            for day in np.unique(days).tolist()
+        }
+
+    def category_totals(self):
+        rows = self._live()
+        totals = _sum_by(self.category[rows], self.amount[rows], len(self.categories))
+        counts = np.bincount(self.category[rows], minlength=len(self.categories))
+        return {
+            category: int(totals[code])
+            for code, category in enumerate(self.categories) if counts[code]
+        }
+
+    def payment_summary(self):
+        """每个付款人的支付总额和各类别金额"""
+        rows = self._live()
+        num_names, num_categories = len(self.names), len(self.categories)
+        payers = self.payer[rows]
+        amounts = self.amount[rows]
+        counts = np.bincount(payers, minlength=num_names)
+        paid = _sum_by(payers, amounts, num_names)
+        by_category = _sum_by(
+            payers * num_categories + self.category[rows],
+            amounts, num_names * num_categories
+        ).reshape(num_names, num_categories)
+        category_counts = np.bincount(
+            payers * num_categories + self.category[rows],
+            minlength=num_names * num_categories
+        ).reshape(num_names, num_categories)
+
+        summary = {}
+        for code in np.flatnonzero(counts).tolist():
+            summary[self.names[code]] = {
+                'total_paid': int(paid[code]),
+                'categories': {
+                    self.categories[c]: int(by_category[code, c])
+                    for c in np.flatnonzero(category_counts[code]).tolist()
+                }
+            }
+        return summary
+
+    def aa_summary(self):
+        """按分摊人组合分组，计算总额、每人应摊、每人支付和差额
+
+        组内总额按名字顺序用最大余数法分摊，各人应摊之和严格等于总额，
+        因此所有差额之和严格为零。
+        """
+        rows = self._live()
+        rows = rows[self.is_aa[rows]]
+        if len(rows) == 0:
+            return {}
+
+        num_names = len(self.names)
+        groups, inverse = np.unique(self.sharers[rows], axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        amounts = self.amount[rows]
+        group_totals = _sum_by(inverse, amounts, len(groups))
+        payments = _sum_by(
+            inverse * num_names + self.payer[rows],
+            amounts, len(groups) * num_names
+        ).reshape(len(groups), num_names)
+
+        aa_results = {}
+        for g, mask_words in enumerate(groups.tolist()):
+            codes = [
+                word_index * 64 + bit
+                for word_index, word in enumerate(mask_words)
+                for bit in range(64) if word >> bit & 1
+            ]
+            sharers = tuple(sorted(self.names[code] for code in codes))
+            total_amount = int(group_totals[g])
+            shares = dict(zip(sharers, allocate(total_amount, len(sharers))))
+            group_payments = {self.names[code]: int(payments[g, code]) for code in codes}
+            aa_results[sharers] = {
+                'total_amount': total_amount,
+                'average_per_person': total_amount / len(sharers),
+                'shares': shares,
+                'payments': {traveler: group_payments[traveler] for traveler in sharers},
+                'differences': {
+                    traveler: group_payments[traveler] - shares[traveler]
+                    for traveler in sharers
+                }
+            }
+        return aa_results
+
+
+def _sum_by(keys, amounts, minlength):
+    """按整数键对金额（分）分组求和，长度同 np.bincount(keys, minlength=minlength)
+
+    直接用 int64 累加（np.add.at），不经过 float64，合计超过 2^53 分时也是精确的。
+    """
+    size = max(minlength, int(keys.max()) + 1) if len(keys) else minlength
+    totals = np.zeros(size, dtype=np.int64)
+    np.add.at(totals, keys, amounts)
+    return totals
@@ -0,0 +1,112 @@
+"""合并导入：把导出的文件并入现有房间，而不是整体覆盖
+
+- 人员按名字对应到房间中已有的人员，新名字作为新人员加入；
+- 行程和开销按 id 去重：房间中没有的直接加入，两边都有且内容不同时，
+  edit_time 较新的一方胜出（缺少 edit_time 时用各自 data_version 的时间）；
+- 所有比较都基于 id 的哈希集合和字典，合并耗时与记录数成线性关系。
+"""
+from .oplog import copy_record
+from .travelers import new_traveler_id
+from .versioning import rev_of
+
+
+class MergePlan:
+    """合并需要做的修改，以及各类记录的统计"""
+
+    def __init__(self):
+        self.travelers = []         # 新加入的人员记录
+        self.itinerary = []         # 新增或更新的行程 [(day, item)]
+        self.expenses = []          # 新增或更新的开销 [(day, expense)]
+        self.total_days = None
+        self.added = 0              # 房间中原来没有的记录
+        self.updated = 0            # 文件中的版本较新，替换了房间中的记录
+        self.kept = 0               # 房间中的版本较新或相同，保留不变
+
+    def __bool__(self):
+        return bool(self.travelers or self.itinerary or self.expenses or self.total_days)
+
+
+def _remap_travelers(room, records, plan):
+    """导入文件中的人员 ID -> 房间中的人员 ID"""
+    room_records = room.travelers.to_records()
+    used_ids = {record['id'] for record in room_records}
+    room_ids_by_name = {}
+    for record in sorted(room_records, key=lambda record: record['removed']):
+        # 优先对应当前人员；已删除的人员也参与对应，避免同名人员重复出现
+        room_ids_by_name.setdefault(record['name'], record['id'])
+
+    mapping = {}
+    for record in records:
+        traveler_id = room_ids_by_name.get(record['name'])
+        if traveler_id is None:
+            traveler_id = record['id']
+            while traveler_id in used_ids:
+                traveler_id = new_traveler_id()
+            used_ids.add(traveler_id)
+            plan.travelers.append({'id': traveler_id, 'name': record['name'],
+                                   'removed': record.get('removed', False)})
+            room_ids_by_name[record['name']] = traveler_id
+        mapping[record['id']] = traveler_id
+    return mapping
+
+
+def _remap_record(record, fields, list_fields, mapping):
+    record = copy_record(record)
+    for field in fields:
+        if field in record:
+            record[field] = mapping.get(record[field], record[field])
+    for field in list_fields:
+        if field in record:
+            record[field] = [mapping.get(ref, ref) for ref in record[field]]
+    return record
+
+
+def _merge_section(incoming, existing, incoming_time, existing_time, plan, out,
+                   fields, list_fields, mapping):
+    """incoming: {day: [record]}；existing: {id: (day, record)}"""
+    for day, records in incoming.items():
+        for record in records:
+            record = _remap_record(record, fields, list_fields, mapping)
+            current = existing.get(record['id'])
+            if current is None:
+                plan.added += 1
+                out.append((day, record))
+                continue
+            current_day, current_record = current
+            if current_day == day and current_record == record:
+                plan.kept += 1
+            elif record.get('edit_time', incoming_time) > current_record.get('edit_time', existing_time):
+                # 版本号加一：基于旧版本的并发修改会按合并规则处理
+                record['rev'] = rev_of(current_record) + 1
+                plan.updated += 1
+                out.append((day, record))
+            else:
+                plan.kept += 1
+
+
+def plan_merge(room, result):
+    """根据导入结果（importer.ImportResult）计算合并方案，调用方需持有房间锁"""
+    plan = MergePlan()
+    mapping = _remap_travelers(room, result.state['travelers'], plan)
+
+    data_version = result.fields.get('data_version')
+    incoming_time = data_version.get('timestamp', 0) if isinstance(data_version, dict) else 0
+    existing_time = room.data_version.get('timestamp', 0)
+
+    existing_items = {}
+    for day, items in room.itinerary.items():
+        for item in items:
+            existing_items[item.get('id')] = (day, item)
+    _merge_section(result.state['itinerary'], existing_items, incoming_time, existing_time,
+                   plan, plan.itinerary, ('editor',), ('participants',), mapping)
+
+    existing_expenses = {}
+    for day, expenses in room.expenses.items():
+        for expense in expenses:
+            existing_expenses[expense.get('id')] = (day, expense)
+    _merge_section(result.state['expenses'], existing_expenses, incoming_time, existing_time,
+                   plan, plan.expenses, ('payer', 'editor'), ('sharers',), mapping)
+
+    if result.state['total_days'] > room.total_days:
+        plan.total_days = result.state['total_days']
+    return plan
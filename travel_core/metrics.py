@@ -0,0 +1,154 @@
+"""页面运行耗时与计数指标
+
+进程内所有会话共用一个 Metrics：记录页面各部分的渲染耗时（次数、总耗时、最大耗时）
+和按触发来源统计的重新运行次数；房间规模在导出时从房间注册表现场读取。
+可以渲染为 Prometheus 文本格式，或压缩为一行日志。
+
+房间ID就是加入房间的凭据，对外的指标（Prometheus 文本、管理面板）只给出所有房间的汇总，
+不带房间ID。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """耗时计时器与计数器（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}        # name -> [次数, 总耗时, 最大耗时]（秒）
+        self._counters = {}      # (name, label) -> 次数
+        self.started = time.time()
+
+    @contextmanager
+    def timer(self, name):
+        """统计 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            entry = self._timers.get(name)
+            if entry is None:
+                self._timers[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    def count(self, name, label='', amount=1):
+        key = (name, label)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def timers(self):
+        """{name: (次数, 总耗时, 最大耗时)}，按总耗时倒序"""
+        with self._lock:
+            items = [(name, tuple(entry)) for name, entry in self._timers.items()]
+        items.sort(key=lambda item: item[1][1], reverse=True)
+        return dict(items)
+
+    def counters(self, name):
+        """{label: 次数}，按次数倒序"""
+        with self._lock:
+            items = [(label, value) for (key, label), value in self._counters.items() if key == name]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return dict(items)
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+
+def room_sizes(registry):
+    """{room_id: {'travelers', 'itinerary', 'expenses', 'online', 'replay_length'}}"""
+    online = registry.presence.room_sizes()
+    sizes = {}
+    for room_id in registry.room_ids():
+        room = registry.get(room_id)
+        with room.lock:
+            sizes[room_id] = {
+                'travelers': len(room.travelers),
+                'itinerary': len(room.itinerary),
+                'expenses': sum(len(day_expenses) for day_expenses in room.expenses.values()),
+                'online': online.get(room_id, 0),
+                'replay_length': room.replay_length,
+            }
+    return sizes
+
+
+ROOM_FIELDS = ('travelers', 'itinerary', 'expenses', 'online', 'replay_length')
+
+
+def room_totals(registry):
+    """所有房间汇总的规模：{'rooms': 房间数, 字段: (合计, 单个房间的最大值)}，不含房间ID"""
+    sizes = list(room_sizes(registry).values())
+    totals = {'rooms': len(sizes)}
+    for field in ROOM_FIELDS:
+        values = [entry[field] for entry in sizes]
+        totals[field] = (sum(values), max(values, default=0))
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(metrics, registry=None):
+    """Prometheus 文本格式（exposition format 0.0.4）"""
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    timers = metrics.timers()
+    lines.append("# HELP travel_section_seconds 页面各部分的渲染耗时")
+    lines.append("# TYPE travel_section_seconds summary")
+    for name, (count, total, _) in timers.items():
+        lines.append(f'travel_section_seconds_sum{{section="{_escape(name)}"}} {total:.6f}')
+        lines.append(f'travel_section_seconds_count{{section="{_escape(name)}"}} {count}')
+    family('travel_section_seconds_max', 'gauge', "页面各部分的最大渲染耗时",
+           [((('section', name), ), f"{peak:.6f}") for name, (_, _, peak) in timers.items()])
+    family('travel_reruns_total', 'counter', "按触发来源统计的重新运行次数",
+           [((('trigger', label), ), value) for label, value in metrics.counters('rerun').items()])
+
+    if registry is not None:
+        totals = room_totals(registry)
+        samples = {
+            field: [((('stat', 'sum'), ), totals[field][0]), ((('stat', 'max'), ), totals[field][1])]
+            for field in ROOM_FIELDS
+        }
+        family('travel_rooms', 'gauge', "内存中的房间数", [((), totals['rooms'])])
+        family('travel_room_travelers', 'gauge', "房间人数", samples['travelers'])
+        family('travel_room_itinerary_items', 'gauge', "房间行程数", samples['itinerary'])
+        family('travel_room_expenses', 'gauge', "房间开销数", samples['expenses'])
+        family('travel_room_online', 'gauge', "房间在线人数", samples['online'])
+        family('travel_room_replay_length', 'gauge', "从快照加载时需要重放的操作数",
+               samples['replay_length'])
+    return '\n'.join(lines) + '\n'
+
+
+def log_line(metrics, registry=None):
+    """一行摘要：各部分平均耗时（毫秒）、重新运行次数和房间规模"""
+    parts = [
+        f"{name}={total / count * 1000:.1f}ms/{count}"
+        for name, (count, total, _) in metrics.timers().items()
+    ]
+    reruns = metrics.counters('rerun')
+    parts.append(f"reruns={sum(reruns.values())}")
+    if registry is not None:
+        sizes = room_sizes(registry)
+        parts.append(f"rooms={len(sizes)}")
+        parts.append(f"expenses={sum(entry['expenses'] for entry in sizes.values())}")
+    return ' '.join(parts)
@@ -0,0 +1,53 @@
+"""金额处理：内部统一使用整数"分"
+
+界面和导出数据中的金额仍是以"元"为单位的小数，进入账本时转换为整数分，
+求和、分摊都是精确的整数运算，不再需要用 0.01 的误差判断是否平衡。
+"""
+import math
+from decimal import Decimal, ROUND_HALF_UP
+
+# 单笔金额上限（元）：上千万笔开销的合计换算成分后仍在 int64 范围内
+MAX_AMOUNT = 10 ** 9
+
+
+def is_valid_amount(amount):
+    """可以记入账本的金额（元）：0 到 MAX_AMOUNT 之间的有限数字
+
+    JSON 可以写出 Infinity、1e20 这样的值，它们无法换算成 int64 的分。
+    """
+    return (
+        isinstance(amount, (int, float)) and not isinstance(amount, bool)
+        and math.isfinite(amount) and 0 <= amount <= MAX_AMOUNT
+    )
+
+
+def to_cents(amount):
+    """元 -> 分（四舍五入到分）；金额不是 0 到 MAX_AMOUNT 之间的有限数字时抛出 ValueError"""
+    if not is_valid_amount(amount):
+        raise ValueError(f"金额 {amount!r} 应为 0 到 {MAX_AMOUNT} 元之间的数")
+    if isinstance(amount, int):
+        return amount * 100
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def to_yuan(cents):
+    """分 -> 元（用于导出和显示）"""
+    return cents / 100
+
+
+def format_yuan(cents, decimals=2):
+    """格式化为 ¥x.xx"""
+    sign = '-' if cents < 0 else ''
+    return f"{sign}¥{abs(cents) / 100:.{decimals}f}"
+
+
+def allocate(total_cents, count):
+    """把总额平均分成 count 份（最大余数法）
+
+    每份先得到 total // count，余下的几分钱依次分给前面的几份，
+    各份之和严格等于总额；调用方按固定顺序（如名字排序）传入，结果是确定的。
+    """
+    if count <= 0:
+        return []
+    base, remainder = divmod(total_cents, count)
+    return [base + 1] * remainder + [base] * (count - remainder)
@@ -0,0 +1,368 @@
+"""房间操作日志（增量同步）
+
+房间的每一次修改都记录为一条操作，操作的 version 即修改后的 data_version。
+客户端记住自己同步到的版本号 N，之后只需获取并应用 N 之后的操作，
+不必重新加载整个房间。
+"""
+import bisect
+import copy
+import itertools
+
+from .itinerary import ItineraryIndex
+from .records import Expense, ItineraryItem, records_by_day
+from .travelers import TravelerDirectory, from_legacy, is_legacy
+from .versioning import resolve_update
+
+
+# 操作类型
+ADD_ITEM = 'add_item'
+DELETE_ITEM = 'delete_item'
+ADD_EXPENSE = 'add_expense'
+DELETE_EXPENSE = 'delete_expense'
+UPDATE_ITEM = 'update_item'                  # 按记录版本号修改（见 versioning.py）
+UPDATE_EXPENSE = 'update_expense'
+RENAME_TRAVELER = 'rename_traveler'          # 修改人员记录的名字（引用的是 ID，无需改写其他记录）
+SET_TRAVELER_NAME = 'set_traveler_name'      # 旧版操作，与 RENAME_TRAVELER 相同
+ADD_TRAVELER = 'add_traveler'
+REMOVE_TRAVELER = 'remove_traveler'
+SET_TOTAL_DAYS = 'set_total_days'
+REPLACE = 'replace'                          # 导入或清空：整体替换房间数据
+MERGE = 'merge'                              # 合并导入：加入人员，按 id 新增或替换行程和开销
+
+# 房间数据的组成部分，界面按部分声明依赖，只刷新受影响的区域
+SECTIONS = ('travelers', 'itinerary', 'expenses', 'days')
+
+_OP_SECTIONS = {
+    ADD_ITEM: ('itinerary',),
+    DELETE_ITEM: ('itinerary',),
+    ADD_EXPENSE: ('expenses',),
+    DELETE_EXPENSE: ('expenses',),
+    UPDATE_ITEM: ('itinerary',),
+    UPDATE_EXPENSE: ('expenses',),
+    RENAME_TRAVELER: ('travelers',),
+    SET_TRAVELER_NAME: ('travelers',),
+    ADD_TRAVELER: ('travelers',),
+    REMOVE_TRAVELER: ('travelers',),
+    SET_TOTAL_DAYS: ('days',),
+}
+
+
+def op_sections(op):
+    """操作修改的数据部分；整体替换、合并导入及未知操作视为修改全部"""
+    return _OP_SECTIONS.get(op['op'], SECTIONS)
+
+
+def make_op(op_type, **fields):
+    """创建一条操作，记录内容会被深拷贝，之后对原记录的修改不影响日志"""
+    op = {'op': op_type}
+    for key, value in fields.items():
+        op[key] = copy.deepcopy(value)
+    return op
+
+
+def copy_record(record):
+    """复制一条行程或开销记录，得到可以修改、可以写成 JSON 的字典
+
+    记录是扁平的 JSON 对象（值为标量或名字/ID 列表），只需复制字典本身和其中的列表，
+    比 deepcopy 快得多；房间中的 ItineraryItem / Expense 记录的名单为元组，同样转换为列表。
+    """
+    return {
+        key: list(value) if isinstance(value, (list, tuple)) else value
+        for key, value in record.items()
+    }
+
+
+def empty_state():
+    return {
+        'travelers': [],         # 人员记录 [{'id', 'name', 'removed'}]
+        'itinerary': {},
+        'expenses': {},
+        'total_days': 3,
+    }
+
+
+class ExpenseIndex:
+    """开销的 expense_id 索引，与 state.expenses（{day: [开销]}）一起维护
+
+    每天的开销按添加顺序排列；每条开销对应一个递增的序号，序号列表与当天的开销列表
+    一一对应、同样有序，按ID查找、替换、删除时用二分查找定位下标，
+    不需要遍历整天的列表（与 ItineraryIndex 的 _by_id 相同）。
+    state.expenses 的所有修改都经过这个类。
+    """
+
+    def __init__(self, expenses):
+        self.expenses = expenses
+        self._keys = {}        # day -> [序号]，与 expenses[day] 一一对应
+        self._by_id = {}       # expense_id -> (day, 序号)
+        self._seq = itertools.count()
+        for day, day_expenses in expenses.items():
+            keys = self._keys.setdefault(day, [])
+            for expense in day_expenses:
+                seq = next(self._seq)
+                keys.append(seq)
+                self._by_id[expense['id']] = (day, seq)
+
+    def find(self, expense_id):
+        """按ID查找开销，返回 (day, 开销, 下标)；不存在时返回 None"""
+        entry = self._by_id.get(expense_id)
+        if entry is None:
+            return None
+        day, seq = entry
+        index = bisect.bisect_left(self._keys[day], seq)
+        return day, self.expenses[day][index], index
+
+    def append(self, day, expense):
+        """添加到当天的最后；ID 已存在时先移除旧的"""
+        if expense['id'] in self._by_id:
+            self.remove(expense['id'])
+        seq = next(self._seq)
+        self.expenses.setdefault(day, []).append(expense)
+        self._keys.setdefault(day, []).append(seq)
+        self._by_id[expense['id']] = (day, seq)
+
+    def put(self, day, expense):
+        """新增或替换：同一天内原位替换（保持顺序），换了天则移到新的一天最后"""
+        found = self.find(expense['id'])
+        if found is not None and found[0] == day:
+            self.expenses[day][found[2]] = expense
+        else:
+            self.append(day, expense)
+
+    def remove(self, expense_id):
+        """按ID删除开销，返回 (day, 开销)；不存在时返回 None"""
+        found = self.find(expense_id)
+        if found is None:
+            return None
+        day, expense, index = found
+        del self.expenses[day][index]
+        del self._keys[day][index]
+        del self._by_id[expense_id]
+        return day, expense
+
+    def __contains__(self, expense_id):
+        return expense_id in self._by_id
+
+
+def set_expenses(state, expenses):
+    """整体替换 state 的开销（{day: [开销]}）并重建索引"""
+    state.expenses = expenses
+    state.expense_index = ExpenseIndex(expenses)
+
+
+def apply_operation(state, op):
+    """把一条操作应用到 state（带 travelers/itinerary/expenses 等属性的对象）
+
+    state.travelers 为 TravelerDirectory，state.itinerary 为 ItineraryIndex，
+    state.expenses 为 {day: [开销]}，由 state.expense_index（ExpenseIndex）维护，
+    行程和开销保存为只读的 ItineraryItem / Expense 记录（records.py）。
+
+    返回受影响的记录列表 [(kind, day, record_id, record)]，
+    kind 为 'itinerary' 或 'expenses'，record 为 None 表示已删除。
+    """
+    op_type = op['op']
+    changes = []
+
+    if op_type == ADD_ITEM:
+        item = ItineraryItem(op['record'])
+        state.itinerary.add(op['day'], item)
+        changes.append(('itinerary', op['day'], item['id'], item))
+
+    elif op_type == DELETE_ITEM:
+        state.itinerary.remove(op['id'])
+        changes.append(('itinerary', op['day'], op['id'], None))
+
+    elif op_type == ADD_EXPENSE:
+        expense = Expense(op['record'])
+        state.expense_index.append(op['day'], expense)
+        changes.append(('expenses', op['day'], expense['id'], expense))
+
+    elif op_type == DELETE_EXPENSE:
+        state.expense_index.remove(op['id'])
+        changes.append(('expenses', op['day'], op['id'], None))
+
+    elif op_type == UPDATE_ITEM:
+        found = state.itinerary.get(op['id'])
+        if 'record' not in op:
+            _resolve(op, found)
+        if found is not None and op['record'] is not None:
+            item = ItineraryItem(op['record'])
+            state.itinerary.add(found[0], item)
+            changes.append(('itinerary', found[0], item['id'], item))
+
+    elif op_type == UPDATE_EXPENSE:
+        found = state.expense_index.find(op['id'])
+        if 'record' not in op:
+            _resolve(op, found)
+        if found is not None and op['record'] is not None:
+            day, index = found[0], found[2]
+            expense = Expense(op['record'])
+            state.expenses[day][index] = expense
+            changes.append(('expenses', day, expense['id'], expense))
+
+    elif op_type in (RENAME_TRAVELER, SET_TRAVELER_NAME):
+        state.travelers.rename(_traveler_id(state, op), op['name'] if 'name' in op else op['new'])
+
+    elif op_type == ADD_TRAVELER:
+        state.travelers.add(op['traveler_id'], op['name'])
+
+    elif op_type == REMOVE_TRAVELER:
+        state.travelers.remove(_traveler_id(state, op))
+
+    elif op_type == SET_TOTAL_DAYS:
+        state.total_days = op['days']
+
+    elif op_type == REPLACE:
+        # 记录在转换时复制，不与操作共用；只有旧版数据需要先整体复制再转换人员引用
+        new_state = op['state']
+        if is_legacy(new_state):
+            new_state = from_legacy(copy.deepcopy(new_state))
+        state.travelers = TravelerDirectory.from_records(new_state['travelers'])
+        state.itinerary = ItineraryIndex.from_dict(records_by_day(new_state['itinerary'], ItineraryItem))
+        set_expenses(state, records_by_day(new_state['expenses'], Expense))
+        state.total_days = new_state['total_days']
+        for day, items in state.itinerary.items():
+            for item in items:
+                changes.append(('itinerary', day, item['id'], item))
+        for day, expenses in state.expenses.items():
+            for expense in expenses:
+                changes.append(('expenses', day, expense['id'], expense))
+
+    elif op_type == MERGE:
+        for record in op['travelers']:
+            state.travelers.add(record['id'], record['name'])
+            if record.get('removed'):
+                state.travelers.remove(record['id'])
+        for day, item in op['itinerary']:
+            item = ItineraryItem(item)
+            state.itinerary.add(day, item)
+            changes.append(('itinerary', day, item['id'], item))
+        # 按ID定位，开销与合并的记录数成正比，与房间大小无关
+        for day, expense in op['expenses']:
+            expense = Expense(expense)
+            state.expense_index.put(day, expense)
+            changes.append(('expenses', day, expense['id'], expense))
+        # 文档合并（crdt.py）产生的删除
+        for kind, record_id, day in op.get('removed', ()):
+            if kind == 'itinerary':
+                state.itinerary.remove(record_id)
+                changes.append(('itinerary', day, record_id, None))
+            else:
+                state.expense_index.remove(record_id)
+                changes.append(('expenses', day, record_id, None))
+        if op.get('total_days'):
+            state.total_days = op['total_days']
+
+    else:
+        raise ValueError(f"未知的操作类型: {op_type}")
+
+    return changes
+
+
+def _resolve(op, found):
+    """首次应用修改操作时（在共享房间中）合并出结果，写回操作
+
+    之后的副本、结算引擎直接使用 op['record']，不需要重新合并。
+    记录已被删除时 op['record'] 为 None（删除优先；RoomState 不再记录这样的操作，
+    旧的操作日志中可能还有）。
+    """
+    if found is None:
+        op['record'] = None
+        op['merged'] = False
+        return
+    day, current = found[0], found[1]
+    op['day'] = day
+    op['record'], op['merged'] = resolve_update(
+        current, op['changes'], op['base_rev'], op['edit_time'], op['editor'])
+
+
+def _traveler_id(state, op):
+    """操作中的人员 ID（旧版操作只记录了名字）"""
+    if 'traveler_id' in op:
+        return op['traveler_id']
+    return state.travelers.id_for_name(op['old'] if 'old' in op else op['name'])
+
+
+class OperationLog:
+    """单个房间的只追加操作日志，按版本号有序"""
+
+    def __init__(self, base_version=0):
+        # base_version 之前的操作不在内存中
+        self.base_version = base_version
+        self._ops = []
+        self._versions = []
+
+    def append(self, op):
+        self._ops.append(op)
+        self._versions.append(op['version'])
+
+    def since(self, version):
+        """返回版本号大于 version 的操作；所需历史不在内存中时返回 None"""
+        if version < self.base_version:
+            return None
+        index = bisect.bisect_right(self._versions, version)
+        return self._ops[index:]
+
+    @property
+    def last_version(self):
+        return self._versions[-1] if self._versions else self.base_version
+
+    def compact(self, up_to_version):
+        """丢弃版本号不大于 up_to_version 的操作（更早的历史仍可从持久化存储读取）"""
+        if up_to_version <= self.base_version:
+            return 0
+        index = bisect.bisect_right(self._versions, up_to_version)
+        del self._ops[:index]
+        del self._versions[:index]
+        self.base_version = up_to_version
+        return index
+
+    def __len__(self):
+        return len(self._ops)
+
+
+class RoomReplica:
+    """房间数据的客户端副本，通过操作日志增量同步"""
+
+    def __init__(self):
+        self.version = -1
+        # 最近一次整体加载时，在快照之后重放的操作数
+        self.last_replay = 0
+        self.load_state(empty_state(), -1)
+
+    def load_state(self, state, version):
+        """整体加载（首次同步，或所需历史已不可用时）"""
+        self.travelers = TravelerDirectory.from_records(state['travelers'])
+        self.itinerary = ItineraryIndex.from_dict(records_by_day(state['itinerary'], ItineraryItem))
+        set_expenses(self, records_by_day(state['expenses'], Expense))
+        self.total_days = state['total_days']
+        self.version = version
+
+    def apply(self, ops):
+        """按顺序应用一批操作，跳过已经应用过的版本"""
+        for op in ops:
+            if op['version'] <= self.version:
+                continue
+            apply_operation(self, op)
+            self.version = op['version']
+
+    def sync(self, registry, room, wait=None):
+        """与共享房间同步，返回本次应用的操作数（整体加载时返回 None）
+
+        wait 不为 None 时，先最多等待 wait 秒直到房间出现新版本。
+        """
+        if wait is not None and self.version >= 0:
+            room.wait_for_version(self.version, wait)
+        ops = registry.ops_since(room, self.version) if self.version >= 0 else None
+        if ops is None:
+            # 优先从后台生成的快照开始，再重放快照之后的操作
+            snapshot = registry.load_snapshot(room)
+            tail = registry.ops_since(room, snapshot[1]) if snapshot is not None else None
+            if tail is None:
+                snapshot = room.snapshot()
+                tail = []
+            self.load_state(*snapshot)
+            self.apply(tail)
+            self.last_replay = len(tail)
+            return None
+        self.apply(ops)
+        return len(ops)
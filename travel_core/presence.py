@@ -0,0 +1,104 @@
+"""在线状态：所有会话共享的心跳记录
+
+每个房间一个分组 {user_id: 在线信息}，另有一个按最后活动时间排序的最小堆，
+用于清理长时间没有心跳的用户。心跳只向堆中追加一项（O(log n)），
+清理时从堆顶弹出已超时的项，不需要扫描所有房间的所有用户。
+
+同一用户多次心跳会在堆中留下旧的项，弹出时与分组中的最新时间比较，
+不一致的旧项直接丢弃；旧项过多时整体重建一次堆。
+"""
+import heapq
+import threading
+import time
+
+# 超过该时间（秒）没有心跳的用户从在线记录中移除
+PRESENCE_TTL = 300
+
+
+class PresenceTracker:
+    """按房间分组的在线用户，带超时清理"""
+
+    def __init__(self, ttl=PRESENCE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rooms = {}         # room_id -> {user_id: 在线信息}
+        self._heap = []          # (last_active, room_id, user_id)
+        self._count = 0          # 所有房间的在线记录数
+
+    def heartbeat(self, room_id, user_id, info, now=None):
+        """记录一次心跳；info 为要显示的在线信息（名字、颜色等）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._rooms.setdefault(room_id, {})
+            if user_id not in bucket:
+                self._count += 1
+            bucket[user_id] = dict(info, user_id=user_id, room_id=room_id, last_active=now)
+            heapq.heappush(self._heap, (now, room_id, user_id))
+            if len(self._heap) > 64 and len(self._heap) > 4 * self._count:
+                self._rebuild()
+            self._expire(now)
+
+    def leave(self, room_id, user_id):
+        with self._lock:
+            bucket = self._rooms.get(room_id)
+            if bucket is not None and bucket.pop(user_id, None) is not None:
+                self._count -= 1
+                if not bucket:
+                    del self._rooms[room_id]
+
+    def expire(self, now=None):
+        """移除超时的用户，返回移除的数量"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._expire(now)
+
+    def online(self, room_id, max_inactive=30, now=None):
+        """房间中最近 max_inactive 秒内有心跳的用户，按最后活动时间倒序"""
+        now = time.time() if now is None else now
+        with self._lock:
+            users = [
+                dict(entry) for entry in self._rooms.get(room_id, {}).values()
+                if now - entry['last_active'] < max_inactive
+            ]
+        users.sort(key=lambda entry: entry['last_active'], reverse=True)
+        return users
+
+    def has_others(self, room_id, user_id):
+        """房间中是否还有其他在线记录"""
+        with self._lock:
+            bucket = self._rooms.get(room_id, {})
+            return len(bucket) > (1 if user_id in bucket else 0)
+
+    def room_sizes(self):
+        """{room_id: 在线记录数}"""
+        with self._lock:
+            return {room_id: len(bucket) for room_id, bucket in self._rooms.items()}
+
+    def __len__(self):
+        return self._count
+
+    def _expire(self, now):
+        deadline = now - self.ttl
+        heap = self._heap
+        removed = 0
+        while heap and heap[0][0] < deadline:
+            last_active, room_id, user_id = heapq.heappop(heap)
+            bucket = self._rooms.get(room_id)
+            entry = bucket.get(user_id) if bucket else None
+            if entry is None or entry['last_active'] != last_active:
+                # 用户之后还有心跳或已离开，这是旧的堆项
+                continue
+            del bucket[user_id]
+            if not bucket:
+                del self._rooms[room_id]
+            self._count -= 1
+            removed += 1
+        return removed
+
+    def _rebuild(self):
+        self._heap = [
+            (entry['last_active'], room_id, user_id)
+            for room_id, bucket in self._rooms.items()
+            for user_id, entry in bucket.items()
+        ]
+        heapq.heapify(self._heap)
@@ -0,0 +1,172 @@
+"""行程和开销的紧凑记录类型
+
+房间中保存的每条行程、开销原来是一个字典，每条都带着一份字段名的哈希表，
+人员名单是可变列表。这里改用 __slots__ 的只读记录：
+
+- 字段存放在固定的槽中，没有逐条的 __dict__，每条记录省去一个字典；
+- 人员引用（付款人、编辑者、分摊人员、参与人员）和类别经过 sys.intern，
+  同一房间成千上万条记录共用同一个字符串对象；
+- 名单保存为元组，记录不可修改，复制时直接共用同一个对象，不需要再复制名单。
+
+记录实现了只读的 Mapping 接口（get、[]、in、items 等），读取方式与原来的字典相同；
+to_dict() / copy_record() 转换回导出 JSON 使用的字典结构（名单为列表，缺少的可选字段不出现）。
+"""
+import sys
+from collections.abc import Mapping
+
+_MISSING = object()
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _intern_all(values):
+    return tuple(_intern(value) for value in values)
+
+
+class _Record(Mapping):
+    """只读记录的公共实现；子类用 FIELDS 声明字段"""
+
+    __slots__ = ('_extra',)
+
+    FIELDS = ()
+    REF_FIELDS = frozenset()       # 单个人员引用或类别，intern
+    LIST_FIELDS = frozenset()      # 人员名单，保存为 intern 后的元组
+
+    def __init__(self, data):
+        setattr_ = object.__setattr__
+        for field in self.FIELDS:
+            value = data.get(field, _MISSING)
+            if value is not _MISSING:
+                if field in self.LIST_FIELDS:
+                    value = _intern_all(value)
+                elif field in self.REF_FIELDS:
+                    value = _intern(value)
+            setattr_(self, field, value)
+        # 未声明的字段（例如其他版本导出的附加信息）原样保留
+        extra_keys = data.keys() - self._FIELD_SET
+        extra = None
+        if extra_keys:
+            extra = {
+                key: list(data[key]) if isinstance(data[key], (list, tuple)) else data[key]
+                for key in extra_keys
+            }
+        setattr_(self, '_extra', extra)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    @classmethod
+    def of(cls, data):
+        """转换为记录；已经是该类型的记录时直接返回（记录不可修改，可以共用）"""
+        return data if type(data) is cls else cls(data)
+
+    # ========== Mapping 接口 ==========
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return getattr(self, key) is not _MISSING
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        count = sum(1 for field in self.FIELDS if getattr(self, field) is not _MISSING)
+        return count + (len(self._extra) if self._extra is not None else 0)
+
+    def __eq__(self, other):
+        # 与字典比较时名单按列表比较，和导出的 JSON 结构一致
+        if isinstance(other, _Record):
+            return type(self) is type(other) and self.to_dict() == other.to_dict()
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    # ========== 只读 ==========
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} 记录不可修改")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} 记录不可修改")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return type(self), (self.to_dict(),)
+
+    def to_dict(self):
+        """导出 JSON 使用的字典（名单为新的列表）"""
+        result = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not _MISSING:
+                result[field] = list(value) if field in self.LIST_FIELDS else value
+        if self._extra is not None:
+            for key, value in self._extra.items():
+                result[key] = list(value) if isinstance(value, list) else value
+        return result
+
+    def replace(self, **changes):
+        """返回修改了部分字段的新记录"""
+        data = self.to_dict()
+        data.update(changes)
+        return type(self)(data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class ItineraryItem(_Record):
+    """一条行程"""
+
+    FIELDS = ('id', 'time', 'project', 'transport', 'location', 'participants', 'editor', 'edit_time', 'rev')
+    REF_FIELDS = frozenset({'editor'})
+    LIST_FIELDS = frozenset({'participants'})
+    __slots__ = FIELDS
+
+
+class Expense(_Record):
+    """一笔开销"""
+
+    FIELDS = ('id', 'payer', 'item', 'category', 'amount', 'day', 'sharers', 'editor', 'edit_time', 'rev')
+    REF_FIELDS = frozenset({'payer', 'category', 'editor'})
+    LIST_FIELDS = frozenset({'sharers'})
+    __slots__ = FIELDS
+
+
+RECORD_TYPES = {'itinerary': ItineraryItem, 'expenses': Expense}
+
+
+def records_by_day(days, record_type):
+    """{day: [字典或记录]} -> {day: [记录]}"""
+    of = record_type.of
+    return {day: [of(record) for record in records] for day, records in days.items()}
@@ -0,0 +1,299 @@
+"""以单个成员视角操作共享房间（与界面无关）
+
+Room 把一个用户在某个房间中的操作组织在一起：加入房间（分配默认名字、登记为同行人员）、
+添加人员、检查其他成员的更新；行程、开销和在线状态分别由 RoomItinerary、RoomLedger、
+RoomPresence 负责。页面只负责读取会话状态、渲染和把输入交给这些类，
+同样的逻辑也可以在后台线程、测试或其他接口中直接使用。
+
+这些类本身不保存数据，数据都在 RoomRegistry 管理的 RoomState 和 PresenceTracker 中，
+每次使用时新建即可。
+"""
+import hashlib
+import time
+import uuid
+
+from .ledger import PERSONAL_CATEGORY
+from .money import to_cents
+
+DEFAULT_NAME_PREFIX = "旅行者"
+MEMBER_COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD', '#98D8C8', '#F7DC6F']
+
+
+def new_record_id():
+    return str(uuid.uuid4())[:8]
+
+
+def next_default_name(names):
+    """最小的未被使用的默认名字（旅行者1、旅行者2……）"""
+    used_numbers = set()
+    for name in names:
+        if name.startswith(DEFAULT_NAME_PREFIX):
+            suffix = name[len(DEFAULT_NAME_PREFIX):]
+            if suffix.isdigit():
+                used_numbers.add(int(suffix))
+    number = 1
+    while number in used_numbers:
+        number += 1
+    return f"{DEFAULT_NAME_PREFIX}{number}"
+
+
+def member_color(user_id):
+    """按用户ID的哈希值分配颜色，同一用户总是同一种颜色"""
+    color_hash = hashlib.md5(user_id.encode()).hexdigest()
+    return MEMBER_COLORS[int(color_hash, 16) % len(MEMBER_COLORS)]
+
+
+class RoomPresence:
+    """一个成员在房间中的在线状态"""
+
+    def __init__(self, tracker, room_id, user_id):
+        self.tracker = tracker
+        self.room_id = room_id
+        self.user_id = user_id
+
+    def heartbeat(self, info, now=None):
+        self.tracker.heartbeat(self.room_id, self.user_id, info, now=now)
+
+    def online(self, max_inactive=30, now=None):
+        """最近 max_inactive 秒内有心跳的成员，按最后活动时间倒序"""
+        return self.tracker.online(self.room_id, max_inactive, now=now)
+
+    def has_others(self):
+        return self.tracker.has_others(self.room_id, self.user_id)
+
+    def leave(self):
+        self.tracker.leave(self.room_id, self.user_id)
+
+
+class RoomItinerary:
+    """房间的行程：按天、按开始时间排列"""
+
+    def __init__(self, state):
+        self.state = state
+
+    def day_items(self, day_str):
+        """当天的行程（副本，渲染时不受其他会话修改的影响）与时间冲突"""
+        with self.state.lock:
+            items = list(self.state.itinerary.day_items(day_str))
+            conflicts = self.state.itinerary.conflicts(day_str, self.state.travelers.ids())
+        return items, conflicts
+
+    def add(self, day_str, time_range, project, transport, location, participants, editor_id, editor):
+        """添加一条行程，返回新建的记录"""
+        item = {
+            'time': time_range,
+            'project': project,
+            'transport': transport,
+            'location': location,
+            'participants': list(participants),
+            'id': new_record_id(),
+            'editor': editor_id,
+            'edit_time': time.time(),
+        }
+        self.state.add_itinerary_item(day_str, item, editor=editor)
+        return item
+
+    def delete(self, day_str, item_id, editor):
+        return self.state.delete_itinerary_item(day_str, item_id, editor=editor)
+
+    def update(self, item_id, changes, base_rev, editor_id, editor):
+        """按记录版本号修改，返回 (修改后的行程, 是否与其他修改合并)"""
+        return self.state.update_itinerary_item(item_id, changes, base_rev, editor_id, editor)
+
+
+class RoomLedger:
+    """房间的开销记录"""
+
+    def __init__(self, state):
+        self.state = state
+
+    def day_expenses(self, day_str):
+        """当天的开销（副本）"""
+        with self.state.lock:
+            return list(self.state.expenses.get(day_str, []))
+
+    def default_sharers(self, payer, category, sharers=()):
+        """分摊人员：个人开销不分摊；未选择时默认全部人员；付款人总是包含在内"""
+        if category == PERSONAL_CATEGORY:
+            return None
+        sharers = list(sharers) or self.state.traveler_ids()
+        if payer not in sharers:
+            sharers.append(payer)
+        return sharers
+
+    def add(self, day_str, payer, item, category, amount, sharers, editor_id, editor):
+        """添加一笔开销（金额单位为元，按分取整），返回新建的记录
+
+        金额超出范围（见 money.MAX_AMOUNT）时抛出 ValueError，不写入房间。
+        """
+        expense = {
+            'payer': payer,
+            'item': item,
+            'category': category,
+            'amount': to_cents(amount) / 100,
+            'day': int(day_str),
+            'id': new_record_id(),
+            'editor': editor_id,
+            'edit_time': time.time(),
+        }
+        sharers = self.default_sharers(payer, category, sharers)
+        if sharers is not None:
+            expense['sharers'] = sharers
+        self.state.add_expense(day_str, expense, editor=editor)
+        return expense
+
+    def delete(self, day_str, expense_id, editor):
+        return self.state.delete_expense(day_str, expense_id, editor=editor)
+
+    def update(self, day_str, expense_id, changes, base_rev, editor_id, editor):
+        """按记录版本号修改，返回 (修改后的开销, 是否与其他修改合并)；金额的规则同 add"""
+        if 'amount' in changes:
+            changes = dict(changes, amount=to_cents(changes['amount']) / 100)
+        return self.state.update_expense(day_str, expense_id, changes, base_rev, editor_id, editor)
+
+
+class Room:
+    """一个成员（user_id）视角的共享房间"""
+
+    def __init__(self, registry, room_id, user_id):
+        self.registry = registry
+        self.room_id = room_id
+        self.user_id = user_id
+
+    @property
+    def state(self):
+        """房间的共享数据（RoomState）"""
+        return self.registry.get(self.room_id)
+
+    @property
+    def itinerary(self):
+        return RoomItinerary(self.state)
+
+    @property
+    def ledger(self):
+        return RoomLedger(self.state)
+
+    @property
+    def presence(self):
+        return RoomPresence(self.registry.presence, self.room_id, self.user_id)
+
+    @property
+    def traveler_id(self):
+        """成员默认的人员ID（用户ID前8位）"""
+        return self.user_id[:8]
+
+    def member_name(self):
+        """成员在房间中的名字，第一次进入时分配一个未使用的默认名字"""
+        state = self.state
+        with state.lock:
+            name = state.user_names.get(self.user_id)
+            if name is None:
+                # 已使用的编号包括其他成员的名字和手动添加的人员
+                name = next_default_name(list(state.user_names.values()) + state.travelers.names())
+                state.set_user_name(self.user_id, name)
+            return name
+
+    def join(self):
+        """确保成员在人员名单中，返回 (名字, 人员ID)
+
+        导入的数据中已有同名人员时直接认领；名字以人员记录为准
+        （可能被其他成员在"同行人员"中修改过）。
+        """
+        state = self.state
+        user_name = self.member_name()
+        with state.lock:
+            traveler_id = self.traveler_id
+            if traveler_id not in state.travelers:
+                existing_id = state.travelers.id_for_name(user_name)
+                if existing_id:
+                    traveler_id = existing_id
+                else:
+                    state.add_traveler(user_name, traveler_id, editor=user_name)
+
+            traveler_name = state.travelers.name_of(traveler_id)
+            if traveler_name != user_name:
+                state.set_user_name(self.user_id, traveler_name)
+                user_name = traveler_name
+        return user_name, traveler_id
+
+    def rename(self, traveler_id, new_name):
+        """修改自己的名字（人员名单和成员名字一起修改）"""
+        state = self.state
+        with state.lock:
+            state.rename_traveler(traveler_id, new_name, editor=new_name)
+            state.set_user_name(self.user_id, new_name)
+
+    def add_traveler(self, editor):
+        """添加一名使用默认名字的人员，返回名字"""
+        state = self.state
+        with state.lock:
+            name = next_default_name(state.travelers.names())
+            state.add_traveler(name, new_record_id(), editor=editor)
+        return name
+
+    def rename_traveler(self, traveler_id, new_name, editor):
+        return self.state.rename_traveler(traveler_id, new_name, editor=editor)
+
+    def remove_traveler(self, traveler_id, editor):
+        return self.state.remove_traveler(traveler_id, editor=editor)
+
+    def set_total_days(self, days, editor):
+        return self.state.set_total_days(days, editor=editor)
+
+    def import_trip(self, result, merge, editor):
+        """应用导入结果（合并或覆盖），返回给用户看的统计
+
+        {'items', 'expenses', 'skipped', 'errors'}，合并时还有 'merge': (新增, 更新, 保留)。
+        """
+        report = {
+            'items': result.item_count,
+            'expenses': result.expense_count,
+            'skipped': result.skipped,
+            'errors': result.errors,
+        }
+        if merge:
+            plan = self.state.merge_import(result, editor=editor)
+            report['merge'] = (plan.added, plan.updated, plan.kept)
+        else:
+            self.state.load_import(result, editor=editor)
+        return report
+
+    def reset(self, editor):
+        """清空行程、开销等基础数据（房间ID和成员昵称保留）"""
+        return self.state.reset(editor=editor)
+
+    def updates_since(self, seen_version, user_name, now=None):
+        """版本 seen_version 之后其他成员的修改
+
+        返回 {'has_updates', 'latest_version'}，有更新时还包括
+        'last_editor'、'time_since_update' 和 'ops'（历史不可用时为 None）。
+        """
+        now = time.time() if now is None else now
+        state = self.state
+        ops = self.registry.ops_since(state, seen_version)
+
+        if ops is None:
+            # 所需的历史已不可用，只能根据当前版本判断
+            data_version = state.data_version
+            if data_version['number'] <= seen_version:
+                return {'has_updates': False, 'latest_version': seen_version}
+            return {
+                'has_updates': True,
+                'last_editor': data_version.get('last_editor', '未知'),
+                'time_since_update': now - data_version.get('timestamp', 0),
+                'ops': None,
+                'latest_version': data_version['number']
+            }
+
+        latest_version = ops[-1]['version'] if ops else seen_version
+        # 自己的修改不需要提示
+        others_ops = [op for op in ops if op.get('user') != user_name]
+        if others_ops:
+            return {
+                'has_updates': True,
+                'last_editor': others_ops[-1]['user'],
+                'time_since_update': now - others_ops[-1]['timestamp'],
+                'ops': others_ops,
+                'latest_version': latest_version
+            }
+        return {'has_updates': False, 'latest_version': latest_version}
@@ -0,0 +1,239 @@
+"""增量结算引擎
+
+开销保存在列式账本（Ledger）中：新增或删除一条开销是 O(1) 的追加或标记，
+汇总结果由 NumPy 向量化计算，并按 data_version 缓存。
+引擎记录自己对应的版本号，通过操作日志增量追上房间的最新版本，
+只有整体替换（导入、清空）时才重新构建账本。
+"""
+import heapq
+import threading
+from collections import defaultdict
+
+from . import oplog
+from .ledger import Ledger
+
+
+class SettlementEngine:
+    """房间开销的增量汇总"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = -1
+        self.ledger = Ledger()
+        self._cache = {}          # 汇总名 -> 结果，版本变化时清空
+        self._cache_version = -1
+
+    def _cached(self, name, compute):
+        with self.lock:
+            if self._cache_version != self.version:
+                self._cache = {}
+                self._cache_version = self.version
+            if name not in self._cache:
+                self._cache[name] = compute()
+            return self._cache[name]
+
+    @property
+    def expense_count(self):
+        return len(self.ledger)
+
+    @property
+    def total_amount(self):
+        return self._cached('total_amount', self.ledger.total_amount)
+
+    def rebuild(self, expenses, version):
+        """根据完整的开销数据重新构建账本"""
+        ledger = Ledger(capacity=max(64, sum(len(items) for items in expenses.values())))
+        for day, day_expenses in expenses.items():
+            for expense in day_expenses:
+                ledger.append(expense, day)
+        self.ledger = ledger
+        self.version = version
+
+    def apply(self, ops):
+        """按顺序应用操作；遇到需要重建的操作时返回 False"""
+        for op in ops:
+            if op['version'] <= self.version:
+                continue
+            op_type = op['op']
+            if op_type == oplog.REPLACE:
+                return False
+            if op_type == oplog.ADD_EXPENSE:
+                self.ledger.append(op['record'], op['day'])
+            elif op_type == oplog.DELETE_EXPENSE:
+                self.ledger.delete(op['id'])
+            elif op_type == oplog.UPDATE_EXPENSE:
+                # 合并结果已写在操作中；记录已被删除时为 None
+                if op['record'] is not None:
+                    self.ledger.delete(op['id'])
+                    self.ledger.append(op['record'], op['day'])
+            elif op_type == oplog.MERGE:
+                for kind, record_id, _ in op.get('removed', ()):
+                    if kind == 'expenses':
+                        self.ledger.delete(record_id)
+                for day, expense in op['expenses']:
+                    self.ledger.delete(expense['id'])
+                    self.ledger.append(expense, day)
+            # 改名不影响账本：账本中的付款人和分摊人都是人员 ID
+            self.version = op['version']
+        return True
+
+    def sync(self, registry, room):
+        """追上房间的最新版本：优先增量应用操作，必要时整体重建"""
+        with self.lock:
+            if self.version >= 0:
+                ops = registry.ops_since(room, self.version)
+                if ops is not None and self.apply(ops):
+                    return
+            with room.lock:
+                self.rebuild(room.expenses, room.data_version['number'])
+
+    def payment_summary(self):
+        """每个付款人的支付总额和各类别金额"""
+        return self._cached('payment_summary', self.ledger.payment_summary)
+
+    def category_totals(self):
+        return self._cached('category_totals', self.ledger.category_totals)
+
+    def day_totals(self):
+        """每天的总开销和AA总金额 {day_str: (total, aa_total)}"""
+        return self._cached('day_totals', self.ledger.day_totals)
+
+    def aa_summary(self):
+        """每个分摊组的总额、每人应摊和每人的差额（正数为多付）"""
+        return self._cached('aa_summary', self.ledger.aa_summary)
+
+    def traveler_balances(self):
+        """每人在所有AA开销中的应摊总额和净余额 {traveler: (share, net)}，单位：分"""
+        def compute():
+            balances = defaultdict(lambda: [0, 0])
+            for result in self.aa_summary().values():
+                for traveler, share in result['shares'].items():
+                    balances[traveler][0] += share
+                    balances[traveler][1] += result['differences'][traveler]
+            return {traveler: tuple(values) for traveler, values in balances.items()}
+        return self._cached('traveler_balances', compute)
+
+    def transfers(self):
+        """当前版本的转账方案 [(付款人, 收款人, 金额分)]，同一版本只计算一次"""
+        return self._cached('transfers', lambda: plan_transfers(net_balances(self.aa_summary())))
+
+
+# ========== 转账方案（谁该给谁转多少钱） ==========
+# 非零余额人数不超过该值时使用精确算法（状态数为 2^n）
+EXACT_LIMIT = 10
+
+
+def net_balances(aa_results):
+    """汇总各分摊组的差额，得到每人的净余额（单位：分，正数为应收，负数为应付）"""
+    balances = defaultdict(int)
+    for result in aa_results.values():
+        for traveler, difference in result['differences'].items():
+            balances[traveler] += difference
+    return {traveler: amount for traveler, amount in balances.items() if amount != 0}
+
+
+def plan_transfers(balances, exact_limit=EXACT_LIMIT):
+    """根据净余额（分）生成转账笔数最少的方案 [(付款人, 收款人, 金额分)]
+
+    先把金额正好相反的两人直接配对；剩余人数不多时用状态压缩求最优解，
+    人数多时用堆的贪心算法（最多 n-1 笔）。
+    """
+    transfers = []
+    remaining = _match_exact_pairs(balances, transfers)
+
+    if len(remaining) <= exact_limit:
+        for group in _zero_sum_groups(remaining):
+            _settle_greedy(group, transfers)
+    else:
+        _settle_greedy(remaining, transfers)
+    return transfers
+
+
+def _match_exact_pairs(balances, transfers):
+    """金额互为相反数的两人直接结清，返回剩余的余额"""
+    debtors_by_amount = defaultdict(list)
+    for traveler, amount in sorted(balances.items()):
+        if amount < 0:
+            debtors_by_amount[-amount].append(traveler)
+
+    remaining = {}
+    for traveler, amount in sorted(balances.items()):
+        if amount > 0 and debtors_by_amount.get(amount):
+            transfers.append((debtors_by_amount[amount].pop(), traveler, amount))
+        elif amount > 0:
+            remaining[traveler] = amount
+    for amount, debtors in debtors_by_amount.items():
+        for traveler in debtors:
+            remaining[traveler] = -amount
+    return remaining
+
+
+def _zero_sum_groups(balances):
+    """把余额划分为尽可能多的和为零的小组（每组 k 人只需 k-1 笔转账）"""
+    travelers = sorted(balances)
+    n = len(travelers)
+    if n == 0:
+        return []
+
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + balances[travelers[low.bit_length() - 1]]
+
+    # best[mask]：mask 中的人按某种顺序排列时，能切出的和为零的段数的最大值
+    best = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        bonus = 1 if sums[mask] == 0 else 0
+        value = 0
+        bits = mask
+        while bits:
+            low = bits & -bits
+            candidate = best[mask ^ low]
+            if candidate > value:
+                value = candidate
+            bits ^= low
+        best[mask] = value + bonus
+
+    # 回溯出排列顺序，再在前缀和为零处切分
+    order = []
+    mask = full
+    while mask:
+        bonus = 1 if sums[mask] == 0 else 0
+        bits = mask
+        while bits:
+            low = bits & -bits
+            if best[mask ^ low] + bonus == best[mask]:
+                order.append(low)
+                mask ^= low
+                break
+            bits ^= low
+    order.reverse()
+
+    groups, group, prefix = [], {}, 0
+    for low in order:
+        traveler = travelers[low.bit_length() - 1]
+        group[traveler] = balances[traveler]
+        prefix |= low
+        if sums[prefix] == 0:
+            groups.append(group)
+            group = {}
+    return groups
+
+
+def _settle_greedy(balances, transfers):
+    """每次让欠款最多的人付给应收最多的人"""
+    creditors = [(-amount, traveler) for traveler, amount in balances.items() if amount > 0]
+    debtors = [(amount, traveler) for traveler, amount in balances.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    while creditors and debtors:
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
@@ -0,0 +1,258 @@
+"""房间数据持久化
+
+RoomStorage 是不做持久化的默认实现（进程重启后数据丢失），
+SQLiteStorage 把每条行程、每条开销各存为一行，按 (room_id, day) 建索引。
+操作日志另存一张表；保存快照时删除快照已包含的旧操作，日志长度不会无限增长。
+已删除记录的墓碑（见 crdt.py）也单独存一张表，重启后离线客户端重新提交的添加不会让记录复活。
+"""
+import json
+import sqlite3
+import threading
+
+
+class RoomStorage:
+    """持久化接口：默认只保存在内存中"""
+
+    def load_room(self, room):
+        """从存储中加载房间数据到 room，房间不存在时返回 False"""
+        return False
+
+    def save_changes(self, room, pending):
+        """把一批修改（PendingChanges）写入存储"""
+
+    def load_ops(self, room_id, after_version, up_to_version):
+        """读取版本号在 (after_version, up_to_version] 内的操作，历史不完整时返回 None"""
+        return None
+
+    def save_snapshot(self, room_id, state, version):
+        """保存房间快照（标记 data_version 版本号），并删除版本号不超过它的操作"""
+
+    def load_snapshot(self, room_id):
+        """读取最近一次保存的快照 (房间数据, 版本号)，没有时返回 None"""
+        return None
+
+    def snapshot_version(self, room_id):
+        """最近一次保存的快照的版本号（不读取快照内容），没有时返回 0"""
+        return 0
+
+    def close(self):
+        pass
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    room_id TEXT PRIMARY KEY,
+    meta TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS itinerary_items (
+    room_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (room_id, item_id)
+);
+CREATE INDEX IF NOT EXISTS idx_itinerary_room_day ON itinerary_items (room_id, day);
+CREATE TABLE IF NOT EXISTS expenses (
+    room_id TEXT NOT NULL,
+    expense_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (room_id, expense_id)
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_room_day ON expenses (room_id, day);
+CREATE TABLE IF NOT EXISTS operations (
+    room_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (room_id, version)
+);
+CREATE TABLE IF NOT EXISTS tombstones (
+    room_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    PRIMARY KEY (room_id, kind, record_id)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    room_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+
+class SQLiteStorage(RoomStorage):
+    """SQLite 持久化（WAL 模式，每批修改一个事务）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # 多个会话线程共用一个连接，由 _lock 串行化
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def load_room(self, room):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT meta FROM rooms WHERE room_id = ?", (room.room_id,)
+            ).fetchone()
+            if row is None:
+                return False
+
+            # rowid 保留了插入顺序，即每天内的添加顺序
+            itinerary = {}
+            for day, data in self._conn.execute(
+                "SELECT day, data FROM itinerary_items WHERE room_id = ? ORDER BY day, rowid",
+                (room.room_id,)
+            ):
+                itinerary.setdefault(day, []).append(json.loads(data))
+
+            expenses = {}
+            for day, data in self._conn.execute(
+                "SELECT day, data FROM expenses WHERE room_id = ? ORDER BY day, rowid",
+                (room.room_id,)
+            ):
+                expenses.setdefault(day, []).append(json.loads(data))
+
+            tombstones = self._conn.execute(
+                "SELECT kind, record_id FROM tombstones WHERE room_id = ?", (room.room_id,)
+            ).fetchall()
+
+        room.load_rows(json.loads(row[0]), itinerary, expenses, tombstones)
+        # 快照内容只在副本需要整体加载时才读取
+        room.snapshot_version = self.snapshot_version(room.room_id)
+        return True
+
+    def save_changes(self, room, pending):
+        room_id = room.room_id
+
+        # 持房间锁序列化，避免记录在写入过程中被其他会话修改
+        with room.lock:
+            meta = json.dumps(room.meta_dict(), ensure_ascii=False) if pending.meta else None
+            item_rows, item_deletes = self._split_rows(room_id, pending.itinerary)
+            expense_rows, expense_deletes = self._split_rows(room_id, pending.expenses)
+            op_rows = [
+                (room_id, op['version'], json.dumps(op, ensure_ascii=False))
+                for op in pending.ops
+            ]
+            tombstone_adds = [(room_id, kind, record_id)
+                              for (kind, record_id), removed in pending.tombstones.items() if removed]
+            tombstone_deletes = [(room_id, kind, record_id)
+                                 for (kind, record_id), removed in pending.tombstones.items() if not removed]
+
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                if pending.cleared:
+                    conn.execute("DELETE FROM itinerary_items WHERE room_id = ?", (room_id,))
+                    conn.execute("DELETE FROM expenses WHERE room_id = ?", (room_id,))
+                if meta is not None:
+                    conn.execute(
+                        "INSERT INTO rooms (room_id, meta) VALUES (?, ?) "
+                        "ON CONFLICT (room_id) DO UPDATE SET meta = excluded.meta",
+                        (room_id, meta)
+                    )
+                conn.executemany(
+                    "DELETE FROM itinerary_items WHERE room_id = ? AND item_id = ?", item_deletes
+                )
+                conn.executemany(
+                    "INSERT INTO itinerary_items (room_id, item_id, day, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (room_id, item_id) DO UPDATE SET day = excluded.day, data = excluded.data",
+                    item_rows
+                )
+                conn.executemany(
+                    "DELETE FROM expenses WHERE room_id = ? AND expense_id = ?", expense_deletes
+                )
+                conn.executemany(
+                    "INSERT INTO expenses (room_id, expense_id, day, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (room_id, expense_id) DO UPDATE SET day = excluded.day, data = excluded.data",
+                    expense_rows
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO operations (room_id, version, data) VALUES (?, ?, ?)",
+                    op_rows
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO tombstones (room_id, kind, record_id) VALUES (?, ?, ?)",
+                    tombstone_adds
+                )
+                conn.executemany(
+                    "DELETE FROM tombstones WHERE room_id = ? AND kind = ? AND record_id = ?",
+                    tombstone_deletes
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def load_ops(self, room_id, after_version, up_to_version):
+        if up_to_version <= after_version:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, data FROM operations "
+                "WHERE room_id = ? AND version > ? AND version <= ? ORDER BY version",
+                (room_id, after_version, up_to_version)
+            ).fetchall()
+
+        # 版本号必须连续，否则说明中间的历史缺失
+        if len(rows) != up_to_version - after_version or rows[0][0] != after_version + 1:
+            return None
+        return [json.loads(data) for _, data in rows]
+
+    def save_snapshot(self, room_id, state, version):
+        data = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.execute(
+                    "INSERT INTO snapshots (room_id, version, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT (room_id) DO UPDATE SET version = excluded.version, data = excluded.data "
+                    "WHERE excluded.version >= snapshots.version",
+                    (room_id, version, data)
+                )
+                # 快照之前的操作不再需要：需要更早历史的副本改为从快照加载
+                conn.execute(
+                    "DELETE FROM operations WHERE room_id = ? AND version <= "
+                    "(SELECT version FROM snapshots WHERE room_id = ?)",
+                    (room_id, room_id)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def load_snapshot(self, room_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version FROM snapshots WHERE room_id = ?", (room_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def snapshot_version(self, room_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM snapshots WHERE room_id = ?", (room_id,)
+            ).fetchone()
+        return row[0] if row is not None else 0
+
+    @staticmethod
+    def _split_rows(room_id, changes):
+        """把按ID合并的修改拆分为写入行和删除行"""
+        rows, deletes = [], []
+        for record_id, (day, record) in changes.items():
+            if record is None:
+                deletes.append((room_id, record_id))
+            else:
+                # 房间中的记录是只读的 Mapping（名单为元组），先转换为字典
+                rows.append((room_id, record_id, day, json.dumps(dict(record), ensure_ascii=False)))
+        return rows, deletes
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
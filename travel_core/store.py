@@ -0,0 +1,529 @@
+"""跨会话共享的房间存储
+
+所有浏览器会话通过同一个 RoomRegistry 读写房间数据，
+同一房间的成员看到的是同一份内存数据，而不是各自的副本。
+"""
+import threading
+import time
+
+from . import oplog
+from .crdt import REMOVE, RoomDocument, check_op
+from .importer import validate_expense, validate_item
+from .itinerary import ItineraryIndex
+from .merge import plan_merge
+from .oplog import OperationLog, apply_operation, copy_record, empty_state, make_op, set_expenses
+from .records import Expense, ItineraryItem, records_by_day
+from .presence import PresenceTracker
+from .storage import RoomStorage
+from .travelers import TravelerDirectory, from_legacy, is_legacy, to_legacy
+
+
+class PendingChanges:
+    """尚未写入持久化存储的修改，按记录ID合并"""
+
+    def __init__(self):
+        self.cleared = False     # 是否需要先删除房间的全部记录
+        self.meta = False        # 房间基本信息（人员、天数、版本等）是否有变化
+        self.itinerary = {}      # item_id -> (day, item)，item 为 None 表示删除
+        self.expenses = {}       # expense_id -> (day, expense)，expense 为 None 表示删除
+        self.tombstones = {}     # (kind, id) -> True 新增墓碑 / False 记录重新出现，撤销墓碑
+        self.ops = []            # 新增的操作日志
+
+    def __bool__(self):
+        return (self.cleared or self.meta or bool(self.itinerary)
+                or bool(self.expenses) or bool(self.tombstones) or bool(self.ops))
+
+
+class RoomState:
+    """单个旅行团的共享状态
+
+    所有数据修改都通过 apply() 以操作的形式进行：
+    每条操作使版本号加一，并追加到房间的操作日志中。
+    """
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        # 可重入锁：同一会话在持锁期间可以再次调用加锁的方法
+        self.lock = threading.RLock()
+        # 版本号变化时通知等待者（其他会话、同步线程等）
+        self.changed = threading.Condition(self.lock)
+        # 保证同一房间的批量写入按顺序落盘
+        self.flush_lock = threading.Lock()
+        self.pending = PendingChanges()
+
+        state = empty_state()
+        self.travelers = TravelerDirectory.from_records(state['travelers'])
+        self.itinerary = ItineraryIndex.from_dict(state['itinerary'])
+        set_expenses(self, state['expenses'])
+        self.total_days = state['total_days']
+        self.data_version = {
+            'number': 0,
+            'timestamp': time.time(),
+            'last_editor': "未知"
+        }
+        # 离线编辑用的 CRDT 文档，第一次合并客户端操作时才构建
+        self._document = None
+        # 已删除记录的墓碑 {(kind, id)}，与房间数据一起持久化：
+        # 重启或整体替换后重建的文档仍然记得哪些记录删过，客户端重新提交的添加不会让它复活
+        self.tombstones = set()
+        # 最近一次持久化的快照的版本号（快照内容只在存储中，需要时再读取）
+        self.snapshot_version = 0
+        # 各数据部分最后一次修改时的版本号
+        self.section_versions = dict.fromkeys(oplog.SECTIONS, 0)
+        self.recent_updates = []
+        self.oplog = OperationLog()
+
+        # 成员信息不随"清空数据"重置
+        self.user_names = {}     # user_id -> 房间内昵称
+
+    def apply(self, op, editor):
+        """应用一条操作：修改数据、增加版本号并记录到操作日志，返回新版本号"""
+        with self.lock:
+            replaced = self._record_keys() if op['op'] == oplog.REPLACE else ()
+            changes = apply_operation(self, op)
+
+            now = time.time()
+            self.data_version['number'] += 1
+            self.data_version['timestamp'] = now
+            self.data_version['last_editor'] = editor
+
+            op['version'] = self.data_version['number']
+            for section in oplog.op_sections(op):
+                self.section_versions[section] = op['version']
+            op['user'] = editor
+            op['timestamp'] = now
+            self.oplog.append(op)
+            if self._document is not None and not self._document.observe(op):
+                self._document = None
+
+            # 记录需要持久化的修改
+            pending = self.pending
+            pending.ops.append(op)
+            pending.meta = True
+            if op['op'] == oplog.REPLACE:
+                pending.cleared = True
+                pending.itinerary.clear()
+                pending.expenses.clear()
+            for kind, day, record_id, record in changes:
+                getattr(pending, kind)[record_id] = (day, record)
+                self._set_tombstone((kind, record_id), record is None)
+            # 整体替换时不在新数据中的记录也算删除
+            for key in replaced:
+                if key[1] not in (self.itinerary if key[0] == 'itinerary' else self.expense_index):
+                    self._set_tombstone(key, True)
+
+            self.changed.notify_all()
+            return op['version']
+
+    def _record_keys(self):
+        keys = [('itinerary', item['id']) for _, items in self.itinerary.items() for item in items]
+        keys.extend(('expenses', expense['id'])
+                    for day_expenses in self.expenses.values() for expense in day_expenses)
+        return keys
+
+    def _set_tombstone(self, key, removed):
+        """记录 (kind, id) 被删除（removed=True）或重新出现，有变化时记入待写入的修改"""
+        if removed:
+            if key not in self.tombstones:
+                self.tombstones.add(key)
+                self.pending.tombstones[key] = True
+        elif key in self.tombstones:
+            self.tombstones.discard(key)
+            self.pending.tombstones[key] = False
+
+    def sections_version(self, sections):
+        """给定数据部分中最近一次修改的版本号"""
+        with self.lock:
+            return max((self.section_versions[section] for section in sections), default=0)
+
+    def traveler_records(self):
+        """当前人员 [(id, name)] 的快照（其他会话可能同时增删人员，遍历须在锁内进行）"""
+        with self.lock:
+            return self.travelers.records()
+
+    def traveler_ids(self):
+        """当前人员 ID 列表的快照，规则同 traveler_records"""
+        with self.lock:
+            return self.travelers.ids()
+
+    def wait_for_version(self, version, timeout=None):
+        """阻塞等待，直到房间版本号大于 version 或超时，返回当前版本号"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.data_version['number'] > version, timeout)
+            return self.data_version['number']
+
+    def take_pending(self):
+        """取出待写入的修改，并开始记录新的修改"""
+        with self.lock:
+            pending = self.pending
+            self.pending = PendingChanges()
+            return pending
+
+    def restore_pending(self, pending):
+        """写入失败时把取出的修改放回去（较新的修改优先）"""
+        with self.lock:
+            newer = self.pending
+            if not newer.cleared:
+                pending.meta = pending.meta or newer.meta
+                pending.itinerary.update(newer.itinerary)
+                pending.expenses.update(newer.expenses)
+                pending.tombstones.update(newer.tombstones)
+                pending.ops.extend(newer.ops)
+                self.pending = pending
+            else:
+                # 墓碑不随整体替换清除
+                for key, removed in pending.tombstones.items():
+                    newer.tombstones.setdefault(key, removed)
+
+    def record_activity(self, editor, action, details, keep_updates=10):
+        """记录一条用户可见的最近活动（最多保留 keep_updates 条）"""
+        with self.lock:
+            self.recent_updates.insert(0, {
+                'user': editor,
+                'action': action,
+                'details': details,
+                'timestamp': time.time(),
+                'version': self.data_version['number']
+            })
+            del self.recent_updates[keep_updates:]
+            self.pending.meta = True
+            return self.data_version['number']
+
+    def set_user_name(self, user_id, name):
+        with self.lock:
+            self.user_names[user_id] = name
+            self.pending.meta = True
+
+    def reset(self, editor="未知"):
+        """清空行程、开销等基础数据（版本号继续递增）"""
+        return self.apply(make_op(oplog.REPLACE, state=empty_state()), editor)
+
+    def set_total_days(self, days, editor):
+        return self.apply(make_op(oplog.SET_TOTAL_DAYS, days=days), editor)
+
+    def add_traveler(self, name, traveler_id, editor):
+        return self.apply(make_op(oplog.ADD_TRAVELER, name=name, traveler_id=traveler_id), editor)
+
+    def remove_traveler(self, traveler_id, editor):
+        return self.apply(make_op(oplog.REMOVE_TRAVELER, traveler_id=traveler_id), editor)
+
+    def rename_traveler(self, traveler_id, new_name, editor):
+        """修改人员名字（行程和开销引用的是人员 ID，不需要改写）"""
+        return self.apply(make_op(oplog.RENAME_TRAVELER, traveler_id=traveler_id, name=new_name), editor)
+
+    def add_itinerary_item(self, day_str, item, editor):
+        return self.apply(make_op(oplog.ADD_ITEM, day=day_str, record=item), editor)
+
+    def delete_itinerary_item(self, day_str, item_id, editor):
+        return self.apply(make_op(oplog.DELETE_ITEM, day=day_str, id=item_id), editor)
+
+    def add_expense(self, day_str, expense, editor):
+        return self.apply(make_op(oplog.ADD_EXPENSE, day=day_str, record=expense), editor)
+
+    def delete_expense(self, day_str, expense_id, editor):
+        return self.apply(make_op(oplog.DELETE_EXPENSE, day=day_str, id=expense_id), editor)
+
+    def update_itinerary_item(self, item_id, changes, base_rev, editor_id, editor):
+        """按记录版本号修改行程，返回 (修改后的行程, 是否与其他修改合并)
+
+        行程已删除时返回 (None, False)，不记录操作、不增加版本号（删除优先）。
+        """
+        with self.lock:
+            if item_id not in self.itinerary:
+                return None, False
+            op = make_op(oplog.UPDATE_ITEM, day=None, id=item_id, changes=changes, base_rev=base_rev,
+                         edit_time=time.time(), editor=editor_id)
+            self.apply(op, editor)
+            return op['record'], op['merged']
+
+    def update_expense(self, day_str, expense_id, changes, base_rev, editor_id, editor):
+        """按记录版本号修改开销，返回值同 update_itinerary_item"""
+        with self.lock:
+            if expense_id not in self.expense_index:
+                return None, False
+            op = make_op(oplog.UPDATE_EXPENSE, day=day_str, id=expense_id, changes=changes, base_rev=base_rev,
+                         edit_time=time.time(), editor=editor_id)
+            self.apply(op, editor)
+            return op['record'], op['merged']
+
+    @property
+    def document(self):
+        """房间的 CRDT 文档（见 crdt.py），之后随操作日志同步更新"""
+        with self.lock:
+            if self._document is None:
+                self._document = RoomDocument.from_state(self, removed=self.tombstones)
+            return self._document
+
+    def document_copy(self):
+        """(文档副本, 版本号)，供客户端副本初始化"""
+        with self.lock:
+            return self.document.copy(), self.data_version['number']
+
+    def merge_document_ops(self, ops, editor):
+        """整批合并客户端提交的文档操作，把受影响记录的最终值写入房间
+
+        合并前后的值都从文档读取，只处理这批操作涉及的记录，不扫描房间。
+        字段尚不完整的新记录（例如只收到了添加操作）暂不写入，等之后的操作补齐。
+        返回新版本号；没有实际变化时返回 None。
+        操作格式不对（记录类型、天数无效等）时整批拒绝，抛出 ValueError。
+        """
+        for op in ops:
+            check_op(op)
+        validators = {'itinerary': validate_item, 'expenses': validate_expense}
+        with self.lock:
+            document = self.document
+            before = {}
+            for op in ops:
+                key = (op['kind'], op['id'])
+                if key not in before:
+                    before[key] = (document.record(*key), document.day_of(*key))
+
+            touched = document.merge(ops)
+            for op in ops:
+                if op['type'] == REMOVE:
+                    self._set_tombstone((op['kind'], op['id']), True)
+            itinerary, expenses, removed = [], [], []
+            for kind, record_id in touched:
+                old, old_day = before[(kind, record_id)]
+                record = document.record(kind, record_id)
+                if record == old:
+                    continue
+                validate = validators[kind]
+                # 文档中只有字段完整的记录才已经写入了房间
+                in_room = old is not None and not validate(old)
+                if record is None:
+                    if in_room:
+                        removed.append((kind, record_id, old_day))
+                    continue
+                if validate(record):
+                    continue
+                record['rev'] = document.rev(kind, record_id) + 1 if in_room else 0
+                document.set_rev(kind, record_id, record['rev'])
+                day = document.day_of(kind, record_id)
+                (itinerary if kind == 'itinerary' else expenses).append((day, record))
+            if not (itinerary or expenses or removed):
+                return None
+            op = {'op': oplog.MERGE, 'travelers': [], 'itinerary': itinerary, 'expenses': expenses,
+                  'total_days': None, 'removed': removed, 'source': 'document'}
+            return self.apply(op, editor)
+
+    def snapshot(self):
+        """返回 (房间数据, 版本号)，两者在同一把锁内读取，保证一致"""
+        with self.lock:
+            state = {
+                'travelers': self.travelers.to_records(),
+                'itinerary': {
+                    day: [copy_record(item) for item in items]
+                    for day, items in self.itinerary.items()
+                },
+                'expenses': {
+                    day: [copy_record(expense) for expense in day_expenses]
+                    for day, day_expenses in self.expenses.items()
+                },
+                'total_days': self.total_days,
+            }
+            return state, self.data_version['number']
+
+    @property
+    def replay_length(self):
+        """从最近的快照整体加载时需要重放的操作数"""
+        return self.data_version['number'] - self.snapshot_version
+
+    def meta_dict(self):
+        """房间基本信息（不含逐条的行程和开销）"""
+        with self.lock:
+            return {
+                'travelers': self.travelers.to_records(),
+                'total_days': self.total_days,
+                'data_version': dict(self.data_version),
+                'recent_updates': list(self.recent_updates),
+                'user_names': dict(self.user_names),
+            }
+
+    def load_rows(self, meta, itinerary, expenses, tombstones=()):
+        """从持久化存储恢复房间（不产生待写入的修改）"""
+        with self.lock:
+            migrate = is_legacy(meta)
+            if migrate:
+                # 旧版按名字引用人员的数据，转换后整体重写
+                state = from_legacy(dict(meta, itinerary=itinerary, expenses=expenses))
+                travelers, itinerary, expenses = state['travelers'], state['itinerary'], state['expenses']
+            else:
+                travelers = meta['travelers']
+            self.travelers = TravelerDirectory.from_records(travelers)
+            self.total_days = meta['total_days']
+            self.data_version = meta['data_version']
+            self.recent_updates = meta['recent_updates']
+            self.user_names = meta['user_names']
+            self.itinerary = ItineraryIndex.from_dict(records_by_day(itinerary, ItineraryItem))
+            set_expenses(self, records_by_day(expenses, Expense))
+            self.oplog = OperationLog(self.data_version['number'])
+            self.section_versions = dict.fromkeys(oplog.SECTIONS, self.data_version['number'])
+            self._document = None
+            # 删除后又重新导入的记录不算删除
+            self.tombstones = {
+                (kind, record_id) for kind, record_id in tombstones
+                if record_id not in (self.itinerary if kind == 'itinerary' else self.expense_index)
+            }
+            self.pending = PendingChanges()
+            if migrate:
+                self.pending.cleared = True
+                self.pending.meta = True
+                for day, items in self.itinerary.items():
+                    for item in items:
+                        self.pending.itinerary[item['id']] = (day, item)
+                for day, day_expenses in self.expenses.items():
+                    for expense in day_expenses:
+                        self.pending.expenses[expense['id']] = (day, expense)
+
+    def to_dict(self):
+        """导出房间数据（与旧版导出JSON字段保持一致，人员按名字引用）"""
+        with self.lock:
+            legacy = to_legacy(self.travelers, self.itinerary, self.expenses)
+            # traveler_ids 放在 travelers 之前，流式导入读到名单时就能沿用人员 ID
+            return {
+                'room_id': self.room_id,
+                'traveler_ids': legacy['traveler_ids'],
+                'travelers': legacy['travelers'],
+                'itinerary': legacy['itinerary'],
+                'expenses': legacy['expenses'],
+                'total_days': self.total_days,
+                'data_version': dict(self.data_version),
+                'user_room_names': {
+                    f"{user_id}_{self.room_id}": name
+                    for user_id, name in self.user_names.items()
+                },
+            }
+
+    def load_import(self, result, editor="未知"):
+        """应用导入结果（importer.ImportResult），返回新版本号"""
+        with self.lock:
+            self.user_names.update(result.user_names)
+            # 版本号只增不减，保证其他成员能感知到这次导入
+            return self.apply(make_op(oplog.REPLACE, state=result.state), editor)
+
+    def merge_import(self, result, editor="未知"):
+        """把导入结果合并到房间中，返回合并方案（merge.MergePlan，含统计）"""
+        with self.lock:
+            plan = plan_merge(self, result)
+            for user_id, name in result.user_names.items():
+                self.user_names.setdefault(user_id, name)
+            if plan:
+                # 方案中的记录都是新建的副本，不需要 make_op 再深拷贝一次
+                self.apply({
+                    'op': oplog.MERGE,
+                    'travelers': plan.travelers,
+                    'itinerary': plan.itinerary,
+                    'expenses': plan.expenses,
+                    'total_days': plan.total_days,
+                }, editor)
+            return plan
+
+
+class RoomRegistry:
+    """进程级房间注册表，按 room_id 索引"""
+
+    def __init__(self, storage=None):
+        self._rooms = {}
+        self._lock = threading.Lock()
+        # 正在从存储加载的房间：room_id -> Event，加载完成时置位
+        self._loading = {}
+        self.storage = storage or RoomStorage()
+        # 在线状态与房间数据分开保存，不随"清空数据"重置
+        self.presence = PresenceTracker()
+
+    def get(self, room_id):
+        """获取房间，不在内存中时从持久化存储加载或新建
+
+        加载大房间可能需要一两秒，期间不持有注册表的锁：其他房间照常访问，
+        同一房间的其他请求等待这次加载完成，不会重复加载。
+        """
+        while True:
+            with self._lock:
+                room = self._rooms.get(room_id)
+                if room is not None:
+                    return room
+                loading = self._loading.get(room_id)
+                if loading is None:
+                    loading = self._loading[room_id] = threading.Event()
+                    break
+            # 其他线程正在加载；加载失败时由等待者之一重新加载
+            loading.wait()
+
+        try:
+            room = RoomState(room_id)
+            if not self.storage.load_room(room):
+                # 新房间：初始数据还没有落盘
+                room.pending.meta = True
+            with self._lock:
+                self._rooms[room_id] = room
+            return room
+        finally:
+            with self._lock:
+                del self._loading[room_id]
+            loading.set()
+
+    def ops_since(self, room, version):
+        """返回房间中版本号大于 version 的操作；历史不可用时返回 None"""
+        with room.lock:
+            ops = room.oplog.since(version)
+            if ops is not None:
+                return list(ops)
+            base_version = room.oplog.base_version
+            tail = list(room.oplog.since(base_version))
+
+        # 内存日志从房间加载时开始，更早的部分从持久化存储读取
+        history = self.storage.load_ops(room.room_id, version, base_version)
+        if history is None:
+            return None
+        return history + tail
+
+    def flush(self, room):
+        """把房间的待写入修改作为一个事务写入持久化存储"""
+        with room.flush_lock:
+            pending = room.take_pending()
+            if pending:
+                try:
+                    self.storage.save_changes(room, pending)
+                except Exception:
+                    room.restore_pending(pending)
+                    raise
+
+    def compact(self, room, keep):
+        """内存中的操作日志只保留最近 keep 条（尚未落盘的操作不会被丢弃）"""
+        with room.lock:
+            limit = room.oplog.last_version - keep
+            if room.pending.ops:
+                limit = min(limit, room.pending.ops[0]['version'] - 1)
+            return room.oplog.compact(limit)
+
+    def take_snapshot(self, room):
+        """生成房间快照并持久化，供需要整体加载的副本使用，返回快照的版本号
+
+        先落盘待写入的修改，快照保存后存储中不再保留快照之前的操作。
+        """
+        self.flush(room)
+        state, version = room.snapshot()
+        self.storage.save_snapshot(room.room_id, state, version)
+        room.snapshot_version = version
+        return version
+
+    def load_snapshot(self, room):
+        """读取房间最近一次持久化的快照 (房间数据, 版本号)，没有时返回 None"""
+        if not room.snapshot_version:
+            return None
+        return self.storage.load_snapshot(room.room_id)
+
+    def flush_all(self):
+        for room_id in self.room_ids():
+            self.flush(self._rooms[room_id])
+
+    def __contains__(self, room_id):
+        return room_id in self._rooms
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def room_ids(self):
+        with self._lock:
+            return list(self._rooms)
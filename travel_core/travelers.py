@@ -0,0 +1,207 @@
+"""人员名单：以稳定的 ID 为键的人员记录
+
+行程的参与人员、开销的付款人和分摊人、记录的添加人都保存人员 ID，
+显示时再查名字。改名只修改一条人员记录，不需要改写任何行程或开销。
+
+导出的 JSON 仍使用旧格式（按名字引用），导入时用 from_legacy 转换。
+"""
+import copy
+import uuid
+
+
+def new_traveler_id():
+    return str(uuid.uuid4())[:8]
+
+
+class TravelerDirectory:
+    """人员记录 {id: {'id', 'name', 'removed'}}，按加入顺序排列
+
+    删除人员只打标记：已有的开销和行程仍引用该 ID，名字需要继续可查。
+    """
+
+    def __init__(self):
+        self._records = {}
+
+    @classmethod
+    def from_records(cls, records):
+        directory = cls()
+        for record in records:
+            directory._records[record['id']] = {
+                'id': record['id'],
+                'name': record['name'],
+                'removed': record.get('removed', False),
+            }
+        return directory
+
+    def to_records(self):
+        return [dict(record) for record in self._records.values()]
+
+    def add(self, traveler_id, name):
+        record = self._records.get(traveler_id)
+        if record is None:
+            self._records[traveler_id] = {'id': traveler_id, 'name': name, 'removed': False}
+        else:
+            # 重新加入已删除的人员
+            record['name'] = name
+            record['removed'] = False
+
+    def remove(self, traveler_id):
+        record = self._records.get(traveler_id)
+        if record is not None:
+            record['removed'] = True
+
+    def rename(self, traveler_id, name):
+        record = self._records.get(traveler_id)
+        if record is not None:
+            record['name'] = name
+
+    def name_of(self, ref):
+        """人员 ID -> 名字；不是人员 ID（如"未知"）时原样返回"""
+        record = self._records.get(ref)
+        return record['name'] if record is not None else ref
+
+    def names_of(self, refs):
+        return [self.name_of(ref) for ref in refs]
+
+    def id_for_name(self, name):
+        """按名字查找当前人员的 ID，找不到时返回 None"""
+        for record in self._records.values():
+            if record['name'] == name and not record['removed']:
+                return record['id']
+        return None
+
+    def ids(self):
+        """当前人员的 ID 列表（按加入顺序）"""
+        return [record['id'] for record in self._records.values() if not record['removed']]
+
+    def names(self):
+        return [record['name'] for record in self._records.values() if not record['removed']]
+
+    def records(self):
+        """当前人员 [(id, name)]"""
+        return [
+            (record['id'], record['name'])
+            for record in self._records.values() if not record['removed']
+        ]
+
+    def __contains__(self, traveler_id):
+        record = self._records.get(traveler_id)
+        return record is not None and not record['removed']
+
+    def __len__(self):
+        return sum(1 for record in self._records.values() if not record['removed'])
+
+
+# ========== 与旧格式（按名字引用）之间的转换 ==========
+def is_legacy(data):
+    """旧格式的 travelers 是名字列表（并带有 traveler_ids），新格式是人员记录列表"""
+    return 'traveler_ids' in data or any(isinstance(traveler, str) for traveler in data.get('travelers', []))
+
+
+def from_legacy(data):
+    """把旧格式的房间数据转换为按人员 ID 引用的格式
+
+    data 包含 travelers（名字列表）、traveler_ids（可能比 travelers 短）、
+    itinerary、expenses、total_days。返回 empty_state() 结构的新字典，
+    输入不会被修改。
+    """
+    travelers = data.get('travelers', [])
+    traveler_ids = list(data.get('traveler_ids', []))
+    records = []
+    ids_by_name = {}
+    used_ids = set()
+
+    def add_record(name, traveler_id=None, removed=False):
+        if not traveler_id or traveler_id in used_ids:
+            traveler_id = new_traveler_id()
+            while traveler_id in used_ids:
+                traveler_id = new_traveler_id()
+        used_ids.add(traveler_id)
+        records.append({'id': traveler_id, 'name': name, 'removed': removed})
+        ids_by_name.setdefault(name, traveler_id)
+        return traveler_id
+
+    for index, name in enumerate(travelers):
+        add_record(name, traveler_ids[index] if index < len(traveler_ids) else None)
+
+    def ref(name):
+        # 已不在名单中的人员（例如被删除后仍是某笔开销的付款人）保留为已删除记录
+        traveler_id = ids_by_name.get(name)
+        if traveler_id is None:
+            traveler_id = add_record(name, removed=True)
+        return traveler_id
+
+    def editor_ref(name):
+        # 添加人可能是"未知"等不在名单中的名字，保持原样
+        return ids_by_name.get(name, name)
+
+    itinerary = {}
+    for day, items in data.get('itinerary', {}).items():
+        converted = []
+        for item in items:
+            item = copy.deepcopy(item)
+            if 'participants' in item:
+                item['participants'] = [ref(name) for name in item['participants']]
+            if 'editor' in item:
+                item['editor'] = editor_ref(item['editor'])
+            converted.append(item)
+        itinerary[day] = converted
+
+    expenses = {}
+    for day, day_expenses in data.get('expenses', {}).items():
+        converted = []
+        for expense in day_expenses:
+            expense = copy.deepcopy(expense)
+            if 'payer' in expense:
+                expense['payer'] = ref(expense['payer'])
+            if 'sharers' in expense:
+                expense['sharers'] = [ref(name) for name in expense['sharers']]
+            if 'editor' in expense:
+                expense['editor'] = editor_ref(expense['editor'])
+            converted.append(expense)
+        expenses[day] = converted
+
+    return {
+        'travelers': records,
+        'itinerary': itinerary,
+        'expenses': expenses,
+        'total_days': data.get('total_days', 3),
+    }
+
+
+def to_legacy(directory, itinerary, expenses):
+    """把行程和开销中的人员 ID 换回名字（用于导出旧格式 JSON）"""
+    name_of = directory.name_of
+
+    legacy_itinerary = {}
+    for day, items in itinerary.items():
+        converted = []
+        for item in items:
+            item = dict(item)
+            if 'participants' in item:
+                item['participants'] = [name_of(ref) for ref in item['participants']]
+            if 'editor' in item:
+                item['editor'] = name_of(item['editor'])
+            converted.append(item)
+        legacy_itinerary[day] = converted
+
+    legacy_expenses = {}
+    for day, day_expenses in expenses.items():
+        converted = []
+        for expense in day_expenses:
+            expense = dict(expense)
+            if 'payer' in expense:
+                expense['payer'] = name_of(expense['payer'])
+            if 'sharers' in expense:
+                expense['sharers'] = [name_of(ref) for ref in expense['sharers']]
+            if 'editor' in expense:
+                expense['editor'] = name_of(expense['editor'])
+            converted.append(expense)
+        legacy_expenses[day] = converted
+
+    return {
+        'travelers': directory.names(),
+        'traveler_ids': directory.ids(),
+        'itinerary': legacy_itinerary,
+        'expenses': legacy_expenses,
+    }
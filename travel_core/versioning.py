@@ -0,0 +1,57 @@
+"""记录级版本号与并发修改的合并规则
+
+每条行程和开销带有版本号 rev（没有该字段视为 0，每次修改加一）。
+修改时提交读取记录时看到的 rev（base_rev）：
+
+- 与当前 rev 相同：期间没有其他人修改过这条记录，按提交的内容直接修改；
+- 不同：有人先一步修改了，按固定规则合并，所有副本得到相同的结果：
+  participants / sharers 取两边的并集，其他字段以 edit_time 较新的一方为准
+  （时间相同时比较编辑者 ID）。
+
+合并只涉及这一条记录，不需要重新读取整个房间，也不会覆盖其他记录的修改。
+"""
+
+# 合并时取并集的名单字段
+SET_FIELDS = ('participants', 'sharers')
+# 不允许通过修改操作改变的字段
+PROTECTED_FIELDS = ('id', 'rev', 'edit_time', 'editor')
+
+
+def rev_of(record):
+    return record.get('rev', 0)
+
+
+def _union(current, incoming):
+    """保持原有顺序的并集"""
+    result = list(current)
+    seen = set(result)
+    for ref in incoming:
+        if ref not in seen:
+            seen.add(ref)
+            result.append(ref)
+    return result
+
+
+def resolve_update(current, changes, base_rev, edit_time, editor):
+    """计算修改后的记录，返回 (新记录, 是否与其他修改合并)"""
+    record = {key: list(value) if isinstance(value, (list, tuple)) else value for key, value in current.items()}
+    conflict = rev_of(current) != base_rev
+    incoming_wins = (edit_time, editor) >= (current.get('edit_time', 0), current.get('editor', ''))
+
+    for field, value in changes.items():
+        if field in PROTECTED_FIELDS:
+            continue
+        if isinstance(value, list):
+            value = list(value)
+        if not conflict:
+            record[field] = value
+        elif field in SET_FIELDS:
+            record[field] = _union(current.get(field, []), value)
+        elif incoming_wins:
+            record[field] = value
+
+    if not conflict or incoming_wins:
+        record['edit_time'] = edit_time
+        record['editor'] = editor
+    record['rev'] = rev_of(current) + 1
+    return record, conflict
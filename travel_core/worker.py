@@ -0,0 +1,144 @@
+"""后台工作线程
+
+落盘、在线状态清理、操作日志压缩和快照都在这里完成，页面渲染只负责提交任务，
+不会等待磁盘 I/O 或整理工作。传入 metrics 时还会定期把运行指标写一行日志。
+
+任务队列有容量上限，同一任务（类型 + 房间）在队列中只保留一份。
+队列满时 submit 返回 False：落盘请求由调用方自己同步完成（数据不会丢失，
+也让产生修改过快的会话自然减速），其余整理任务直接放弃，下一轮定时检查会再做。
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from .metrics import log_line
+
+logger = logging.getLogger(__name__)
+
+FLUSH = 'flush'
+COMPACT = 'compact'
+SNAPSHOT = 'snapshot'
+EXPIRE_PRESENCE = 'expire_presence'
+
+# 内存中的操作日志超过该长度时压缩，只保留最近 OPLOG_KEEP 条
+OPLOG_LIMIT = 2000
+OPLOG_KEEP = 1000
+# 默认的快照间隔：距上次快照新增该数量的操作后生成新快照
+SNAPSHOT_EVERY = 500
+
+
+class BackgroundWorker:
+    """处理房间注册表整理任务的守护线程"""
+
+    def __init__(self, registry, queue_size=256, interval=1.0, snapshot_every=SNAPSHOT_EVERY,
+                 metrics=None, metrics_every=60.0):
+        self.registry = registry
+        self.interval = interval          # 定时检查的间隔（秒）
+        # 快照间隔（操作数），也是整体加载时最多需要重放的操作数（不计尚未处理的快照任务）
+        self.snapshot_every = snapshot_every
+        self.metrics = metrics
+        self.metrics_every = metrics_every  # 指标日志的间隔（秒）
+        self._next_log = time.monotonic() + metrics_every
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._queued = set()              # 队列中尚未处理的 (类型, room_id)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.rejected = 0                 # 因队列已满而被拒绝的任务数
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="travel-worker", daemon=True)
+            self._thread.start()
+            # 进程退出前把队列中的任务和未落盘的修改处理完
+            atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout=5.0):
+        """停止线程，并同步写入所有未落盘的修改"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.registry.flush_all()
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def submit(self, kind, room_id=None):
+        """提交任务（不阻塞）；队列已满时返回 False"""
+        key = (kind, room_id)
+        with self._lock:
+            if key in self._queued:
+                return True
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                self.rejected += 1
+                return False
+            self._queued.add(key)
+            return True
+
+    def request_flush(self, room):
+        """请求把房间的修改落盘；队列已满时在调用线程中同步写入"""
+        if self._thread is None or self._stopping.is_set() or not self.submit(FLUSH, room.room_id):
+            self.registry.flush(room)
+
+    def _run(self):
+        next_check = time.monotonic() + self.interval
+        while not self._stopping.is_set():
+            try:
+                key = self._queue.get(timeout=max(0.0, next_check - time.monotonic()))
+            except queue.Empty:
+                pass
+            else:
+                with self._lock:
+                    self._queued.discard(key)
+                self._handle(*key)
+            # 队列一直繁忙时也要按时检查
+            if time.monotonic() >= next_check:
+                self._housekeeping()
+                next_check = time.monotonic() + self.interval
+
+        # 退出前处理完已提交的任务
+        while True:
+            try:
+                key = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._handle(*key)
+
+    def _handle(self, kind, room_id):
+        try:
+            if kind == EXPIRE_PRESENCE:
+                self.registry.presence.expire()
+                return
+            if room_id not in self.registry:
+                return
+            room = self.registry.get(room_id)
+            if kind == FLUSH:
+                self.registry.flush(room)
+            elif kind == COMPACT:
+                self.registry.compact(room, OPLOG_KEEP)
+            elif kind == SNAPSHOT:
+                self.registry.take_snapshot(room)
+        except Exception:
+            # 落盘失败时修改已放回房间，下一轮定时检查会重试
+            logger.exception("后台任务失败: %s %s", kind, room_id)
+
+    def _housekeeping(self):
+        """定时检查：清理在线状态，补交落盘、压缩和快照任务"""
+        self._handle(EXPIRE_PRESENCE, None)
+        for room_id in self.registry.room_ids():
+            room = self.registry.get(room_id)
+            if room.pending:
+                self.submit(FLUSH, room_id)
+            if len(room.oplog) > OPLOG_LIMIT:
+                self.submit(COMPACT, room_id)
+            if room.replay_length >= self.snapshot_every:
+                self.submit(SNAPSHOT, room_id)
+        if self.metrics is not None and time.monotonic() >= self._next_log:
+            logger.info("运行指标: %s", log_line(self.metrics, self.registry))
+            self._next_log = time.monotonic() + self.metrics_every